@@ -0,0 +1,244 @@
+"""
+Offline benchmarks of invest on recorded yfinance payloads.
+
+    python benchmarks/bench.py record borsa_italiana.csv tokyo_stock_exchange.csv
+    python benchmarks/bench.py run --label 0.0.29
+    python benchmarks/bench.py compare 0.0.28 0.0.29
+
+`record` snapshots the payloads of the bundled symbol lists once (live
+download), `run` times the benchmarks on the snapshots and stores the results
+in benchmarks/results/<label>.json, `compare` prints two stored runs side by side.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+import warnings
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from invest import replay
+from invest import indicators
+from invest.shared import parallel_trend_scores
+from invest.loader import load_symbols
+from invest.scoring import get_indicators, compute_score, score_DIVTREND, dividend_trend_scores, DIVTREND_MEMO
+from invest.technical_analysis import detect_trend, detect_trends
+
+FIXTURES = os.path.join(HERE, 'fixtures')
+RESULTS = os.path.join(HERE, 'results')
+UNIVERSES = {'borsa_italiana': 'borsa_italiana.csv', 'tokyo_stock_exchange': 'tokyo_stock_exchange.csv'}
+# seconds allowed to `import invest` in a fresh interpreter
+IMPORT_BUDGET = 1.0
+# last dates of the price panel of the indicator benchmark, about two years
+INDICATOR_DATES = 500
+
+
+def timed(function, repeat=1):
+    """
+    Best wall time of `repeat` calls of function, and its last result.
+    """
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def universe_codes(fixtures, symbols_file):
+    recorded = set(replay.recorded_codes(fixtures))
+    return [code for code in load_symbols(symbols_file)['SYMBOL'] if code in recorded]
+
+
+def loaded_stocks(fixtures, codes):
+    # read the prices beforehand, so that only the computation is timed
+    stocks = replay.replay_stocks(fixtures, codes)
+    for stock in stocks:
+        stock.hist
+    return stocks
+
+
+def bench_import_time(fixtures, repeat):
+    seconds, _ = timed(lambda: subprocess.run([sys.executable, '-c', 'import invest'], check=True,
+                                              cwd=os.path.dirname(HERE)), repeat)
+    return {'seconds': seconds, 'n': 1, 'budget': IMPORT_BUDGET, 'within_budget': bool(seconds <= IMPORT_BUDGET)}
+
+
+def bench_single_stock(fixtures, repeat):
+    codes = replay.recorded_codes(fixtures)
+    if not codes:
+        return None
+    code = codes[0]
+    seconds, _ = timed(lambda: get_indicators(replay.replay_stocks(fixtures, [code])[0]), repeat)
+    return {'seconds': seconds, 'n': 1}
+
+
+def score_universe(stocks):
+    indicators, errors = [], 0
+    for stock in stocks:
+        try:
+            indicators.append(get_indicators(stock))
+        except Exception:
+            errors += 1
+    return compute_score(pd.concat(indicators, ignore_index=True)), errors
+
+
+def universe_benchmark(name):
+    def bench(fixtures, repeat):
+        codes = universe_codes(fixtures, UNIVERSES[name])
+        if not codes:
+            return None
+        DIVTREND_MEMO.clear()
+        seconds, (_, errors) = timed(lambda: score_universe(replay.replay_stocks(fixtures, codes)), repeat)
+        return {'seconds': seconds, 'n': len(codes), 'errors': errors}
+    return bench
+
+
+def bench_detect_trend(fixtures, repeat):
+    stocks = loaded_stocks(fixtures, universe_codes(fixtures, UNIVERSES['borsa_italiana']))
+    if not stocks:
+        return None
+    seconds, _ = timed(lambda: [detect_trend(stock, verbose=False) for stock in stocks], repeat)
+    return {'seconds': seconds, 'n': len(stocks)}
+
+
+def bench_detect_trends(fixtures, repeat):
+    stocks = loaded_stocks(fixtures, universe_codes(fixtures, UNIVERSES['borsa_italiana']))
+    if not stocks:
+        return None
+    seconds, _ = timed(lambda: detect_trends(stocks), repeat)
+    return {'seconds': seconds, 'n': len(stocks)}
+
+
+def bench_divtrend(fixtures, repeat):
+    stocks = loaded_stocks(fixtures, universe_codes(fixtures, UNIVERSES['borsa_italiana']))
+    if not stocks:
+        return None
+
+    def run():
+        DIVTREND_MEMO.clear()
+        return [score_DIVTREND(stock) for stock in stocks]
+    seconds, _ = timed(run, repeat)
+    return {'seconds': seconds, 'n': len(stocks)}
+
+
+def bench_divtrend_batch(fixtures, repeat):
+    stocks = loaded_stocks(fixtures, universe_codes(fixtures, UNIVERSES['borsa_italiana']))
+    if not stocks:
+        return None
+
+    def run():
+        DIVTREND_MEMO.clear()
+        return dividend_trend_scores(stocks)
+    seconds, _ = timed(run, repeat)
+    return {'seconds': seconds, 'n': len(stocks)}
+
+
+def bench_parallel_trends(fixtures, repeat):
+    stocks = loaded_stocks(fixtures, universe_codes(fixtures, UNIVERSES['borsa_italiana']))
+    if not stocks:
+        return None
+
+    def run():
+        DIVTREND_MEMO.clear()
+        return parallel_trend_scores(stocks)
+    seconds, _ = timed(run, repeat)
+    return {'seconds': seconds, 'n': len(stocks), 'workers': os.cpu_count()}
+
+
+def bench_indicators(fixtures, repeat):
+    stocks = loaded_stocks(fixtures, replay.recorded_codes(fixtures))
+    if not stocks:
+        return None
+    high, low, close = (pd.DataFrame({stock.code: stock.hist[column] for stock in stocks}).iloc[-INDICATOR_DATES:]
+                        for column in ('High', 'Low', 'Close'))
+
+    def run():
+        return [indicators.sma(close, 20), indicators.sma(close, 50), indicators.sma(close, 200),
+                indicators.ema(close, 12), indicators.ema(close, 26), indicators.rsi(close),
+                indicators.macd(close), indicators.bollinger(close), indicators.atr(high, low, close),
+                indicators.roc(close)]
+    seconds, _ = timed(run, repeat)
+    return {'seconds': seconds, 'n': close.shape[1], 'dates': close.shape[0]}
+
+
+BENCHMARKS = {
+    'import_time': bench_import_time,
+    'single_stock': bench_single_stock,
+    'universe_borsa_italiana': universe_benchmark('borsa_italiana'),
+    'universe_tokyo_stock_exchange': universe_benchmark('tokyo_stock_exchange'),
+    'detect_trend': bench_detect_trend,
+    'detect_trends': bench_detect_trends,
+    'divtrend': bench_divtrend,
+    'divtrend_batch': bench_divtrend_batch,
+    'parallel_trends': bench_parallel_trends,
+    'indicators': bench_indicators,
+}
+
+
+def record(args):
+    for symbols_file in args.symbols:
+        codes = load_symbols(symbols_file)['SYMBOL'].tolist()
+        recorded = replay.record(codes, args.fixtures)
+        print(f'{symbols_file} : {len(recorded)}/{len(codes)} tickers recorded')
+
+
+def run(args):
+    results = {}
+    for name in (args.only or BENCHMARKS):
+        result = BENCHMARKS[name](args.fixtures, args.repeat)
+        if result is None:
+            print(f'{name:32s} skipped (no fixtures)')
+            continue
+        results[name] = result
+        print(f'{name:32s} {result["seconds"]:10.3f}s  n={result["n"]}')
+    output = {'label': args.label, 'date': datetime.now().isoformat(timespec='seconds'),
+              'python': platform.python_version(), 'platform': platform.platform(), 'results': results}
+    os.makedirs(RESULTS, exist_ok=True)
+    with open(os.path.join(RESULTS, f'{args.label}.json'), 'w') as f:
+        json.dump(output, f, indent=2)
+
+
+def load_results(label):
+    with open(os.path.join(RESULTS, f'{label}.json')) as f:
+        return pd.DataFrame(json.load(f)['results']).T['seconds'].astype(float)
+
+
+def compare(args):
+    base, new = load_results(args.base), load_results(args.new)
+    table = pd.DataFrame({args.base: base, args.new: new})
+    table['ratio'] = table[args.new]/table[args.base]
+    print(table.to_string(float_format='{:.3f}'.format))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fixtures', default=FIXTURES, help='folder of the recorded payloads')
+    commands = parser.add_subparsers(dest='command', required=True)
+    record_parser = commands.add_parser('record', help='snapshot the payloads of symbol lists')
+    record_parser.add_argument('symbols', nargs='+', help='bundled symbol lists, e.g. borsa_italiana.csv')
+    run_parser = commands.add_parser('run', help='time the benchmarks')
+    run_parser.add_argument('--label', default=datetime.now().strftime('%Y%m%d-%H%M%S'))
+    run_parser.add_argument('--repeat', type=int, default=3, help='repetitions, the best one is kept')
+    run_parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS))
+    compare_parser = commands.add_parser('compare', help='compare two stored runs')
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('new')
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    warnings.filterwarnings('ignore')
+    {'record': record, 'run': run, 'compare': compare}[args.command](args)
+
+
+if __name__ == '__main__':
+    main()
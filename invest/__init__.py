@@ -1,4 +1,21 @@
+import importlib
+
 from invest.stock import Stock
-from invest import utils, loader, plot, fundamental_analysis, technical_analysis, scoring
 
-__all__ = ['Stock', 'utils', 'loader', 'plot', 'fundamental_analysis', 'technical_analysis', 'scoring']
\ No newline at end of file
+# Submodules are imported on first access (PEP 562), so that `import invest`
+# does not load plotly, scikit-learn or yfinance before they are needed
+SUBMODULES = ['utils', 'loader', 'plot', 'fundamental_analysis', 'technical_analysis', 'scoring', 'screener',
+              'cache', 'asof', 'backtest', 'fetch', 'governor', 'instrument', 'replay', 'providers', 'panel', 'incremental',
+              'pipeline', 'indicators', 'streaming', 'shared', 'universe']
+
+__all__ = ['Stock'] + SUBMODULES
+
+
+def __getattr__(name):
+    if name in SUBMODULES:
+        return importlib.import_module(f'invest.{name}')
+    raise AttributeError(f"module 'invest' has no attribute '{name}'")
+
+
+def __dir__():
+    return sorted(list(globals()) + SUBMODULES)
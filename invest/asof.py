@@ -0,0 +1,56 @@
+import pandas as pd
+
+
+class AsOfIndex:
+    """
+    Answer "last row strictly before a date" queries on a statement or price
+    frame by binary search on its index, which is sorted once.
+    Parameters:
+    - frame: DataFrame or Series indexed by date
+    """
+
+    def __init__(self, frame):
+        if not frame.index.is_monotonic_increasing:
+            frame = frame.sort_index(kind='mergesort')
+        self.frame = frame
+
+    def position(self, date):
+        """
+        Position of the last row before date, -1 if there is none.
+        """
+        return self.frame.index.searchsorted(pd.Timestamp(date), side='left') - 1
+
+    def positions(self, dates):
+        return self.frame.index.searchsorted(pd.DatetimeIndex(dates), side='left') - 1
+
+    def last_before(self, date):
+        position = self.position(date)
+        if position < 0:
+            raise IndexError(f'No rows before {date}')
+        return self.frame.iloc[position]
+
+    def until(self, date):
+        """
+        Rows up to date included, as a slice of the sorted frame.
+        """
+        return self.frame.iloc[:self.frame.index.searchsorted(pd.Timestamp(date), side='right')]
+
+    def last_before_many(self, dates):
+        """
+        Row valid on each date, indexed by the dates; rows are missing (NaN)
+        for the dates that precede the whole frame.
+        """
+        dates = pd.DatetimeIndex(dates)
+        positions = self.positions(dates)
+        valid = positions >= 0
+        result = self.frame.iloc[positions[valid]]
+        result.index = dates[valid]
+        return result.reindex(dates)
+
+
+def last_before(frame, date):
+    return AsOfIndex(frame).last_before(date)
+
+
+def last_before_many(frame, dates):
+    return AsOfIndex(frame).last_before_many(dates)
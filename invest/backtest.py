@@ -0,0 +1,112 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from invest.stock import Stock
+from invest.loader import preload_history
+from invest.scoring import get_indicators, compute_score
+from invest.screener import symbol_list
+
+logger = logging.getLogger()
+
+
+class Backtest:
+    """
+    Point in time backtest of the OVERALL_SCORE ranking.
+    The raw history and statements of every ticker are loaded once; at each
+    rebalance date the indicators and the scores are computed as of that
+    date (by moving Stock.quot_date, which keeps the raw data and the metrics
+    that do not depend on the date) and the top_n stocks are held, equally
+    weighted, until the next rebalance.
+    The statements are dated by the end of their fiscal period: they are
+    taken as published reporting_lag later, so that a rebalance only sees
+    the statements available at that date. The info fields are not point in
+    time, their current values are used at every date: fullTimeEmployees
+    (Net income per employee), sharesOutstanding when the yearly share count
+    is missing, sector and longBusinessSummary.
+    Parameters:
+    - symbols: codes of the universe, see screener.symbol_list
+    - start, end: first and last rebalance dates
+    - freq: pandas frequency of the rebalance calendar (business month end by default)
+    - top_n: number of stocks held
+    - indicators: function returning the one-row indicator frame of a Stock
+    - chunk_size: symbols per bulk price download
+    - provider: DataProvider of the datasets (the default provider if None)
+    - reporting_lag: delay between the end of a fiscal period and the
+      publication of its statements, as a pandas Timedelta or string (None for no delay)
+    """
+
+    def __init__(self, symbols, start, end, freq='BM', top_n=10,
+                 indicators=get_indicators, chunk_size=100, provider=None, reporting_lag='90D'):
+        self.dates = pd.date_range(start, end, freq=freq)
+        self.top_n = top_n
+        self.indicators = indicators
+        self.stocks = [Stock(code, quot_date=self.dates[0], provider=provider, reporting_lag=reporting_lag)
+                       for code in symbol_list(symbols)]
+        preload_history(self.stocks, chunk_size)
+        self.errors = []
+        self._closes = None
+
+    @property
+    def closes(self):
+        """
+        Close prices of the universe, dates x tickers.
+        """
+        if self._closes is None:
+            closes = {}
+            for stock in self.stocks:
+                try:
+                    closes[stock.code] = stock.full_hist['Close']
+                except Exception as e:
+                    logger.warning(f'{stock.code} : {e}')
+            self._closes = pd.DataFrame(closes).sort_index()
+        return self._closes
+
+    def prices_at(self, dates):
+        """
+        Last close on or before each date, dates x tickers.
+        """
+        dates = pd.DatetimeIndex(dates)
+        closes = self.closes
+        return closes.reindex(closes.index.union(dates)).ffill().loc[dates]
+
+    def scores_at(self, date):
+        """
+        Scored indicator table of the universe as of date.
+        """
+        rows = []
+        for stock in self.stocks:
+            stock.quot_date = date
+            try:
+                rows.append(self.indicators(stock))
+            except Exception as e:
+                logger.warning(f'{stock.code} {date:%Y-%m-%d} : {e}')
+                self.errors.append({'Date': date, 'code': stock.code, 'error': repr(e)})
+        if not rows:
+            return pd.DataFrame()
+        return compute_score(pd.concat(rows, ignore_index=True))
+
+    def run(self):
+        """
+        Returns a DataFrame indexed by rebalance date with the holdings, the
+        return of the portfolio over the following period, the return of the
+        equally weighted universe and the cumulative return of the portfolio.
+        """
+        prices = self.prices_at(self.dates)
+        period_returns = (prices.shift(-1) / prices - 1).iloc[:-1]
+        report = []
+        for date in period_returns.index:
+            scores = self.scores_at(date)
+            holdings = list(scores['code'].head(self.top_n)) if len(scores) else []
+            returns = period_returns.loc[date]
+            report.append({
+                'Date': date,
+                'holdings': holdings,
+                'return': returns.reindex(holdings).mean() if holdings else np.nan,
+                'universe_return': returns.mean(),
+            })
+        report = pd.DataFrame(report, columns=['Date', 'holdings', 'return', 'universe_return'])
+        report = report.set_index('Date')
+        report['cumulative_return'] = (1 + report['return'].fillna(0)).cumprod() - 1
+        return report
@@ -0,0 +1,199 @@
+import os
+import pickle
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+DAY = timedelta(days=1)
+QUARTER = timedelta(days=91)
+
+DEFAULT_TTL = {
+    'history': DAY,
+    'info': DAY,
+    'shares': QUARTER,
+    'earnings': QUARTER,
+    'financials': QUARTER,
+    'quarterly_financials': QUARTER,
+    'balance_sheet': QUARTER,
+    'quarterly_balance_sheet': QUARTER,
+    'cashflow': QUARTER,
+    'quarterly_cashflow': QUARTER,
+}
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'invest', 'cache.sqlite')
+
+
+class CacheBackend:
+    """
+    Base class of the stores used by Stock to keep the raw yfinance datasets.
+    Entries are keyed by (code, dataset, fetch date), where Stock passes as
+    code the cache_key of its provider (the bare code for yfinance); an entry
+    is served only while it is younger than the TTL of its dataset.
+    Subclasses implement load, save and clear.
+    """
+
+    def __init__(self, ttl: dict = None):
+        self.ttl = {**DEFAULT_TTL, **(ttl or {})}
+
+    def load(self, code: str, dataset: str):
+        """
+        Return (fetch_date, data) of the most recent entry, or None.
+        """
+        raise NotImplementedError
+
+    def save(self, code: str, dataset: str, data, fetch_date: datetime):
+        raise NotImplementedError
+
+    def clear(self, code: str = None, dataset: str = None):
+        raise NotImplementedError
+
+    def is_fresh(self, dataset: str, fetch_date: datetime, now: datetime = None):
+        ttl = self.ttl.get(dataset, DAY)
+        return ((now or datetime.now()) - fetch_date) < ttl
+
+    def get(self, code: str, dataset: str, now: datetime = None):
+        entry = self.load(code, dataset)
+        if entry is None:
+            return None
+        fetch_date, data = entry
+        if not self.is_fresh(dataset, fetch_date, now):
+            return None
+        return data
+
+    def put(self, code: str, dataset: str, data, fetch_date: datetime = None):
+        self.save(code, dataset, data, fetch_date or datetime.now())
+
+
+class MemoryCache(CacheBackend):
+    """
+    In-process cache, useful to share downloads between Stock objects of a
+    single run without touching the disk.
+    """
+
+    def __init__(self, ttl: dict = None):
+        super().__init__(ttl)
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # sent to the workers of a process pool empty: each one fills its own
+        return {'ttl': self.ttl}
+
+    def __setstate__(self, state):
+        self.__init__(state['ttl'])
+
+    def load(self, code, dataset):
+        with self._lock:
+            return self._entries.get((code, dataset))
+
+    def save(self, code, dataset, data, fetch_date):
+        with self._lock:
+            self._entries[(code, dataset)] = (fetch_date, data)
+
+    def clear(self, code=None, dataset=None):
+        with self._lock:
+            for key in list(self._entries):
+                if (code in (None, key[0])) and (dataset in (None, key[1])):
+                    del self._entries[key]
+
+
+class SQLiteCache(CacheBackend):
+    """
+    Local on-disk cache, one pickled payload per (code, dataset, fetch date).
+    Parameters:
+    - path: fullpath of the sqlite file
+    - ttl: per dataset time to live, overriding DEFAULT_TTL
+    - keep: number of snapshots retained for every (code, dataset)
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl: dict = None, keep: int = 1):
+        super().__init__(ttl)
+        self.path = path
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+
+    def __getstate__(self):
+        # sent to the workers of a process pool as its path: they open their own connection
+        state = self.__dict__.copy()
+        state.update(_lock=None, _connection=None, _pid=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if (self._connection is None) or (self._pid != os.getpid()):
+            folder = os.path.dirname(self.path)
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "code TEXT, dataset TEXT, fetch_date TEXT, payload BLOB, "
+                "PRIMARY KEY (code, dataset, fetch_date))"
+            )
+            self._pid = os.getpid()
+        return self._connection
+
+    def load(self, code, dataset):
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT fetch_date, payload FROM cache WHERE code = ? AND dataset = ? "
+                "ORDER BY fetch_date DESC LIMIT 1",
+                (code, dataset),
+            ).fetchone()
+        if row is None:
+            return None
+        return datetime.fromisoformat(row[0]), pickle.loads(row[1])
+
+    def save(self, code, dataset, data, fetch_date):
+        payload = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                    (code, dataset, fetch_date.isoformat(), sqlite3.Binary(payload)),
+                )
+                connection.execute(
+                    "DELETE FROM cache WHERE code = ? AND dataset = ? AND fetch_date NOT IN "
+                    "(SELECT fetch_date FROM cache WHERE code = ? AND dataset = ? "
+                    "ORDER BY fetch_date DESC LIMIT ?)",
+                    (code, dataset, code, dataset, self.keep),
+                )
+
+    def clear(self, code=None, dataset=None):
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute(
+                    "DELETE FROM cache WHERE (? IS NULL OR code = ?) AND (? IS NULL OR dataset = ?)",
+                    (code, code, dataset, dataset),
+                )
+
+
+_default_cache = None
+_default_cache_enabled = True
+
+
+def default_cache():
+    """
+    Return the cache shared by the Stock objects that do not receive one.
+    The sqlite file lives in INVEST_CACHE_PATH or in ~/.cache/invest.
+    """
+    global _default_cache
+    if (_default_cache is None) and _default_cache_enabled:
+        _default_cache = SQLiteCache(os.environ.get('INVEST_CACHE_PATH', DEFAULT_CACHE_PATH))
+    return _default_cache
+
+
+def set_default_cache(cache: CacheBackend = None):
+    """
+    Replace the default cache; None disables caching for new Stock objects.
+    """
+    global _default_cache, _default_cache_enabled
+    _default_cache = cache
+    _default_cache_enabled = cache is not None
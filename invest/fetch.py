@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from invest.stock import Stock, DATASETS
+
+logger = logging.getLogger()
+
+MAX_CONCURRENCY = 16
+
+# one semaphore and one table of in-flight requests per event loop
+_semaphores = weakref.WeakKeyDictionary()
+_in_flight = weakref.WeakKeyDictionary()
+_executor = None
+
+
+def set_max_concurrency(max_concurrency: int):
+    """
+    Limit of the dataset requests running at once, shared by all the Stock
+    objects of an event loop. Applies to the loops started afterwards.
+    """
+    global MAX_CONCURRENCY, _executor
+    MAX_CONCURRENCY = max_concurrency
+    _semaphores.clear()
+    _executor = None
+
+
+def _semaphore():
+    loop = asyncio.get_running_loop()
+    if loop not in _semaphores:
+        _semaphores[loop] = asyncio.Semaphore(MAX_CONCURRENCY)
+    return _semaphores[loop]
+
+
+def _thread_pool():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENCY, thread_name_prefix='invest-fetch')
+    return _executor
+
+
+async def _fetch(stock, dataset):
+    async with _semaphore():
+        return await asyncio.get_running_loop().run_in_executor(_thread_pool(), stock._fetch, dataset)
+
+
+async def fetch_dataset(stock, dataset: str):
+    """
+    Fetch a raw dataset of a Stock in a worker thread, under the global
+    concurrency limit. Concurrent requests for the same dataset of the same
+    ticker and provider (the same Stock.cache_key), read up to the same date
+    (see Stock.read_until), are merged into a single one.
+    """
+    in_flight = _in_flight.setdefault(asyncio.get_running_loop(), {})
+    key = (stock.cache_key, dataset, stock.read_until(dataset))
+    if key not in in_flight:
+        task = asyncio.ensure_future(_fetch(stock, dataset))
+        task.add_done_callback(lambda _: in_flight.pop(key, None))
+        in_flight[key] = task
+    return await asyncio.shield(in_flight[key])
+
+
+async def prefetch(stock, datasets=None):
+    """
+    Fetch concurrently the raw datasets of a Stock that are not loaded yet and
+    seed them, so that its lazy properties fill from them without blocking.
+    A failed dataset is left to the lazy property, which will fetch it again.
+    Parameters:
+    - stock: Stock object
+    - datasets: names of the datasets to fetch (all of them by default)
+    """
+    datasets = [dataset for dataset in (datasets or DATASETS) if dataset not in stock._datasets]
+    results = await asyncio.gather(*(fetch_dataset(stock, dataset) for dataset in datasets),
+                                   return_exceptions=True)
+    for dataset, data in zip(datasets, results):
+        if isinstance(data, Exception):
+            logger.warning(f'{stock.code} {dataset} : {data}')
+        elif data is not None:
+            stock.seed(dataset, data)
+    return stock
+
+
+async def fetch_many(codes, datasets=None, quot_date=None, **kwargs):
+    """
+    Create a Stock for every code and prefetch its datasets, all concurrently.
+    Parameters:
+    - codes: list of ticker codes
+    - datasets: names of the datasets to fetch (all of them by default)
+    - quot_date, kwargs: passed to Stock
+    Returns the list of Stock objects.
+    """
+    stocks = [Stock(code, quot_date=quot_date, **kwargs) for code in codes]
+    await asyncio.gather(*(prefetch(stock, datasets) for stock in stocks))
+    return stocks
+
+
+def prefetch_many(codes, datasets=None, quot_date=None, **kwargs):
+    """
+    Synchronous version of fetch_many.
+    """
+    return asyncio.run(fetch_many(codes, datasets, quot_date, **kwargs))
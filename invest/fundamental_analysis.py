@@ -1,32 +1,98 @@
+import logging
+import numpy as np
 import pandas as pd
 
+logger = logging.getLogger()
+
+INDICATOR_COLUMNS = [
+    "Reference Price",
+    "Graham Price",
+    "price_over_graham",
+    "Net current asset per share over price",
+    "PE",
+    "ROE",
+    "PB",
+    "Tangible PB ratio",
+    "Return on Assets",
+    "Dividend yeld",
+    "Payout Ratio",
+    "Quick Ratio",
+    "Price to cash flow",
+    "Price to free cash flow",
+    'Working capital over market cap',
+    'Net cash over market cap',
+    'EPS over price',
+    'ROCE',
+    'Net income per employee',
+    'Revenue per employee',
+]
+
+
+def as_float(value):
+    return np.nan if value is None else float(value)
+
+
+def indicator_values(stock):
+    """
+    Values of INDICATOR_COLUMNS for one stock, reading every quantity once.
+    """
+    price = stock.reference_price
+    graham_price = stock.graham_price
+    return [
+        price,
+        graham_price,
+        price/graham_price,
+        stock.net_current_assets_per_share/price,
+        stock.PE,
+        stock.ROE,
+        stock.PB,
+        stock.price_to_tangible_book,
+        stock.ROA,
+        stock.dividend_yeld,
+        stock.payout_ratio,
+        stock.quick_ratio,
+        stock.price_to_cash_flow,
+        stock.price_to_free_cash_flow,
+        stock.working_capital_per_share/price,
+        stock.net_cash_per_share/price,
+        stock.EPS/price,
+        stock.ROCE,
+        stock.net_income_per_employee,
+        stock.revenue_per_employee,
+    ]
+
+
+def fundamental_indicators_table(stocks, errors='raise'):
+    """
+    Fundamental indicators of many stocks as a single DataFrame, one row per
+    stock, filled column-wise into typed arrays.
+    Parameters:
+    - stocks: list of Stock objects
+    - errors: 'raise' propagates the exception of a failing stock, 'coerce'
+      logs it and leaves the indicators of that stock to NaN
+    """
+    n_stocks = len(stocks)
+    codes = np.empty(n_stocks, dtype=object)
+    names = np.empty(n_stocks, dtype=object)
+    dates = np.empty(n_stocks, dtype='datetime64[ns]')
+    values = np.full((n_stocks, len(INDICATOR_COLUMNS)), np.nan)
+    for i, stock in enumerate(stocks):
+        codes[i] = stock.code
+        dates[i] = pd.Timestamp(stock.quot_date).to_datetime64()
+        try:
+            names[i] = stock.get_info('shortName')
+            values[i] = [as_float(value) for value in indicator_values(stock)]
+        except Exception as e:
+            if errors == 'raise':
+                raise
+            logger.warning(f'{stock.code} : {e}')
+
+    table = pd.DataFrame(values, columns=INDICATOR_COLUMNS)
+    table.insert(0, "Date", dates)
+    table.insert(0, "name", names)
+    table.insert(0, "code", codes)
+    return table
+
+
 def main_fundamental_indicators(stock):
-    score = pd.DataFrame()
-    score["code"] = [stock.code]
-    score["name"] = [stock.get_info('shortName')]
-    score["Date"] = [stock.quot_date]
-    
-    score["Reference Price"] = [stock.reference_price]
-    score["Graham Price"] = [stock.graham_price]
-
-    score["price_over_graham"] = [stock.reference_price/stock.graham_price]
-    score["Net current asset per share over price"] = [stock.net_current_assets_per_share/stock.reference_price]
-
-    score["PE"] = [stock.PE]
-    score["ROE"] = [stock.ROE]
-    score["PB"] = [stock.PB]
-    score["Tangible PB ratio"] = [stock.price_to_tangible_book]
-    score["Return on Assets"] = [stock.ROA]
-    score["Dividend yeld"] = [stock.dividend_yeld]
-    score["Payout Ratio"] = [stock.payout_ratio]
-    score["Quick Ratio"] = [stock.quick_ratio]
-    score["Price to cash flow"] = [stock.price_to_cash_flow]
-    score["Price to free cash flow"] = [stock.price_to_free_cash_flow]
-    score['Working capital over market cap'] = [stock.working_capital_per_share/stock.reference_price]
-    score['Net cash over market cap'] = [stock.net_cash_per_share/stock.reference_price]
-    score['EPS over price'] = [stock.EPS/stock.reference_price]
-    score['ROCE'] = [stock.ROCE]
-    score['Net income per employee'] = [stock.net_income_per_employee]
-    score['Revenue per employee'] = [stock.revenue_per_employee]
-    #score['full_object'] = [stock]
-    return score
+    return fundamental_indicators_table([stock])
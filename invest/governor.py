@@ -0,0 +1,246 @@
+import json
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+
+import pandas as pd
+
+logger = logging.getLogger()
+
+# Errors meaning that the data is not there, not that the request failed
+# (except JSONDecodeError, a ValueError, see is_throttled)
+NOT_RETRYABLE = (KeyError, IndexError, AttributeError, TypeError, ValueError, NotImplementedError)
+
+
+class FetchError(Exception):
+    """
+    A yfinance request failed after all the retries.
+    """
+
+
+def is_throttled(error):
+    # a reply that is not JSON is how Yahoo answers most throttled requests (an HTML page)
+    if isinstance(error, json.JSONDecodeError):
+        return True
+    message = str(error)
+    return ('RateLimit' in type(error).__name__) or ('Too Many Requests' in message) or ('429' in message)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` requests per second on average, with
+    bursts of up to `capacity` requests.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated)*self.rate)
+        self._updated = now
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens)/self.rate
+            time.sleep(wait)
+
+    def set_rate(self, rate: float):
+        """
+        Change the rate, the tokens gained so far being kept.
+        """
+        with self._lock:
+            self._refill()
+            self.rate = rate
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive throttled requests: while open every
+    caller waits, so that the whole pool pauses for `cooldown` seconds instead
+    of feeding a retry storm.
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._open_until = 0.
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return time.monotonic() < self._open_until
+
+    def wait(self):
+        delay = self._open_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+
+    def record_throttle(self):
+        with self._lock:
+            self._failures += 1
+            if (self._failures >= self.threshold) and not self.is_open:
+                logger.warning(f'Throttled by the data provider: pausing requests for {self.cooldown}s')
+                self._open_until = time.monotonic() + self.cooldown
+                self._failures = 0
+
+
+class RequestGovernor:
+    """
+    Single gate for the requests to yfinance: rate limiting, exponential
+    backoff with jitter, circuit breaking and per dataset counters.
+    The rate adapts to the provider: it is halved by every throttled request
+    (down to min_rate) and raised by `increase` requests per second by every
+    success (up to max_rate, the cap of the requests per second).
+    Parameters:
+    - rate, burst: initial rate and burst of the token bucket of the requests
+      (rate None for no limit and no adaptation)
+    - min_rate, max_rate: bounds of the adaptive rate (max_rate None for 4 times
+      the initial rate)
+    - increase: requests per second added to the rate by every success
+    - max_retries: retries of a failed request before raising FetchError
+    - backoff, max_backoff: base and cap in seconds of the delay between retries
+    - breaker_threshold, breaker_cooldown: see CircuitBreaker
+    """
+
+    def __init__(self, rate: float = 5., burst: int = 10, max_retries: int = 4,
+                 backoff: float = 1., max_backoff: float = 60.,
+                 breaker_threshold: int = 3, breaker_cooldown: float = 60.,
+                 min_rate: float = 0.5, max_rate: float = None, increase: float = 0.05):
+        self.settings = dict(rate=rate, burst=burst, max_retries=max_retries, backoff=backoff,
+                             max_backoff=max_backoff, breaker_threshold=breaker_threshold,
+                             breaker_cooldown=breaker_cooldown, min_rate=min_rate, max_rate=max_rate,
+                             increase=increase)
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.min_rate = min_rate
+        self.max_rate = max_rate or (4*rate if rate else None)
+        self.increase = increase
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._counters = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # pickled as its settings: the copy starts with a full bucket and no counts
+        return self.settings
+
+    def __setstate__(self, settings):
+        self.__init__(**settings)
+
+    def share(self, parts: int):
+        """
+        Governor with the settings of this one and 1/parts of its rates and
+        burst, for each of `parts` processes sharing its request budget.
+        """
+        settings = dict(self.settings)
+        if settings['rate']:
+            for name in ['rate', 'min_rate', 'max_rate']:
+                settings[name] = settings[name]/parts if settings[name] else settings[name]
+            settings['burst'] = max(1, settings['burst']//parts)
+        return RequestGovernor(**settings)
+
+    def _count(self, dataset, outcome):
+        with self._lock:
+            self._counters[dataset][outcome] += 1
+
+    @property
+    def rate(self):
+        """
+        Current requests per second (None when not limited).
+        """
+        return None if self.bucket is None else self.bucket.rate
+
+    def _adapt(self, throttled: bool):
+        if self.bucket is None:
+            return
+        rate = self.bucket.rate
+        if throttled:
+            new_rate = max(self.min_rate, rate/2)
+            if new_rate < rate:
+                logger.info(f'Throttled by the data provider: lowering the rate to {new_rate:.2f} requests/s')
+        else:
+            new_rate = min(self.max_rate, rate + self.increase)
+        if new_rate != rate:
+            self.bucket.set_rate(new_rate)
+
+    def call(self, dataset: str, function, *args, **kwargs):
+        """
+        Run function(*args, **kwargs), the request of a dataset, under the governor.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.breaker.wait()
+            if self.bucket is not None:
+                self.bucket.acquire()
+            try:
+                result = function(*args, **kwargs)
+            except Exception as e:
+                throttled = is_throttled(e)
+                if isinstance(e, NOT_RETRYABLE) and not throttled:
+                    self._count(dataset, 'failure')
+                    raise
+                if throttled:
+                    self.breaker.record_throttle()
+                    self._adapt(throttled=True)
+                if attempt == self.max_retries:
+                    self._count(dataset, 'failure')
+                    raise FetchError(f'{dataset} : {e}') from e
+                self._count(dataset, 'retry')
+                delay = min(self.max_backoff, self.backoff*2**attempt)*random.uniform(0.5, 1.5)
+                logger.info(f'{dataset} : {e}, retrying in {delay:.1f}s')
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            self._adapt(throttled=False)
+            self._count(dataset, 'success')
+            return result
+
+    def stats(self):
+        """
+        DataFrame of the success, retry and failure counts of every dataset.
+        """
+        with self._lock:
+            counters = {dataset: dict(counts) for dataset, counts in self._counters.items()}
+        stats = pd.DataFrame.from_dict(counters, orient='index', columns=['success', 'retry', 'failure'])
+        return stats.fillna(0).astype(int).rename_axis('dataset')
+
+    def reset_stats(self):
+        with self._lock:
+            self._counters.clear()
+
+
+_default_governor = None
+
+
+def default_governor():
+    """
+    Return the governor shared by every yfinance request of the process.
+    Its rate limit and circuit breaker are per process: worker processes
+    get their own governor, see RequestGovernor.share.
+    """
+    global _default_governor
+    if _default_governor is None:
+        _default_governor = RequestGovernor()
+    return _default_governor
+
+
+def set_default_governor(governor: RequestGovernor):
+    global _default_governor
+    _default_governor = governor
@@ -0,0 +1,171 @@
+import numpy as np
+import pandas as pd
+
+from invest.scoring import SCORING_RULES, Quantile
+from invest import instrument
+
+
+class SortedValues:
+    """
+    Mergeable quantile summary of a multiset of floats, supporting insertions
+    and deletions: the values kept sorted, so that every quantile is exact
+    and equal to np.quantile of the whole column. Inserting or deleting k
+    values costs one O(n + k) merge.
+    """
+
+    def __init__(self, values=()):
+        self.values = np.sort(np.asarray(values, dtype=np.float64))
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, values):
+        values = np.sort(np.asarray(values, dtype=np.float64))
+        self.values = np.insert(self.values, np.searchsorted(self.values, values), values)
+
+    def remove(self, values):
+        values = np.sort(np.asarray(values, dtype=np.float64))
+        if not len(values):
+            return
+        # one occurrence per value: repeated values take consecutive positions
+        positions = (np.searchsorted(self.values, values) + np.arange(len(values))
+                     - np.searchsorted(values, values))
+        if (positions >= len(self.values)).any() or (self.values[np.minimum(positions, len(self.values) - 1)] != values).any():
+            raise KeyError('removing values that were never added')
+        self.values = np.delete(self.values, positions)
+
+    def merge(self, other):
+        """
+        Summary of the union of the two multisets.
+        """
+        return SortedValues(np.concatenate([self.values, other.values]))
+
+    def quantile(self, q):
+        return np.quantile(self.values, q) if len(self.values) else np.nan
+
+
+class IncrementalScorer:
+    """
+    compute_score kept up to date while rows are added, changed or removed.
+    The rules scaled by a Quantile of their column keep a SortedValues of it.
+    After an update only the changed rows are scored again, plus, for a rule
+    whose quantile moved, the rows whose score of that rule changes; the
+    scores live in numpy arrays and the table is rebuilt only by scores().
+    The result is the same as compute_score on the whole table.
+    Parameters:
+    - indicators: initial indicator table, with a `code` column
+    - rules: dict score column -> Rule, as in compute_score
+    """
+
+    def __init__(self, indicators=None, rules=SCORING_RULES):
+        self.rules = rules
+        self.names = list(rules)
+        self.sketches = {name: SortedValues() for name, rule in rules.items() if isinstance(rule.scale, Quantile)}
+        self.scales = {name: np.nan for name in self.sketches}
+        self.codes = []
+        self.positions = {}
+        # score columns of the table not computed by the rules (e.g. score_DIVTREND)
+        self.extra_columns = None
+        self.inputs = np.empty((0, len(self.names)))
+        self.rule_scores = np.empty((0, len(self.names)))
+        self.extra_scores = np.empty((0, 0))
+        self.overall = np.empty(0)
+        self.table = pd.DataFrame()
+        self._pending = []
+        if indicators is not None:
+            self.upsert(indicators)
+
+    def _support(self, name, raw):
+        rule = self.rules[name]
+        return rule.scale.support(rule.prepare(raw))
+
+    def upsert(self, indicators):
+        """
+        Add new rows or replace the rows of the same code.
+        Returns the codes whose OVERALL_SCORE was computed again.
+        """
+        with instrument.span('stage', 'incremental_score'):
+            indicators = indicators.drop_duplicates('code', keep='last')
+            if self.extra_columns is None:
+                self.extra_columns = [column for column in indicators.columns
+                                      if ('score' in column) and (column not in self.rules) and (column != 'OVERALL_SCORE')]
+                self.extra_scores = np.empty((0, len(self.extra_columns)))
+                # compute_score sums the score columns in table order: the ones of the input first
+                columns = [column for column in indicators.columns if column in self.extra_columns or column in self.rules]
+                columns += [name for name in self.names if name not in columns]
+                combined = self.names + self.extra_columns
+                self.score_order = [combined.index(column) for column in columns]
+            codes = indicators['code'].tolist()
+            new = [code for code in codes if code not in self.positions]
+            replaced = np.array([self.positions[code] for code in codes if code in self.positions], dtype=int)
+            for code in new:
+                self.positions[code] = len(self.codes)
+                self.codes.append(code)
+            self.inputs = np.vstack([self.inputs, np.full((len(new), len(self.names)), np.nan)])
+            self.rule_scores = np.vstack([self.rule_scores, np.full((len(new), len(self.names)), np.nan)])
+            self.extra_scores = np.vstack([self.extra_scores, np.full((len(new), len(self.extra_columns)), np.nan)])
+            self.overall = np.concatenate([self.overall, np.full(len(new), np.nan)])
+
+            rows = np.array([self.positions[code] for code in codes], dtype=int)
+            raw = indicators[[self.rules[name].column for name in self.names]].to_numpy(dtype=np.float64, na_value=np.nan)
+            for j, name in enumerate(self.names):
+                if name in self.sketches:
+                    self.sketches[name].remove(self._support(name, self.inputs[replaced, j]))
+                    self.sketches[name].add(self._support(name, raw[:, j]))
+            self.inputs[rows] = raw
+            if self.extra_columns:
+                self.extra_scores[rows] = indicators[self.extra_columns].to_numpy(dtype=np.float64, na_value=np.nan)
+            self._pending.append(indicators)
+            return self._rescore(rows)
+
+    def remove(self, codes):
+        """
+        Drop the rows of some codes. Returns the codes scored again.
+        """
+        rows = np.array([self.positions[code] for code in codes if code in self.positions], dtype=int)
+        for j, name in enumerate(self.names):
+            if name in self.sketches:
+                self.sketches[name].remove(self._support(name, self.inputs[rows, j]))
+        keep = np.ones(len(self.codes), dtype=bool)
+        keep[rows] = False
+        self.codes = [code for code, kept in zip(self.codes, keep) if kept]
+        self.positions = {code: i for i, code in enumerate(self.codes)}
+        self.inputs, self.rule_scores = self.inputs[keep], self.rule_scores[keep]
+        self.extra_scores, self.overall = self.extra_scores[keep], self.overall[keep]
+        return self._rescore(np.array([], dtype=int))
+
+    def _rescore(self, changed):
+        moved = np.zeros(len(self.codes), dtype=bool)
+        moved[changed] = True
+        for j, (name, rule) in enumerate(self.rules.items()):
+            scale, rescale = None, False
+            if name in self.sketches:
+                scale = self.sketches[name].quantile(rule.scale.q)
+                rescale = not np.array_equal(scale, self.scales[name], equal_nan=True)
+                self.scales[name] = scale
+            rows = np.arange(len(self.codes)) if rescale else changed
+            scores = rule.evaluate(self.inputs[rows, j], scale)
+            previous = self.rule_scores[rows, j]
+            updated = ~((scores == previous) | (np.isnan(scores) & np.isnan(previous)))
+            self.rule_scores[rows[updated], j] = scores[updated]
+            moved[rows[updated]] = True
+        scores = np.hstack([self.rule_scores[moved], self.extra_scores[moved]])[:, self.score_order]
+        self.overall[moved] = np.nansum(scores, axis=1)/len(self.score_order)
+        return [self.codes[row] for row in np.flatnonzero(moved)]
+
+    def scores(self):
+        """
+        The scored table, sorted by OVERALL_SCORE as returned by compute_score.
+        """
+        if self._pending:
+            updates = pd.concat(self._pending, ignore_index=True).drop_duplicates('code', keep='last')
+            table = self.table.loc[~self.table['code'].isin(updates['code'])] if len(self.table) else self.table
+            self.table = pd.concat([table, updates], ignore_index=True)
+            self._pending = []
+        self.table = self.table.loc[self.table['code'].isin(self.positions)].reset_index(drop=True)
+        table = self.table.copy()
+        rows = np.array([self.positions[code] for code in table['code']], dtype=int)
+        for j, name in enumerate(self.names):
+            table[name] = self.rule_scores[rows, j]
+        table['OVERALL_SCORE'] = self.overall[rows]
+        return table.sort_values(by='OVERALL_SCORE', ascending=False)
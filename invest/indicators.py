@@ -0,0 +1,255 @@
+import inspect
+
+import numpy as np
+import pandas as pd
+
+# Names of the outputs of the indicators returning more than one array
+OUTPUTS = {
+    'macd': ['macd', 'signal', 'histogram'],
+    'bollinger': ['middle', 'upper', 'lower'],
+}
+
+
+def as_panel(values):
+    """
+    values (a dates x tickers DataFrame or array, or the Series or 1-D array
+    of a single ticker) as a 2-D float64 array, and the function giving a
+    result the same type as values.
+    """
+    if isinstance(values, pd.DataFrame):
+        return (values.to_numpy(dtype=np.float64),
+                lambda result: pd.DataFrame(result, index=values.index, columns=values.columns))
+    if isinstance(values, pd.Series):
+        return (values.to_numpy(dtype=np.float64)[:, None],
+                lambda result: pd.Series(result[:, 0], index=values.index, name=values.name))
+    array = np.asarray(values, dtype=np.float64)
+    if array.ndim == 1:
+        return array[:, None], lambda result: result[:, 0]
+    return array, lambda result: result
+
+
+def missing_values(x):
+    """
+    Mask of the missing values of x, None when there is none.
+    """
+    missing = np.isnan(x)
+    return missing if missing.any() else None
+
+
+def first_valid(x, missing=None):
+    """
+    First non-missing value of every column (0 for an empty column).
+    """
+    if missing is None:
+        return x[0].copy() if len(x) else np.zeros(x.shape[1])
+    valid = ~missing
+    first = x[valid.argmax(axis=0), np.arange(x.shape[1])]
+    return np.where(valid.any(axis=0), first, 0.)
+
+
+def accumulate(values):
+    """
+    Cumulative sums of the columns of values, in place. The loop runs over
+    the dates and adds the rows of all the tickers at once, which is faster
+    than cumsum along the first axis of a wide array.
+    """
+    for i in range(1, len(values)):
+        np.add(values[i - 1], values[i], out=values[i])
+    return values
+
+
+def window_sums(values, window, missing=None):
+    """
+    Sums of the last `window` rows of values, as a difference of cumulative
+    sums (values is overwritten), missing unless all the window is present.
+    """
+    if missing is not None:
+        values[missing] = 0.
+    sums = accumulate(values)
+    result = np.full(values.shape, np.nan)
+    if window > len(values):
+        return result
+    result[window - 1:] = sums[window - 1:]
+    result[window:] -= sums[:-window]
+    if missing is not None:
+        gaps = accumulate(missing.astype(np.int32))
+        gaps[window:] -= gaps[:-window].copy()
+        result[window - 1:][gaps[window - 1:] > 0] = np.nan
+    return result
+
+
+def rolling_moments(x, window):
+    """
+    Mean and population standard deviation of the last `window` values,
+    missing unless they are all present. They are computed from the window
+    sums of the values and of their squares, taken minus the first value of
+    their column to keep the sums small.
+    """
+    missing = missing_values(x)
+    reference = first_valid(x, missing)
+    centered = x - reference
+    squares = centered**2
+    mean = window_sums(centered, window, missing)
+    mean /= window
+    variance = window_sums(squares, window, missing)
+    variance /= window
+    variance -= mean**2
+    np.maximum(variance, 0., out=variance)
+    mean += reference
+    return mean, np.sqrt(variance, out=variance)
+
+
+def rolling_mean(x, window):
+    """
+    Mean of the last `window` values, missing unless they are all present.
+    """
+    missing = missing_values(x)
+    reference = first_valid(x, missing)
+    mean = window_sums(x - reference, window, missing)
+    mean /= window
+    mean += reference
+    return mean
+
+
+def recursive_mean(x, alpha, min_periods=0):
+    """
+    Exponential moving average y[t] = alpha x[t] + (1 - alpha) y[t-1] of
+    every column, as pandas ewm(alpha=alpha, adjust=False, ignore_na=True),
+    started at the first value of the column. A missing value holds the
+    average and stays missing in the result. As in accumulate, the recursion
+    loops over the dates only.
+    """
+    missing = missing_values(x)
+    filled, holes = x, None
+    if missing is not None:
+        start = (~missing).argmax(axis=0)
+        # before its first value a column holds it, so that the average starts there
+        filled = np.where(np.arange(len(x))[:, None] < start, x[start, np.arange(x.shape[1])], x)
+        holes = np.isnan(filled)
+        if not holes.any():
+            holes = None
+    scaled = alpha*filled
+    result = np.empty_like(filled)
+    result[0] = filled[0]
+    hole_rows = holes.any(axis=1) if holes is not None else ()
+    for i in range(1, len(filled)):
+        np.multiply(result[i - 1], 1. - alpha, out=result[i])
+        result[i] += scaled[i]
+        if holes is not None and hole_rows[i]:
+            np.copyto(result[i], result[i - 1], where=holes[i])
+    if min_periods > 1:
+        if missing is None:
+            result[:min_periods - 1] = np.nan
+        elif holes is not None:
+            result[accumulate((~missing).astype(np.int32)) < min_periods] = np.nan
+        else:
+            result[np.arange(len(x))[:, None] < start + min_periods - 1] = np.nan
+    if missing is not None:
+        result[missing] = np.nan
+    return result
+
+
+def price_changes(x):
+    """
+    Change of every value from the previous present one.
+    """
+    previous = pd.DataFrame(x).ffill().shift(1).to_numpy()
+    return x - previous
+
+
+def sma(close, window=20):
+    """
+    Simple moving average.
+    """
+    x, wrap = as_panel(close)
+    return wrap(rolling_mean(x, window))
+
+
+def ema(close, span=20):
+    """
+    Exponential moving average, as pandas ewm(span=span, adjust=False).
+    """
+    x, wrap = as_panel(close)
+    return wrap(recursive_mean(x, 2./(span + 1)))
+
+
+def rsi(close, window=14):
+    """
+    Relative strength index, with the Wilder smoothing of the gains and
+    losses (ewm with alpha = 1/window).
+    """
+    x, wrap = as_panel(close)
+    changes = price_changes(x)
+    gains = recursive_mean(np.maximum(changes, 0.), 1./window, window)
+    losses = recursive_mean(np.maximum(-changes, 0.), 1./window, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return wrap(100*gains/(gains + losses))
+
+
+def macd(close, fast=12, slow=26, signal=9):
+    """
+    Moving average convergence divergence: the MACD line, its signal line
+    and their difference.
+    """
+    x, wrap = as_panel(close)
+    line = recursive_mean(x, 2./(fast + 1)) - recursive_mean(x, 2./(slow + 1))
+    signal_line = recursive_mean(line, 2./(signal + 1))
+    return wrap(line), wrap(signal_line), wrap(line - signal_line)
+
+
+def bollinger(close, window=20, k=2.):
+    """
+    Bollinger bands: the moving average and the bands k standard deviations
+    above and below it.
+    """
+    x, wrap = as_panel(close)
+    middle, std = rolling_moments(x, window)
+    std *= k
+    return wrap(middle), wrap(middle + std), wrap(middle - std)
+
+
+def atr(high, low, close, window=14):
+    """
+    Average true range, with the Wilder smoothing.
+    """
+    h, _ = as_panel(high)
+    l, _ = as_panel(low)
+    c, wrap = as_panel(close)
+    previous = pd.DataFrame(c).ffill().shift(1).to_numpy()
+    true_range = np.fmax(h - l, np.fmax(np.abs(h - previous), np.abs(l - previous)))
+    true_range[np.isnan(c)] = np.nan
+    return wrap(recursive_mean(true_range, 1./window, window))
+
+
+def roc(close, periods=10):
+    """
+    Rate of change over `periods` dates.
+    """
+    x, wrap = as_panel(close)
+    result = np.full(x.shape, np.nan)
+    result[periods:] = x[periods:]/x[:-periods] - 1
+    return wrap(result)
+
+
+def volatility(close, window=20):
+    """
+    Rolling standard deviation of the daily returns.
+    """
+    x, wrap = as_panel(close)
+    return wrap(rolling_moments(price_changes(x)/pd.DataFrame(x).ffill().shift(1).to_numpy(), window)[1])
+
+
+def panel_indicator(panel, function, quot_date=None, **params):
+    """
+    An indicator of every ticker of a PricePanel, dates x tickers, e.g.
+    panel_indicator(panel, rsi, window=14). The price columns are passed by
+    the names of the parameters of the indicator, see price_columns.
+    """
+    return function(*[panel.field(column, quot_date) for column in price_columns(function)], **params)
+
+
+def price_columns(function):
+    """
+    Price columns taken by an indicator, in the order of its parameters.
+    """
+    return [name.capitalize() for name in inspect.signature(function).parameters if name in ('high', 'low', 'close')]
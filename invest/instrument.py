@@ -0,0 +1,155 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+# The recorder in use, None when the instrumentation is off
+ACTIVE = None
+
+RECORD_COLUMNS = ['run', 'code', 'kind', 'name', 'hit', 'wall', 'self_time']
+
+
+class Recorder:
+    """
+    Collects the timing of the Stock properties ('property'), of the dataset
+    fetches ('fetch') and of the scoring stages ('stage').
+    Every event stores its wall time, the time not spent in nested events
+    (self_time) and, for properties and fetches, whether it was served by a
+    cache (hit).
+    Parameters:
+    - run: label of the run, to compare several runs in the same table
+    - profiler: optional profiler enabled only inside the events of the
+      profile_kinds, e.g. cProfile.Profile (enable/disable) or a
+      pyinstrument Profiler (start/stop)
+    - profile_kinds: kinds of the events run under the profiler
+    """
+
+    def __init__(self, run: str = 'run', profiler=None, profile_kinds=('stage',)):
+        self.run = run
+        self.profiler = profiler
+        self.profile_kinds = profile_kinds
+        self._records = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def _toggle_profiler(self, kind, on):
+        if (self.profiler is None) or (kind not in self.profile_kinds):
+            return
+        # the outermost event of a thread owns the profiler
+        if any(frame[0] in self.profile_kinds for frame in self._stack()[:-1]):
+            return
+        if hasattr(self.profiler, 'enable'):
+            (self.profiler.enable if on else self.profiler.disable)()
+        else:
+            (self.profiler.start if on else self.profiler.stop)()
+
+    @contextmanager
+    def span(self, kind: str, name: str, code: str = None, hit: bool = None):
+        """
+        Time the enclosed block as an event. Set `hit` on the yielded dict to
+        record whether it was served by a cache.
+        """
+        event = {'hit': hit}
+        stack = self._stack()
+        stack.append([kind, 0.])
+        self._toggle_profiler(kind, True)
+        start = time.perf_counter()
+        try:
+            yield event
+        finally:
+            wall = time.perf_counter() - start
+            self._toggle_profiler(kind, False)
+            children = stack.pop()[1]
+            if stack:
+                stack[-1][1] += wall
+            self.record(code, kind, name, event['hit'], wall, wall - children)
+
+    def record(self, code, kind, name, hit=None, wall=0., self_time=0.):
+        with self._lock:
+            self._records.append((self.run, code, kind, name, hit, wall, self_time))
+
+    def records(self):
+        """
+        DataFrame with one row per event.
+        """
+        with self._lock:
+            return pd.DataFrame(list(self._records), columns=RECORD_COLUMNS)
+
+    def summary(self, by=('kind', 'name')):
+        """
+        Calls, cache hits and misses, total, mean and self time of the events,
+        aggregated by the given columns (e.g. ('code',) for a per ticker view).
+        """
+        records = self.records()
+        records['hits'] = records['hit'].eq(True)
+        records['misses'] = records['hit'].eq(False)
+        summary = records.groupby(list(by)).agg(
+            calls=('wall', 'size'), hits=('hits', 'sum'), misses=('misses', 'sum'),
+            wall=('wall', 'sum'), mean_wall=('wall', 'mean'), self_time=('self_time', 'sum'))
+        return summary.sort_values('self_time', ascending=False)
+
+    def to_json(self, path: str = None):
+        """
+        Events as a JSON list of records, written to path if given.
+        """
+        data = json.dumps(self.records().to_dict(orient='records'))
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(data)
+        return data
+
+    def clear(self):
+        with self._lock:
+            self._records = []
+
+
+def enable(recorder: Recorder = None):
+    """
+    Start recording with the given Recorder (a new one by default) and return it.
+    """
+    global ACTIVE
+    ACTIVE = recorder or Recorder()
+    return ACTIVE
+
+
+def disable():
+    global ACTIVE
+    ACTIVE = None
+
+
+@contextmanager
+def recording(run: str = 'run', **kwargs):
+    """
+    Record the events of the enclosed block:
+
+        with instrument.recording() as recorder:
+            screen_universe(symbols)
+        recorder.summary()
+    """
+    previous = ACTIVE
+    recorder = enable(Recorder(run, **kwargs))
+    try:
+        yield recorder
+    finally:
+        enable(previous) if previous is not None else disable()
+
+
+@contextmanager
+def _no_span():
+    yield {'hit': None}
+
+
+def span(kind: str, name: str, code: str = None, hit: bool = None):
+    """
+    Event of the active recorder, or a no-op when the instrumentation is off.
+    """
+    if ACTIVE is None:
+        return _no_span()
+    return ACTIVE.span(kind, name, code, hit)
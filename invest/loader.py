@@ -1,6 +1,8 @@
 import pandas as pd
 import os
 import yaml
+from invest.stock import clean_history, history_anchor, merge_history
+from invest.providers import YahooProvider, as_timezone, chunks
 
 def load_symbols(filename : str):
     filepath = os.path.join(os.path.dirname(__file__), 'symbols', filename)
@@ -12,6 +14,87 @@ def load_borsa_italiana_stocks_symbols():
 def load_tokyo_stock_exchange_symbols():
     return load_symbols('tokyo_stock_exchange.csv')
 
+def download_histories(codes, chunk_size: int = 100):
+    """
+    Download the full price history of many symbols, with one multi-symbol
+    yfinance download per chunk instead of one request per ticker.
+    Parameters:
+    - codes: list of ticker codes
+    - chunk_size: number of symbols per download
+    Returns a dict code -> raw history, in the same layout as Ticker.history.
+    Symbols without data are left out.
+    """
+    return YahooProvider().fetch_many(list(codes), "history", chunk_size=chunk_size)
+
+def load_histories(symbols, quot_date=None, chunk_size: int = 100):
+    """
+    Same as download_histories, with the timezone stripped and the bars after
+    quot_date dropped as Stock.hist does.
+    Parameters:
+    - symbols: list of codes or a DataFrame returned by load_symbols
+    """
+    if isinstance(symbols, pd.DataFrame):
+        symbols = symbols['SYMBOL']
+    quot_date = quot_date or pd.Timestamp.now()
+    return {code: clean_history(hist, quot_date)
+            for code, hist in download_histories(list(symbols), chunk_size).items()}
+
+def preload_history(stocks, chunk_size: int = 100):
+    """
+    Seed the price history of many Stock objects, reading their caches first
+    and fetching the rest in bulk from their providers. The expired entries
+    are refreshed incrementally as Stock does (see extend_history), with one
+    download per chunk from the earliest anchor of the chunk; the missing
+    ones, and the refreshes that cannot be merged, are downloaded in full.
+    The raw downloads are stored in the caches too.
+    """
+    missing, expired, refreshed = [], [], []
+    for stock in stocks:
+        if "history" in stock._datasets:
+            continue
+        entry = stock.cache.load(stock.cache_key, "history") if (stock.cache is not None) else None
+        if (entry is None) or not len(entry[1]):
+            missing.append(stock)
+        elif stock.cache.is_fresh("history", entry[0]):
+            stock.seed("history", entry[1])
+        else:
+            expired.append((stock, entry[1]))
+    histories = {}
+    # sorted by anchor, so that every chunk starts close to the anchors of its entries
+    expired.sort(key=lambda item: as_timezone(history_anchor(item[1]), None))
+    for provider, group in by_provider(expired, lambda item: item[0].provider):
+        for chunk in chunks(group, chunk_size):
+            start = min(as_timezone(history_anchor(cached), None) for _, cached in chunk)
+            recent = provider.fetch_many([stock.code for stock, _ in chunk], "history",
+                                         chunk_size=chunk_size, start=start)
+            for stock, cached in chunk:
+                merged = merge_history(stock.code, cached, recent[stock.code]) if stock.code in recent else None
+                if merged is None:
+                    missing.append(stock)
+                else:
+                    histories[stock.cache_key] = merged
+                    refreshed.append(stock)
+    for provider, group in by_provider(missing, lambda stock: stock.provider):
+        downloads = provider.fetch_many([stock.code for stock in group], "history", chunk_size=chunk_size)
+        histories.update({provider.cache_key(code): hist for code, hist in downloads.items()})
+    for stock in refreshed + missing:
+        if stock.cache_key not in histories:
+            continue
+        if stock.cache is not None:
+            stock.cache.put(stock.cache_key, "history", histories[stock.cache_key])
+        stock.seed("history", histories[stock.cache_key])
+    return stocks
+
+def by_provider(items, provider_of):
+    """
+    Group items by the provider returned by provider_of, keeping their order.
+    """
+    groups = {}
+    for item in items:
+        provider = provider_of(item)
+        groups.setdefault(id(provider), (provider, []))[1].append(item)
+    return list(groups.values())
+
 def load_yaml(filename: str) -> dict:
     """
     Utility function to load a yaml file into a pyhon dict
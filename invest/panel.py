@@ -0,0 +1,146 @@
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from invest.stock import clean_history
+from invest.providers import chunks, default_provider
+
+logger = logging.getLogger()
+
+PANEL_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume', 'Dividends', 'Stock Splits']
+PANEL_DTYPE = np.float64
+
+
+class PricePanel:
+    """
+    Price histories of a whole universe in one memory-mapped array (float64
+    unless build_panel was given another dtype), tickers x columns x dates on
+    aligned dates, written by build_panel.
+    The history of a ticker is a contiguous block of the array, so it is
+    handed to Stock.hist as a DataFrame view without any copy, and every
+    process opening the same folder shares the same pages of memory.
+    Pickling a panel only sends its folder, e.g. to the workers of a process
+    pool, which map it again. Build one panel per exchange: tickers of
+    different calendars have holes on each other's dates, and their
+    histories cannot be plain views.
+    Parameters:
+    - folder: folder written by build_panel
+    """
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        with open(os.path.join(folder, 'meta.json')) as f:
+            meta = json.load(f)
+        self.codes = meta['codes']
+        self.columns = meta['columns']
+        self.positions = {code: i for i, code in enumerate(self.codes)}
+        self.dates = pd.DatetimeIndex(np.load(os.path.join(folder, 'dates.npy')), name='Date')
+        self.prices = np.load(os.path.join(folder, 'prices.npy'), mmap_mode='r')
+        # first and last date with data of every ticker, and whether it has holes in between
+        self.bounds = np.load(os.path.join(folder, 'bounds.npy'))
+
+    def __getstate__(self):
+        return {'folder': self.folder}
+
+    def __setstate__(self, state):
+        self.__init__(state['folder'])
+
+    def __contains__(self, code):
+        return code in self.positions
+
+    def history(self, code: str):
+        """
+        Price history of a ticker, in the layout of Stock.full_hist: a view
+        on the mapped array, unless the ticker has holes in its dates (then
+        the empty rows are dropped from a copy).
+        """
+        first, last, holes = self.bounds[self.positions[code]]
+        block = self.prices[self.positions[code], :, first:last + 1]
+        hist = pd.DataFrame(block.T, index=self.dates[first:last + 1], columns=self.columns, copy=False)
+        return hist.dropna(how='all') if holes else hist
+
+    def field(self, column: str, quot_date=None):
+        """
+        One column (e.g. Close) of all the tickers, dates x tickers, up to quot_date.
+        """
+        end = len(self.dates) if quot_date is None else self.dates.searchsorted(pd.Timestamp(quot_date), side='right')
+        values = self.prices[:, self.columns.index(column), :end]
+        return pd.DataFrame(values.T, index=self.dates[:end], columns=self.codes, copy=False)
+
+    def closes(self, code: str, quot_date=None, length: int = None):
+        """
+        The last `length` closes of a ticker up to quot_date, as a view when
+        the ticker has no holes.
+        """
+        first, last, holes = self.bounds[self.positions[code]]
+        if quot_date is not None:
+            last = min(last, self.dates.searchsorted(pd.Timestamp(quot_date), side='right') - 1)
+        closes = self.prices[self.positions[code], self.columns.index('Close'), first:last + 1]
+        if holes:
+            closes = closes[~np.isnan(closes)]
+        return closes[-length:] if length else closes
+
+    def trends(self, train_length: int = 120, min_segment: int = 10, quot_date=None):
+        """
+        detect_trends of every ticker of the panel, fitted on views of the
+        mapped closes.
+        """
+        from invest.technical_analysis import window_trends
+
+        return window_trends({code: self.closes(code, quot_date, train_length) for code in self.codes},
+                             min_segment)
+
+    def attach(self, stocks):
+        """
+        Seed the price history of the stocks in the panel with their views.
+        """
+        for stock in stocks:
+            if stock.code in self:
+                stock.seed('history', self.history(stock.code), prepared=True)
+        return stocks
+
+
+def build_panel(folder: str, codes, provider=None, chunk_size: int = 100, dtype=PANEL_DTYPE):
+    """
+    Download the price histories of a universe and store them as a PricePanel.
+    Parameters:
+    - folder: destination folder
+    - codes: list of ticker codes
+    - provider: DataProvider of the histories (the default provider if None)
+    - chunk_size: symbols per bulk download
+    - dtype: dtype of the stored values. float32 halves the size of the
+      panel, but keeps only about 7 significant digits of the prices and
+      rounds the volumes above 2**24 (about 16.7M shares)
+    Returns the PricePanel. Tickers without data are left out.
+    """
+    provider = provider or default_provider()
+    histories = {}
+    for chunk in chunks(list(codes), chunk_size):
+        for code, hist in provider.fetch_many(chunk, 'history', chunk_size=chunk_size).items():
+            hist = clean_history(hist)
+            hist = hist.loc[~hist.index.duplicated(keep='last')].sort_index()
+            if len(hist):
+                histories[code] = hist.reindex(columns=PANEL_COLUMNS).astype(dtype)
+    codes = [code for code in codes if code in histories]
+    dates = pd.DatetimeIndex(np.unique(np.concatenate([hist.index.values for hist in histories.values()])))
+
+    os.makedirs(folder, exist_ok=True)
+    prices = np.lib.format.open_memmap(os.path.join(folder, 'prices.npy'), mode='w+', dtype=dtype,
+                                       shape=(len(codes), len(PANEL_COLUMNS), len(dates)))
+    bounds = np.zeros((len(codes), 3), dtype=np.int64)
+    for i, code in enumerate(codes):
+        hist = histories.pop(code)
+        positions = dates.get_indexer(hist.index)
+        prices[i] = np.nan
+        prices[i][:, positions] = hist.values.T
+        bounds[i] = positions.min(), positions.max(), positions.max() - positions.min() + 1 > len(positions)
+    prices.flush()
+    del prices
+    np.save(os.path.join(folder, 'dates.npy'), dates.values.astype('datetime64[ns]'))
+    np.save(os.path.join(folder, 'bounds.npy'), bounds)
+    with open(os.path.join(folder, 'meta.json'), 'w') as f:
+        json.dump({'codes': codes, 'columns': PANEL_COLUMNS}, f)
+    return PricePanel(folder)
@@ -0,0 +1,197 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from invest.stock import Stock
+from invest.loader import preload_history
+from invest.providers import chunks
+from invest.scoring import fundamental_indicators, trend_indicators, compute_score
+from invest.screener import symbol_list
+from invest.incremental import IncrementalScorer
+from invest import instrument
+
+logger = logging.getLogger()
+
+# Price fields of the prefilter, computed on the price history alone
+PRICE_FIELDS = {
+    'price': lambda stock: stock.reference_price,
+    'avg_volume': lambda stock: stock.hist['Volume'].tail(20).mean(),
+    'avg_traded_value': lambda stock: (stock.hist['Close']*stock.hist['Volume']).tail(20).mean(),
+    'history_years': lambda stock: (stock.hist.index[-1] - stock.hist.index[0]).days/365.25,
+}
+
+# Values of the trend columns giving the highest score (score_TREND and score_DIVTREND of 5)
+BEST_TREND = {'trend_magnitude': 1., 'score_DIVTREND': 5}
+
+
+def passes(value, condition):
+    """
+    Whether a value meets a filter condition: a (min, max) tuple, None for
+    no bound, or a collection of accepted values. A missing value passes, it
+    is left to the later stages.
+    """
+    if (value is None) or (np.isscalar(value) and pd.isna(value)):
+        return True
+    if isinstance(condition, tuple):
+        low, high = condition
+        return ((low is None) or (value >= low)) and ((high is None) or (value <= high))
+    return value in condition
+
+
+def failed_filters(values: dict, filters: dict):
+    return [f'{field}={values[field]}' for field, condition in filters.items()
+            if not passes(values[field], condition)]
+
+
+def prefilter_failures(stock, info_filters, price_filters):
+    values = {field: stock.get_info(field) for field in info_filters}
+    values.update({field: PRICE_FIELDS[field](stock) for field in price_filters})
+    return failed_filters(values, {**info_filters, **price_filters})
+
+
+def run_tasks(pool, tasks: dict):
+    """
+    Run dict code -> (function, *args) on the pool.
+    Returns a dict code -> result and a dict code -> error.
+    """
+    results = {}
+    errors = {}
+    futures = {pool.submit(*task): code for code, task in tasks.items()}
+    for future in as_completed(futures):
+        code = futures[future]
+        try:
+            results[code] = future.result()
+        except Exception as e:
+            logger.warning(f'{code} : {e}')
+            errors[code] = repr(e)
+    return results, errors
+
+
+def staged_screen(symbols, info_filters=None, price_filters=None, fundamental_filters=None, top_n=None,
+                  quot_date=None, max_workers=8, chunk_size=100, provider=None):
+    """
+    screen_universe in three stages, each one run only on the survivors of
+    the previous one, from the cheapest to the most expensive:
+    1. prefilter on the info fields (e.g. trailingPE, marketCap, sector) and
+       on the PRICE_FIELDS, without downloading any statement;
+    2. fundamental indicators of the survivors, filtered on their columns
+       (e.g. PE, PB, ROE);
+    3. trend and dividend trend fits, only for the tickers whose score can
+       still reach the top_n: they are fitted by decreasing best possible
+       score (score_TREND and score_DIVTREND of 5), and the rest is skipped
+       as soon as that is below the top_n-th score already secured.
+    A filter maps a field to a (min, max) tuple, None for no bound, or to a
+    collection of accepted values; missing values pass. The info fields are
+    the current ones, also when quot_date is in the past.
+    The quantile scales are taken on the tickers that reach stage 3, so the
+    scores differ from a screen of the whole universe; the first top_n rows
+    are the ones the fits of all the survivors would give, the tickers
+    skipped have empty trend columns and a score that is a lower bound.
+    Parameters:
+    - symbols: codes to screen, see screener.symbol_list
+    - info_filters: dict info field -> condition
+    - price_filters: dict PRICE_FIELDS name -> condition
+    - fundamental_filters: dict indicator column -> condition
+    - top_n: number of tickers wanted (None fits all the survivors)
+    - quot_date, max_workers, chunk_size, provider: as in screen_universe
+    Returns the scored table, sorted by OVERALL_SCORE, and a report with the
+    stage, the status (filtered, error, skipped or scored) and the detail of
+    every ticker.
+    """
+    info_filters, price_filters = info_filters or {}, price_filters or {}
+    unknown = [field for field in price_filters if field not in PRICE_FIELDS]
+    if unknown:
+        raise ValueError(f'unknown price fields {unknown}, use {list(PRICE_FIELDS)}')
+    report = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        with instrument.span('stage', 'prefilter'):
+            stocks = prefilter(pool, symbol_list(symbols), info_filters, price_filters,
+                               quot_date, chunk_size, provider, report)
+        with instrument.span('stage', 'fundamental_filter'):
+            indicators = fundamental_stage(pool, stocks, fundamental_filters or {}, report)
+        if indicators is None:
+            return pd.DataFrame(), report_table(report)
+        with instrument.span('stage', 'trend_stage'):
+            scored = trend_stage(pool, stocks, indicators, top_n, max_workers, report)
+    return scored, report_table(report)
+
+
+def prefilter(pool, codes, info_filters, price_filters, quot_date, chunk_size, provider, report):
+    survivors = []
+    for batch in chunks(codes, chunk_size or 100):
+        stocks = [Stock(code, quot_date=quot_date, provider=provider) for code in batch]
+        if info_filters or price_filters:
+            if price_filters and chunk_size:
+                preload_history(stocks, chunk_size)
+            failures, errors = run_tasks(pool, {stock.code: (prefilter_failures, stock, info_filters, price_filters)
+                                                for stock in stocks})
+        else:
+            failures, errors = {}, {}
+        for stock in stocks:
+            if stock.code in errors:
+                report[stock.code] = ('prefilter', 'error', errors[stock.code])
+            elif failures.get(stock.code):
+                report[stock.code] = ('prefilter', 'filtered', ', '.join(failures[stock.code]))
+            else:
+                survivors.append(stock)
+    return survivors
+
+
+def fundamental_stage(pool, stocks, filters, report):
+    results, errors = run_tasks(pool, {stock.code: (fundamental_indicators, stock) for stock in stocks})
+    for code, error in errors.items():
+        report[code] = ('fundamentals', 'error', error)
+    if not results:
+        return None
+    indicators = pd.concat([results[stock.code] for stock in stocks if stock.code in results], ignore_index=True)
+    unknown = [column for column in filters if column not in indicators.columns]
+    if unknown:
+        raise ValueError(f'unknown indicator columns {unknown}')
+    keep = np.ones(len(indicators), dtype=bool)
+    if filters:
+        for row, values in enumerate(indicators[list(filters)].to_dict('records')):
+            failures = failed_filters(values, filters)
+            if failures:
+                report[indicators.at[row, 'code']] = ('fundamentals', 'filtered', ', '.join(failures))
+                keep[row] = False
+    indicators = indicators.loc[keep].reset_index(drop=True)
+    return indicators if len(indicators) else None
+
+
+def trend_stage(pool, stocks, indicators, top_n, max_workers, report):
+    by_code = {stock.code: stock for stock in stocks}
+    best = indicators.assign(**BEST_TREND)
+    bound = compute_score(best)['OVERALL_SCORE'].reindex(indicators.index)
+    order = bound.sort_values(ascending=False, kind='mergesort').index
+    # scores secured so far: the exact ones of the fitted rows, the lowest possible of the others
+    secured = IncrementalScorer(indicators) if top_n else None
+    position = 0
+    while position < len(order):
+        if secured is not None and len(order) > top_n:
+            threshold = np.sort(secured.overall)[-top_n]
+            if bound[order[position]] < threshold:
+                break
+        wave = order[position:position + max_workers]
+        codes = indicators.loc[wave, 'code']
+        results, errors = run_tasks(pool, {code: (trend_indicators, by_code[code], indicators.at[row, 'Reference Price'])
+                                           for row, code in codes.items()})
+        for row, code in codes.items():
+            if code in errors:
+                report[code] = ('trend', 'error', errors[code])
+                continue
+            for column, value in results[code].items():
+                indicators.at[row, column] = value
+            report[code] = ('trend', 'scored', '')
+        if secured is not None:
+            secured.upsert(indicators.loc[wave])
+        position += len(wave)
+    for row in order[position:]:
+        report[indicators.at[row, 'code']] = ('trend', 'skipped', f'best possible score {bound[row]:.3f}')
+    return compute_score(indicators)
+
+
+def report_table(report: dict):
+    return pd.DataFrame([(code,) + entry for code, entry in report.items()],
+                        columns=['code', 'stage', 'status', 'detail'])
@@ -55,4 +55,30 @@ def trendline(price_data):
         name="Predicted_trend",
         yaxis="y1",
         showlegend=True,
-    )    
\ No newline at end of file
+    )    
+
+def indicator_trace(function, output=None, name=None, yaxis="y1", **params):
+    """
+    A function of invest.indicators as an indicator of plot_candle, e.g.
+    plot_candle(prices, [indicator_trace(sma, window=50), indicator_trace(bollinger, output='upper')]).
+    Parameters:
+    - function: the indicator
+    - output: name of the output to plot, for the indicators returning more than one
+    - name: legend of the trace (the name of the indicator by default)
+    - yaxis: axis of the trace, y1 for the prices and y2 for the volume
+    - params: parameters of the indicator
+    """
+    from invest.indicators import OUTPUTS, price_columns
+
+    def trace(price_data):
+        values = function(*[price_data[column] for column in price_columns(function)], **params)
+        if output is not None:
+            values = values[OUTPUTS[function.__name__].index(output)]
+        return go.Scatter(
+            x=pd.to_datetime(price_data["Date"]),
+            y=values,
+            name=name or " ".join([function.__name__] + ([output] if output else [])),
+            yaxis=yaxis,
+            showlegend=True,
+        )
+    return trace
@@ -0,0 +1,325 @@
+import json
+import logging
+import os
+import pickle
+
+import pandas as pd
+
+from invest.governor import default_governor
+
+logger = logging.getLogger()
+
+# How every raw dataset is read from a yfinance Ticker
+DATASETS = {
+    'history': lambda ticker: ticker.history(period="max"),
+    'info': lambda ticker: ticker.info,
+    'shares': lambda ticker: ticker.shares,
+    'earnings': lambda ticker: ticker.earnings,
+    'financials': lambda ticker: ticker.financials,
+    'quarterly_financials': lambda ticker: ticker.quarterly_financials,
+    'balance_sheet': lambda ticker: ticker.balance_sheet,
+    'quarterly_balance_sheet': lambda ticker: ticker.quarterly_balance_sheet,
+    'cashflow': lambda ticker: ticker.cashflow,
+    'quarterly_cashflow': lambda ticker: ticker.quarterly_cashflow,
+}
+
+STATEMENTS = ['financials', 'quarterly_financials', 'balance_sheet', 'quarterly_balance_sheet',
+              'cashflow', 'quarterly_cashflow']
+
+
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class DataProvider:
+    """
+    Source of the raw datasets of the tickers, in the layout of yfinance:
+    the price history indexed by date, the statements with one column per
+    date, info as a dict.
+    A provider with as_of_reads reads the price history up to a date faster
+    than the whole of it (e.g. from local files): a Stock with a past
+    quot_date then reads its history only up to quot_date, and does not
+    cache that partial read.
+    """
+
+    as_of_reads = False
+
+    def fetch(self, code: str, dataset: str, start=None, end=None):
+        """
+        Raw dataset of a ticker. For the price history, `start` and `end`
+        restrict it to the bars from and up to those dates.
+        """
+        raise NotImplementedError
+
+    def cache_key(self, code: str):
+        """
+        Key of the datasets of a ticker in the caches of Stock, telling apart
+        the data of different providers.
+        """
+        return f'{type(self).__name__}:{code}'
+
+    def fetch_many(self, codes, dataset: str, start=None, end=None, **kwargs):
+        """
+        dict code -> raw dataset of many tickers, `start` and `end` as in fetch.
+        Tickers without data are left out.
+        """
+        results = {}
+        for code in codes:
+            try:
+                results[code] = self.fetch(code, dataset, start, end)
+            except Exception as e:
+                logger.warning(f'{code} {dataset} : {e}')
+        return results
+
+
+class YahooProvider(DataProvider):
+    """
+    Live data from yfinance. Every request goes through the default
+    RequestGovernor.
+    """
+
+    def cache_key(self, code: str):
+        # the bare code, as the entries cached before the providers
+        return code
+
+    def fetch(self, code: str, dataset: str, start=None, end=None):
+        import yfinance as yf
+
+        ticker = yf.Ticker(code)
+        if start is not None:
+            data = default_governor().call(dataset, ticker.history, start=pd.Timestamp(start).strftime('%Y-%m-%d'))
+        else:
+            data = default_governor().call(dataset, DATASETS[dataset], ticker)
+        return until(data, end)
+
+    def fetch_many(self, codes, dataset: str, chunk_size: int = 100, start=None, end=None):
+        """
+        Price histories are downloaded with one multi-symbol request per
+        chunk of chunk_size symbols instead of one request per ticker, in the
+        layout of Ticker.history (tz-aware, in the timezone of the exchange).
+        yfinance converts a download to the most common timezone of its
+        tickers, so every chunk holds the tickers of a single exchange.
+        """
+        if dataset != 'history':
+            return super().fetch_many(codes, dataset, start, end)
+        import yfinance as yf
+
+        period = {'period': 'max'} if start is None else {'start': pd.Timestamp(start).strftime('%Y-%m-%d')}
+        by_exchange = {}
+        for code in codes:
+            by_exchange.setdefault(exchange(code), []).append(code)
+        histories = {}
+        for group in by_exchange.values():
+            for chunk in chunks(group, chunk_size):
+                data = default_governor().call('history', yf.download, chunk, group_by="ticker", actions=True,
+                                               auto_adjust=True, ignore_tz=False, progress=False, **period)
+                if not isinstance(data.columns, pd.MultiIndex):
+                    data = pd.concat({chunk[0]: data}, axis=1)
+                for code in chunk:
+                    if code not in data.columns.get_level_values(0):
+                        continue
+                    hist = until(data[code].dropna(how="all"), end)
+                    if len(hist):
+                        histories[code] = hist
+        return histories
+
+
+def fixture_path(path: str, code: str):
+    return os.path.join(path, f'{code}.pkl')
+
+
+class ReplayProvider(DataProvider):
+    """
+    Payloads recorded by invest.replay.record, one pickle per ticker.
+    A dataset missing from the recording raises KeyError.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._payloads = {}
+
+    def __getstate__(self):
+        # pickled as its path, without the payloads read so far
+        return {'path': self.path, '_payloads': {}}
+
+    def _payload(self, code, dataset):
+        if code not in self._payloads:
+            with open(fixture_path(self.path, code), 'rb') as f:
+                self._payloads[code] = pickle.load(f)
+        if dataset not in self._payloads[code]:
+            raise KeyError(f'{code} : {dataset} not recorded')
+        return self._payloads[code][dataset]
+
+    def cache_key(self, code: str):
+        return f'replay:{os.path.abspath(self.path)}:{code}'
+
+    def fetch(self, code: str, dataset: str, start=None, end=None):
+        data = self._payload(code, dataset)
+        if start is not None:
+            data = data.loc[data.index >= as_timezone(start, data.index.tz)]
+        return until(data, end)
+
+
+def until(data, end):
+    """
+    The bars of a price history up to end (all of them if end is None).
+    """
+    if end is None:
+        return data
+    return data.loc[data.index <= as_timezone(end, data.index.tz)]
+
+
+def as_timezone(date, tz):
+    """
+    Timestamp of the same wall clock time as date in the timezone tz (None for naive).
+    """
+    date = pd.Timestamp(date)
+    if date.tz is not None:
+        date = date.tz_localize(None)
+    return date if tz is None else date.tz_localize(tz)
+
+
+def exchange(code: str):
+    """
+    Exchange suffix of a Yahoo code (ENEL.MI -> MI), US when there is none.
+    """
+    return code.rsplit('.', 1)[1] if '.' in code else 'US'
+
+
+class LakeProvider(DataProvider):
+    """
+    Local data lake of Parquet files, one partition per dataset and exchange:
+    root/<dataset>/exchange=<exchange>/part-0.parquet, with a `code` column.
+    Only the partition of the ticker exchange and the row groups of the
+    ticker are read, and the price history can be restricted to some columns
+    and dates (a Stock with a past quot_date reads its history up to it).
+    The lake is written by write_lake.
+    Parameters:
+    - root: folder of the lake
+    - columns: dict dataset -> columns to read (all of them by default)
+    """
+
+    as_of_reads = True
+
+    def __init__(self, root: str, columns: dict = None):
+        self.root = root
+        self.columns = columns or {}
+
+    def read(self, dataset: str, codes=None, columns=None, start=None, end=None):
+        """
+        Rows of a dataset, in the layout they are stored in, for some codes,
+        columns and dates (all of them by default).
+        """
+        import pyarrow.dataset as ds
+
+        filters = []
+        if codes is not None:
+            codes = list(codes)
+            filters.append(ds.field('exchange').isin(sorted({exchange(code) for code in codes})))
+            filters.append(ds.field('code').isin(codes))
+        if start is not None:
+            filters.append(ds.field('Date') >= as_timezone(start, None).to_datetime64())
+        if end is not None:
+            filters.append(ds.field('Date') <= as_timezone(end, None).to_datetime64())
+        path = os.path.join(self.root, dataset)
+        if not os.path.isdir(path):
+            raise KeyError(f'{dataset} not in the lake')
+        lake = ds.dataset(path, format='parquet', partitioning='hive')
+        if columns is not None:
+            index = ['Date'] if 'Date' in lake.schema.names else []
+            columns = ['code'] + index + [column for column in columns if column not in index]
+        condition = None
+        for f in filters:
+            condition = f if condition is None else (condition & f)
+        return lake.to_table(columns=columns, filter=condition).to_pandas()
+
+    def cache_key(self, code: str):
+        return f'lake:{os.path.abspath(self.root)}:{code}'
+
+    def fetch(self, code: str, dataset: str, start=None, end=None):
+        rows = self.read(dataset, [code], self.columns.get(dataset), start, end)
+        if not len(rows):
+            raise KeyError(f'{code} : {dataset} not in the lake')
+        return from_lake_rows(dataset, rows)
+
+    def fetch_many(self, codes, dataset: str, start=None, end=None, **kwargs):
+        rows = self.read(dataset, codes, self.columns.get(dataset), start, end)
+        return {code: from_lake_rows(dataset, group) for code, group in rows.groupby('code', sort=False)}
+
+
+def to_lake_rows(dataset: str, code: str, data):
+    if dataset == 'info':
+        return pd.DataFrame({'code': [code], 'payload': [json.dumps(data, default=str)]})
+    if dataset in STATEMENTS:
+        data = data.T.apply(pd.to_numeric, errors='coerce')
+    if dataset in ['history'] + STATEMENTS:
+        data = data.rename_axis('Date')
+        # wall clock time of the exchange, as Stock uses it
+        if getattr(data.index, 'tz', None) is not None:
+            data.index = data.index.tz_localize(None)
+    else:
+        data = data.rename_axis(data.index.name or 'index')
+    rows = data.reset_index()
+    rows.insert(0, 'code', code)
+    return rows
+
+
+def from_lake_rows(dataset: str, rows):
+    rows = rows.drop(columns=['code', 'exchange'], errors='ignore')
+    if dataset == 'info':
+        return json.loads(rows['payload'].iloc[0])
+    index = 'Date' if 'Date' in rows.columns else rows.columns[0]
+    data = rows.set_index(index)
+    if index == 'index':
+        data.index.name = None
+    if dataset in STATEMENTS:
+        return data.dropna(axis=1, how='all').T
+    return data
+
+
+def write_lake(root: str, dataset: str, payloads: dict):
+    """
+    Store raw datasets in a lake read by LakeProvider, replacing the rows of
+    the given tickers and keeping the others.
+    Parameters:
+    - root: folder of the lake
+    - dataset: name of the dataset
+    - payloads: dict code -> raw dataset, as returned by DataProvider.fetch
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    by_exchange = {}
+    for code, data in payloads.items():
+        if data is not None:
+            by_exchange.setdefault(exchange(code), []).append(to_lake_rows(dataset, code, data))
+    for partition, frames in by_exchange.items():
+        folder = os.path.join(root, dataset, f'exchange={partition}')
+        path = os.path.join(folder, 'part-0.parquet')
+        os.makedirs(folder, exist_ok=True)
+        if os.path.exists(path):
+            previous = pq.read_table(path).to_pandas()
+            frames.insert(0, previous.loc[~previous['code'].isin(payloads)])
+        rows = pd.concat(frames, ignore_index=True)
+        rows = rows.sort_values(['code', 'Date'] if 'Date' in rows.columns else ['code'], kind='mergesort')
+        pq.write_table(pa.Table.from_pandas(rows, preserve_index=False), path, row_group_size=50000)
+
+
+_default_provider = None
+
+
+def default_provider():
+    """
+    Return the provider used by the Stock objects created without one
+    (live yfinance data unless changed with set_default_provider).
+    """
+    global _default_provider
+    if _default_provider is None:
+        _default_provider = YahooProvider()
+    return _default_provider
+
+
+def set_default_provider(provider: DataProvider):
+    global _default_provider
+    _default_provider = provider
@@ -0,0 +1,55 @@
+import logging
+import os
+import pickle
+
+from invest.stock import Stock, DATASETS
+from invest.providers import ReplayProvider, fixture_path
+
+logger = logging.getLogger()
+
+
+def record(codes, path: str, datasets=None):
+    """
+    Snapshot the raw yfinance payloads of some tickers to local files, one
+    pickle per ticker with a dict dataset -> payload. A dataset that cannot be
+    downloaded is left out of the snapshot.
+    Parameters:
+    - codes: list of ticker codes
+    - path: folder of the fixtures
+    - datasets: names of the datasets to record (all of them by default)
+    Returns the list of the recorded codes.
+    """
+    os.makedirs(path, exist_ok=True)
+    recorded = []
+    for code in codes:
+        stock = Stock(code, cache=False)
+        payloads = {}
+        for dataset in (datasets or DATASETS):
+            try:
+                payloads[dataset] = stock._fetch(dataset)
+            except Exception as e:
+                logger.warning(f'{code} {dataset} : {e}')
+        if payloads:
+            with open(fixture_path(path, code), 'wb') as f:
+                pickle.dump(payloads, f, protocol=pickle.HIGHEST_PROTOCOL)
+            recorded.append(code)
+    return recorded
+
+
+def recorded_codes(path: str):
+    """
+    Codes recorded in a fixtures folder (none if the folder does not exist).
+    """
+    if not os.path.isdir(path):
+        return []
+    return sorted(name[:-len('.pkl')] for name in os.listdir(path) if name.endswith('.pkl'))
+
+
+def replay_stocks(path: str, codes=None, quot_date=None):
+    """
+    Stock objects of the recorded tickers (or of the given codes), fed from
+    the fixtures by a ReplayProvider and not cached.
+    """
+    provider = ReplayProvider(path)
+    return [Stock(code, quot_date=quot_date, cache=False, provider=provider)
+            for code in (codes or recorded_codes(path))]
@@ -1,73 +1,219 @@
+import hashlib
+from collections import OrderedDict
+from itertools import combinations
+import numpy as np
 import pandas as pd
+from numpy import inf
 from invest.fundamental_analysis import main_fundamental_indicators
 from invest.technical_analysis import detect_trend
-import piecewise_regression
-from sklearn.linear_model import LinearRegression
-
-def compute_score(indicatori : pd.DataFrame):
-    indicatori['score_NIPE'] = score_NIPE(indicatori['Net income per employee'])
-    indicatori['score_PE'] = score_PE(indicatori['PE'])
-    indicatori['score_QR'] = score_QR(indicatori['Quick Ratio'])
-    indicatori['score_TREND'] = score_TREND(indicatori['trend_magnitude'])
-    indicatori['score_PB'] = score_PB(indicatori['PB'])
-    indicatori['score_YELD'] = score_YELD(indicatori['Dividend yeld'])
-    indicatori['score_DIVHIST'] = (indicatori['#div_past20y'])/4
-    indicatori['score_PAYOUT'] = score_PAYOUT(indicatori['Payout Ratio'])
-
-    indicatori['score_GRAHAM'] = score_graham(indicatori['price_over_graham'])
-    indicatori['score_ROA'] = score_ROA(indicatori['Return on Assets'])
-    indicatori['score_ROE'] = score_ROE(indicatori['ROE'])
-    indicatori['score_NCAPSOP'] = score_NCAPSOP(indicatori['Net current asset per share over price'])
-    indicatori['score_ROCE'] = score_ROCE(indicatori['ROCE'])
-    indicatori['score_EPS'] = score_EPS(indicatori['EPS over price'])
-     
-    n_scores = len(indicatori.filter(like='score').columns)
-
-    indicatori['OVERALL_SCORE'] = indicatori.filter(like='score').sum(axis=1)/n_scores
+from invest.governor import FetchError
+from invest import instrument
+
+SCALE = 'scale'
+RAMP = 'ramp'
+
+
+class Quantile:
+    """
+    Scale of a Rule taken from the distribution of the scored column.
+    Parameters:
+    - q: quantile, as in pandas.Series.quantile
+    - positive: compute it on the positive values only
+    """
+
+    def __init__(self, q, positive=False):
+        self.q = q
+        self.positive = positive
+
+    def resolve(self, values):
+        values = self.support(values)
+        return np.quantile(values, self.q) if len(values) else np.nan
+
+    def support(self, values):
+        """
+        The values the quantile is taken on.
+        """
+        values = values[~np.isnan(values)]
+        if self.positive:
+            values = values[values > 0]
+        return values
+
+
+class Rule:
+    """
+    Declarative scorer of one indicator column, evaluated on float64 arrays.
+    The value gets the score of the first band (lower, upper, score[, closed])
+    that contains it, `na` when missing and `default` when outside every band.
+    A band edge can be SCALE and a score can be RAMP, i.e. 5 * value / scale,
+    where scale is a number or a Quantile of the column. `cap` bounds the
+    score from above (a NaN ramp is capped too), `transform` is applied to the
+    column before scoring.
+    """
+
+    def __init__(self, column, bands, default=np.nan, na=0., scale=None,
+                 closed='neither', cap=None, transform=None):
+        self.column = column
+        self.bands = bands
+        self.default = default
+        self.na = na
+        self.scale = scale
+        self.closed = closed
+        self.cap = cap
+        self.transform = transform
+
+    def evaluate(self, values, scale=None):
+        """
+        Scores of the values. A Quantile scale is resolved on the values
+        themselves, unless its value is given.
+        """
+        x = self.prepare(values)
+        if scale is None:
+            scale = self.scale.resolve(x) if isinstance(self.scale, Quantile) else self.scale
+        conditions = [np.isnan(x)]
+        choices = [self.na]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for band in self.bands:
+                lower, upper, score = (scale if item == SCALE else item for item in band[:3])
+                closed = band_sides(band, band[3] if len(band) > 3 else self.closed)
+                conditions.append(in_band(x, lower, upper, closed))
+                choices.append(5 * x / scale if score == RAMP else score)
+            result = np.select(conditions, choices, self.default).astype(np.float64)
+        if self.cap is not None:
+            result = np.fmin(result, self.cap)
+        return result
+
+    def prepare(self, values):
+        x = np.asarray(values, dtype=np.float64)
+        if self.transform is not None:
+            x = self.transform(x)
+        return x
+
+
+def in_band(x, lower, upper, closed='neither'):
+    above = (x >= lower) if closed in ('left', 'both') else (x > lower)
+    below = (x <= upper) if closed in ('right', 'both') else (x < upper)
+    return above & below
+
+
+def band_sides(band, closed):
+    """
+    The sides of a band to close: the ones given by `closed`, and the edges
+    declared infinite, so that -inf and inf fall in the bands that extend to
+    them (an edge resolved to an infinite scale is left as it is).
+    """
+    left = (closed in ('left', 'both')) or (band[0] == -inf)
+    right = (closed in ('right', 'both')) or (band[1] == inf)
+    return {(False, False): 'neither', (True, False): 'left', (False, True): 'right', (True, True): 'both'}[(left, right)]
+
+
+# Bands are listed by priority: where they overlap the first one wins.
+SCORING_RULES = {
+    'score_NIPE': Rule('Net income per employee',
+                       [(SCALE, inf, 5, 'left'), (0, SCALE, RAMP), (-inf, 0, 0)],
+                       scale=Quantile(0.9)),
+    'score_PE': Rule('PE',
+                     [(-inf, 10, 5), (10, 12, 4), (12, 15, 3), (15, 17.5, 2)],
+                     default=1, closed='left'),
+    'score_QR': Rule('Quick Ratio', [(2, inf, 5), (0, 2, RAMP)], default=0, scale=2),
+    'score_TREND': Rule('trend_magnitude', [(0, inf, 5)], default=0),
+    'score_PB': Rule('PB', [(3, inf, 1), (2, 3, 2), (1, 2, 4), (0, 1, 5)], default=0),
+    'score_YELD': Rule('Dividend yeld', [(-inf, inf, RAMP)], na=5, scale=Quantile(0.9), cap=5),
+    'score_DIVHIST': Rule('#div_past20y', [(-inf, inf, RAMP)], na=np.nan, scale=20),
+    'score_PAYOUT': Rule('Payout Ratio', [(0, 1, RAMP)], default=0, scale=1,
+                         transform=lambda payout: 1 - payout),
+    'score_GRAHAM': Rule('price_over_graham',
+                         [(2, inf, 1), (1.5, 2, 2), (1.1, 1.5, 3), (1, 1.1, 4), (-inf, 1, 5)]),
+    'score_ROA': Rule('Return on Assets',
+                      [(SCALE, inf, 5, 'left'), (0, inf, RAMP), (-inf, 0, 0)], scale=0.1),
+    'score_ROE': Rule('ROE',
+                      [(SCALE, inf, 5, 'left'), (0, inf, RAMP), (-inf, 0, 0)], scale=0.2),
+    'score_NCAPSOP': Rule('Net current asset per share over price',
+                          [(-inf, -10, 1), (-10, -5, 2), (-5, -1, 3), (-1, 0, 4), (0, inf, 5)]),
+    'score_ROCE': Rule('ROCE',
+                       [(0, SCALE, RAMP, 'both'), (SCALE, inf, 5), (-inf, 0, 0)],
+                       scale=Quantile(0.9)),
+    'score_EPS': Rule('EPS over price',
+                      [(SCALE, inf, 5, 'left'), (0, inf, RAMP), (-inf, 0, 0)],
+                      scale=Quantile(0.85, positive=True)),
+}
+
+
+def evaluate_rules(indicatori : pd.DataFrame, rules=SCORING_RULES):
+    return {name: rule.evaluate(indicatori[rule.column].values) for name, rule in rules.items()}
+
+
+def compute_score(indicatori : pd.DataFrame, rules=SCORING_RULES):
+    """
+    Score an indicator table (see Universe.score for a Universe).
+    """
+    with instrument.span('stage', 'compute_score'):
+        for name, values in evaluate_rules(indicatori, rules).items():
+            indicatori[name] = values
+
+        score_columns = [column for column in indicatori.columns if 'score' in column]
+        scores = indicatori[score_columns].to_numpy(dtype=np.float64, na_value=np.nan)
+        indicatori['OVERALL_SCORE'] = np.nansum(scores, axis=1)/len(score_columns)
 
     return indicatori.sort_values(by='OVERALL_SCORE', ascending=False)
 
 
 def get_indicators(stock):
-    trend_magnitude, last_value_trendline = detect_trend(stock, verbose=0)
-    tmp = main_fundamental_indicators(stock)
-    tmp['trendline'] = last_value_trendline
-    tmp['trend_magnitude'] = trend_magnitude
-    tmp['price_over_trend'] = (tmp['Reference Price'])/last_value_trendline
+    tmp = fundamental_indicators(stock)
+    for column, value in trend_indicators(stock, tmp['Reference Price']).items():
+        tmp[column] = value
+    return tmp
+
+
+# Columns of get_indicators filled by the trend and the dividend trend fits
+TREND_COLUMNS = ['trendline', 'trend_magnitude', 'price_over_trend', 'score_DIVTREND']
+
+
+def fundamental_indicators(stock):
+    """
+    get_indicators without the trend and dividend trend fits: their columns
+    (TREND_COLUMNS) are left empty.
+    """
+    with instrument.span('stage', 'fundamentals', stock.code):
+        tmp = main_fundamental_indicators(stock)
+    tmp['trendline'] = np.nan
+    tmp['trend_magnitude'] = np.nan
+    tmp['price_over_trend'] = np.nan
     tmp['sector'] = stock.get_info('sector')
     tmp['description'] = stock.get_info('longBusinessSummary')
-    tmp['#div_past20y'] = years_of_dividend_payments(stock)
-    tmp['score_DIVTREND'] = score_DIVTREND(stock)
+    with instrument.span('stage', 'dividends', stock.code):
+        tmp['#div_past20y'] = years_of_dividend_payments(stock)
+    tmp['score_DIVTREND'] = np.nan
     return tmp
 
+
+def trend_indicators(stock, reference_price):
+    """
+    Values of TREND_COLUMNS for a stock.
+    """
+    with instrument.span('stage', 'detect_trend', stock.code):
+        trend_magnitude, last_value_trendline = detect_trend(stock, verbose=0)
+    with instrument.span('stage', 'score_DIVTREND', stock.code):
+        divtrend = score_DIVTREND(stock)
+    return {'trendline': last_value_trendline,
+            'trend_magnitude': trend_magnitude,
+            'price_over_trend': reference_price/last_value_trendline,
+            'score_DIVTREND': divtrend}
+
+def apply_rule(rule, values):
+    values = pd.Series(values)
+    return pd.Series(rule.evaluate(values.values), index=values.index)
+
 def score_ROCE(roce):
-    tmp = pd.DataFrame()
-    tmp['ROCE'] = roce
-    soglia_5 = tmp['ROCE'].quantile(0.9)
-    tmp['score_ROCE'] = None
-    tmp.loc[(tmp['ROCE'].isna() | 
-            (tmp['ROCE'] < 0)), 'score_ROCE'] = 0
-    tmp.loc[(tmp['ROCE'] > soglia_5), 'score_ROCE'] = 5
-    tmp.loc[((tmp['ROCE'] >= 0) & 
-             (tmp['ROCE'] <= soglia_5)), 'score_ROCE'] = 5*tmp['ROCE']/soglia_5
-    return tmp['score_ROCE']
+    return apply_rule(SCORING_RULES['score_ROCE'], roce)
+
 
 def score_YELD(div_yeld):
-    tmp_df = pd.DataFrame()
-    tmp_df['Dividend yeld'] = div_yeld
-    tmp_df['score_YELD'] =  (5*tmp_df['Dividend yeld']/tmp_df['Dividend yeld'].quantile(0.9)).map(lambda x : min(5, x))
-    return tmp_df['score_YELD']
+    return apply_rule(SCORING_RULES['score_YELD'], div_yeld)
+
 
 def score_PAYOUT(payout):
-    tmp_df = pd.DataFrame()
-    tmp_df['payout'] = 1 - payout
-    tmp_df['score_PAYOUT'] = None
-    tmp_df.loc[(tmp_df['payout'] <= 0)  | 
-               (tmp_df['payout'] >= 1) | 
-                tmp_df['payout'].isna(), 'score_PAYOUT'] = 0
-    tmp_df.loc[(tmp_df['payout'] > 0) & 
-               (tmp_df['payout'] < 1) , 'score_PAYOUT'] = 5*tmp_df['payout']
-    return tmp_df['score_PAYOUT']
+    return apply_rule(SCORING_RULES['score_PAYOUT'], payout)
+
 
 def years_of_dividend_payments(mystock):
     tmp_div_df = pd.DataFrame()
@@ -77,137 +223,206 @@ def years_of_dividend_payments(mystock):
     return len(dividends_df)
 
 def score_PE(PE):
-    tmp_df = pd.DataFrame()
-    tmp_df['PE'] = PE
-    tmp_df['score_PE'] = 1
-    tmp_df.loc[tmp_df['PE'].isna(), 'score_PE'] = 0
-    tmp_df.loc[tmp_df['PE'] < 17.5, 'score_PE'] = 2 
-    tmp_df.loc[tmp_df['PE'] < 15, 'score_PE'] = 3
-    tmp_df.loc[tmp_df['PE'] < 12, 'score_PE'] = 4
-    tmp_df.loc[tmp_df['PE'] < 10, 'score_PE'] = 5
-    return tmp_df['score_PE']
+    return apply_rule(SCORING_RULES['score_PE'], PE)
+
 
 def score_QR(qr):
-    tmp_df = pd.DataFrame()
-    tmp_df['QR'] = qr
-    tmp_df['score_QR'] = 0
-    tmp_df.loc[tmp_df['QR'].isna(), 'score_QR'] = 0
-    tmp_df.loc[(tmp_df['QR'] < 2) & 
-               (tmp_df['QR'] > 0) , 'score_QR'] =  2.5*(tmp_df['QR'])   
-    tmp_df.loc[tmp_df['QR'] > 2, 'score_QR'] = 5
-    return tmp_df['score_QR']
+    return apply_rule(SCORING_RULES['score_QR'], qr)
+
 
 def score_PB(PB):
-    tmp_df = pd.DataFrame()
-    tmp_df['PB'] = PB
-    tmp_df['score_PB'] = 0
-    tmp_df.loc[tmp_df['PB'].isna() | (tmp_df['PB'] < 0), 'score_PB'] = 0
-    tmp_df.loc[(tmp_df['PB'] > 3), 'score_PB'] = 1 
-    tmp_df.loc[((tmp_df['PB'] < 3) & (tmp_df['PB'] > 2)), 'score_PB'] = 2
-    tmp_df.loc[(tmp_df['PB'] < 2) & (tmp_df['PB'] > 1), 'score_PB'] = 4
-    tmp_df.loc[(tmp_df['PB'] < 1)& (tmp_df['PB'] > 0), 'score_PB'] = 5
-    return tmp_df['score_PB']
+    return apply_rule(SCORING_RULES['score_PB'], PB)
+
 
 def score_TREND(trend):
-    tmp_df = pd.DataFrame()
-    tmp_df['TREND'] = trend
-    tmp_df['score_TREND'] = 0
-    tmp_df.loc[(tmp_df['TREND'] > 0), 'score_TREND'] = 5    
-    return tmp_df['score_TREND']
+    return apply_rule(SCORING_RULES['score_TREND'], trend)
 
 
 def score_NIPE(IPE):
-    tmp_df = pd.DataFrame()
-    tmp_df['IPE'] = IPE
-    
-    best_decile = tmp_df['IPE'].quantile(0.90)
-    
-    tmp_df['score_NIPE'] = None
-    tmp_df.loc[tmp_df['IPE'].isna() | (tmp_df['IPE'] < 0), 'score_NIPE'] = 0
+    return apply_rule(SCORING_RULES['score_NIPE'], IPE)
 
-    tmp_df.loc[(tmp_df['IPE'] > 0) & 
-               (tmp_df['IPE'] < best_decile), 'score_NIPE'] = 5*tmp_df['IPE']/best_decile
-
-    tmp_df.loc[(tmp_df['IPE'] >= best_decile), 'score_NIPE'] = 5
-    
-    return tmp_df['score_NIPE'] 
 
 def score_EPS(ROE):
-    tmp_df = pd.DataFrame()
-    tmp_df['EPS'] = ROE
-    tmp_df['score_EPS'] = None
-    best_decile = tmp_df.loc[tmp_df['EPS'] > 0]['EPS'].quantile(0.85)
-    tmp_df.loc[tmp_df['EPS'].isna() |
-              (tmp_df['EPS'] < 0), 'score_EPS'] = 0
-    tmp_df.loc[tmp_df['EPS'] > 0 &
-              (tmp_df['EPS'] < best_decile), 'score_EPS'] = 5*tmp_df['EPS']/best_decile
-    tmp_df.loc[((tmp_df['EPS'] >= best_decile)), 'score_EPS'] = 5
-    return tmp_df['score_EPS'] 
+    return apply_rule(SCORING_RULES['score_EPS'], ROE)
 
 
 def score_graham(price_over_graham):
-    tmp_df = pd.DataFrame()
-    tmp_df['graham'] = price_over_graham
-    tmp_df['score_GRAHAM'] = None
-    tmp_df.loc[tmp_df['graham'].isna(), 'score_GRAHAM'] = 0
-    tmp_df.loc[(tmp_df['graham'] > 2) , 'score_GRAHAM'] = 1
-    tmp_df.loc[((tmp_df['graham'] > 1.5) & 
-                (tmp_df['graham'] < 2)) , 'score_GRAHAM'] = 2
-    tmp_df.loc[((tmp_df['graham'] > 1.1) & 
-                (tmp_df['graham'] < 1.5)) , 'score_GRAHAM'] = 3
-    tmp_df.loc[((tmp_df['graham'] > 1) & 
-                (tmp_df['graham'] < 1.1)) , 'score_GRAHAM'] = 4
-    tmp_df.loc[tmp_df['graham'] < 1, 'score_GRAHAM'] = 5
-    return tmp_df['score_GRAHAM']  
+    return apply_rule(SCORING_RULES['score_GRAHAM'], price_over_graham)
+
 
 def score_ROA(ROA):
-    tmp_df = pd.DataFrame()
-    tmp_df['ROA'] = ROA
-    tmp_df['score_ROA'] = None
-    tmp_df.loc[tmp_df['ROA'].isna() |
-              (tmp_df['ROA'] < 0), 'score_ROA'] = 0
-    tmp_df.loc[tmp_df['ROA'] > 0 &
-              (tmp_df['ROA'] < 0.1), 'score_ROA'] = 5*tmp_df['ROA']/0.1
-    tmp_df.loc[((tmp_df['ROA'] >= 0.1)), 'score_ROA'] = 5
-    return tmp_df['score_ROA']  
+    return apply_rule(SCORING_RULES['score_ROA'], ROA)
 
 
 def score_ROE(ROE):
-    tmp_df = pd.DataFrame()
-    tmp_df['ROE'] = ROE
-    tmp_df['score_ROE'] = None
-    tmp_df.loc[tmp_df['ROE'].isna() |
-              (tmp_df['ROE'] < 0), 'score_ROE'] = 0
-    tmp_df.loc[tmp_df['ROE'] > 0 &
-              (tmp_df['ROE'] < 0.2), 'score_ROE'] = 5*tmp_df['ROE']/0.2
-    tmp_df.loc[((tmp_df['ROE'] >= 0.2)), 'score_ROE'] = 5
-    return tmp_df['score_ROE'] 
-
+    return apply_rule(SCORING_RULES['score_ROE'], ROE)
 
 
 def score_NCAPSOP(NCAPSOP):
-    tmp_df = pd.DataFrame()
-    tmp_df['NCAPSOP'] = NCAPSOP
-    tmp_df['score_NCAPSOP'] = None
-    tmp_df.loc[tmp_df['NCAPSOP'].isna(), 'score_NCAPSOP'] = 0
-    tmp_df.loc[tmp_df['NCAPSOP'] < -10, 'score_NCAPSOP'] = 1
-    tmp_df.loc[((tmp_df['NCAPSOP'] > -10) & 
-                (tmp_df['NCAPSOP'] < -5)), 'score_NCAPSOP'] = 2
-    tmp_df.loc[((tmp_df['NCAPSOP'] > -5) & 
-                (tmp_df['NCAPSOP'] < -1)), 'score_NCAPSOP'] = 3
-    tmp_df.loc[((tmp_df['NCAPSOP'] > -1) & 
-                (tmp_df['NCAPSOP'] < 0)), 'score_NCAPSOP'] = 4
-    tmp_df.loc[((tmp_df['NCAPSOP'] > 0)), 'score_NCAPSOP'] = 5
-    return tmp_df['score_NCAPSOP'] 
-
-
-
-def score_DIVTREND(stock):
+    return apply_rule(SCORING_RULES['score_NCAPSOP'], NCAPSOP)
+
+
+def annual_dividend_series(stock):
+    annual_dividends = stock.annual_dividends.loc[stock.annual_dividends['Year']>=2002]
+    return annual_dividends['Year'].values, annual_dividends['Dividends'].values
+
+
+def score_DIVTREND(stock, exact=False):
+    """
+    Score the trend of the annual dividends since 2002: 5 if the slope of the
+    last segment of the best piecewise linear model (up to 3 breakpoints,
+    chosen by BIC) is positive at 95% confidence, 0 if negative, 3 otherwise.
+    When the best model is a straight line (no breakpoint) the score is 3,
+    since piecewise_regression cannot fit a model without breakpoints.
+    With exact=True the models are fitted by piecewise_regression, otherwise
+    by the memoized closed-form search of dividend_trend_classes.
+    """
+    if exact:
+        return score_DIVTREND_exact(stock)
+    try:
+        years, dividends = annual_dividend_series(stock)
+    except FetchError:
+        raise
+    except:
+        return 0
+    return dividend_trend_classes([(years, dividends)])[0]
+
+
+def dividend_trend_scores(stocks):
+    """
+    Fast score_DIVTREND of many stocks, fitted together.
+    Returns a Series indexed by code.
+    """
+    series = {}
+    for stock in stocks:
+        try:
+            series[stock.code] = annual_dividend_series(stock)
+        except FetchError:
+            raise
+        except:
+            series[stock.code] = (np.array([]), np.array([]))
+    return pd.Series(dividend_trend_classes(list(series.values())), index=list(series), name='score_DIVTREND')
+
+
+# score of the last DIVTREND_MEMO_SIZE annual dividend series classified, by
+# hash of the series, the least recently used ones being dropped first
+DIVTREND_MEMO_SIZE = 100000
+DIVTREND_MEMO = OrderedDict()
+
+
+def series_key(years, dividends, max_breakpoints=3):
+    years = np.asarray(years, dtype=np.float64)
+    dividends = np.asarray(dividends, dtype=np.float64)
+    return hashlib.sha1(f'{max_breakpoints}|'.encode() + years.tobytes() + b'|' + dividends.tobytes()).hexdigest()
+
+
+def dividend_trend_classes(series, max_breakpoints=3):
+    """
+    Classify many (years, dividends) series as score_DIVTREND does.
+    For every number of breakpoints the breakpoints are searched among the
+    years (see segmented_trend_classes), solving the least squares fit of
+    each combination in closed form, for all the series sharing the same
+    years at once. Results are memoized in DIVTREND_MEMO, so recently seen
+    series are not fitted again.
+    """
+    keys = [series_key(years, dividends, max_breakpoints) for years, dividends in series]
+    scores = {}
+    groups = {}
+    for key, (years, dividends) in zip(keys, series):
+        if key in scores:
+            continue
+        if key in DIVTREND_MEMO:
+            DIVTREND_MEMO.move_to_end(key)
+            scores[key] = DIVTREND_MEMO[key]
+        elif len(years) < 3:
+            scores[key] = 0
+        else:
+            years = np.asarray(years, dtype=np.float64)
+            groups.setdefault(years.tobytes(), (years, {}))[1][key] = np.asarray(dividends, dtype=np.float64)
+    for years, pending in groups.values():
+        classes = segmented_trend_classes(years, np.stack(list(pending.values())), max_breakpoints)
+        scores.update(zip(pending, classes))
+    DIVTREND_MEMO.update(scores)
+    while len(DIVTREND_MEMO) > DIVTREND_MEMO_SIZE:
+        DIVTREND_MEMO.popitem(last=False)
+    return [scores[key] for key in keys]
+
+
+def segmented_trend_classes(x, Y, max_breakpoints=3, chunk_size=256, min_points=3):
+    """
+    Trend class of every row of Y against the common abscissa x.
+    Every segment spans at least min_points values of x: in practice the
+    Muggeo fits of piecewise_regression do not converge to shorter segments,
+    and score_DIVTREND_exact never chooses them.
+    """
+    n = len(x)
+    fits = []
+    for n_breakpoints in range(max_breakpoints + 1):
+        if n - 2 - 2*n_breakpoints <= 0:
+            break
+        combos = list(combinations(range(min_points - 1, n - min_points + 1), n_breakpoints))
+        combos = np.array(combos, dtype=int).reshape(len(combos), n_breakpoints)
+        combos = combos[(np.diff(combos, axis=1) >= min_points - 1).all(axis=1)]
+        if not len(combos):
+            continue
+        hinges = np.maximum(0., x[None, None, :] - x[combos][:, :, None])
+        basis = np.concatenate([np.broadcast_to(np.ones(n), (len(combos), 1, n)),
+                                np.broadcast_to(x, (len(combos), 1, n)), hinges], axis=1)
+        gram_inv = np.linalg.pinv(np.einsum('cpn,cqn->cpq', basis, basis))
+        best = np.empty(len(Y), dtype=int)
+        rss = np.empty(len(Y))
+        for start in range(0, len(Y), chunk_size):
+            rows = slice(start, start + chunk_size)
+            moments = np.einsum('cpn,tn->tcp', basis, Y[rows])
+            combo_rss = (Y[rows]**2).sum(axis=1)[:, None] - np.einsum('tcp,cpq,tcq->tc', moments, gram_inv, moments)
+            best[rows] = np.argmin(combo_rss, axis=1)
+            rss[rows] = combo_rss[np.arange(len(best[rows])), best[rows]]
+        bic = n*np.log(np.maximum(rss, 1e-300)/n) + (2 + 2*n_breakpoints)*np.log(n)
+        fits.append((x[combos[best]], bic))
+
+    chosen = np.argmin(np.stack([bic for _, bic in fits]), axis=0)
+    # a straight line (no breakpoint) scores 3, as in score_DIVTREND_exact
+    return [segment_slope_class(x, y, fits[k][0][i]) if len(fits[k][0][i]) else 3
+            for i, (y, k) in enumerate(zip(Y, chosen))]
+
+
+def segment_slope_class(x, y, breakpoints):
+    """
+    5, 3 or 0 whether the slope of the last segment of the piecewise linear
+    fit with the given breakpoints is positive, undetermined or negative at
+    95% confidence. The covariance is the one of the Muggeo linearisation
+    used by piecewise_regression, with the step terms of the breakpoints.
+    """
+    import scipy.stats
+
+    n, n_breakpoints = len(x), len(breakpoints)
+    hinges = [np.maximum(0., x - bp) for bp in breakpoints]
+    steps = [np.heaviside(x - bp, 1) for bp in breakpoints]
+    basis = np.column_stack([np.ones(n), x] + hinges)
+    coefficients = np.linalg.lstsq(basis, y, rcond=None)[0]
+    dof = n - 2 - 2*n_breakpoints
+    sigma2 = ((y - basis @ coefficients)**2).sum() / dof
+    design = np.column_stack([basis] + steps)
+    covariance = sigma2 * np.linalg.pinv(design.T @ design)
+    slope = coefficients[1:].sum()
+    half_width = scipy.stats.t.ppf(0.975, dof) * np.sqrt(covariance[1:n_breakpoints + 2, 1:n_breakpoints + 2].sum())
+    if slope - half_width > 0:
+        return 5
+    elif slope + half_width < 0:
+        return 0
+    return 3
+
+
+def score_DIVTREND_exact(stock):
+    import piecewise_regression
+
     try:
         annual_dividends = stock.annual_dividends.loc[stock.annual_dividends['Year']>=2002]
         ms = piecewise_regression.ModelSelection(annual_dividends['Year'].values, 
                                              annual_dividends['Dividends'].values,
                                              max_breakpoints=3)
+    except FetchError:
+        raise
     except:
         return 0
     model_selector = pd.DataFrame()
@@ -0,0 +1,191 @@
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from invest.stock import Stock
+from invest.cache import SQLiteCache, default_cache, set_default_cache
+from invest.governor import default_governor, set_default_governor
+from invest.loader import preload_history
+from invest.providers import chunks
+from invest.scoring import get_indicators, compute_score
+
+logger = logging.getLogger()
+
+MANIFEST = 'manifest.json'
+
+
+def symbol_list(symbols):
+    """
+    Normalise a symbol list into a list of ticker codes.
+    Parameters:
+    - symbols: a DataFrame returned by invest.loader (SYMBOL column), a Series
+      or any iterable of codes
+    """
+    if isinstance(symbols, pd.DataFrame):
+        symbols = symbols['SYMBOL']
+    return [str(code) for code in pd.Series(symbols).dropna().unique()]
+
+
+def stock_indicators(code, quot_date=None, provider=None):
+    return get_indicators(Stock(code, quot_date=quot_date, provider=provider))
+
+
+def init_worker(governor, cache):
+    # a worker process gets its share of the request budget and the default cache of the parent
+    set_default_governor(governor)
+    set_default_cache(cache)
+
+
+def indicator_batches(codes, quot_date=None, max_workers=8, use_processes=False, chunk_size=100, provider=None):
+    """
+    Compute the indicators of the codes on a bounded worker pool, one batch
+    of codes at a time, so that only the Stock objects of the current batch
+    are alive. Parameters as in screen_universe.
+    Yields, for every batch, a dict code -> one-row indicator frame and a
+    dict code -> error of the failed tickers.
+    With processes, every task receives the code and the provider (pickled
+    without its state, e.g. a ReplayProvider as its path), and every worker
+    uses as its default cache the default cache of the parent: a SQLiteCache
+    is shared through its file, a MemoryCache starts empty in every worker.
+    The bulk price downloads reach the workers only through a SQLiteCache,
+    so they are skipped with any other cache (or none).
+    """
+    cache = default_cache()
+    shared_cache = isinstance(cache, SQLiteCache)
+    if use_processes:
+        # the workers split the request budget of the default governor
+        # and share the default cache
+        pool = ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker,
+                                   initargs=(default_governor().share(max_workers), cache))
+    else:
+        pool = ThreadPoolExecutor(max_workers=max_workers)
+    with pool:
+        for batch in chunks(codes, chunk_size or 100):
+            stocks = [Stock(code, quot_date=quot_date, provider=provider) for code in batch]
+            if chunk_size and (shared_cache or not use_processes):
+                preload_history(stocks, chunk_size)
+            if use_processes:
+                tasks = [(stock_indicators, code, quot_date, provider) for code in batch]
+            else:
+                tasks = [(get_indicators, stock) for stock in stocks]
+            results = {}
+            errors = {}
+            futures = {pool.submit(*task): code for task, code in zip(tasks, batch)}
+            for future in as_completed(futures):
+                code = futures[future]
+                try:
+                    results[code] = future.result()
+                except Exception as e:
+                    logger.warning(f'{code} : {e}')
+                    errors[code] = repr(e)
+            yield results, errors
+
+
+def error_table(errors: dict):
+    return pd.DataFrame({'code': list(errors.keys()), 'error': list(errors.values())})
+
+
+def screen_universe(symbols, quot_date=None, max_workers=8, use_processes=False, chunk_size=100, provider=None):
+    """
+    Compute the indicators of every symbol on a bounded worker pool and score
+    the combined table. A ticker that fails is skipped and its error recorded.
+    Parameters:
+    - symbols: codes to screen, see symbol_list
+    - quot_date: reference date of the screen (None means today)
+    - max_workers: size of the worker pool
+    - use_processes: use a process pool instead of threads, useful when the
+      CPU bound fits dominate over the network (every worker gets a governor
+      with 1/max_workers of the rate of the default one, see RequestGovernor.share)
+    - chunk_size: symbols per batch, with one bulk price download made before
+      each batch starts (None fetches the prices ticker by ticker; with
+      processes the download is made only when the default cache is a
+      SQLiteCache, through which it reaches the workers)
+    - provider: DataProvider of the datasets (the default provider if None)
+    Returns the scored table, sorted by OVERALL_SCORE, and a DataFrame with the
+    code and the error of every failed ticker.
+    """
+    codes = symbol_list(symbols)
+    results = {}
+    errors = {}
+    for batch_results, batch_errors in indicator_batches(codes, quot_date, max_workers, use_processes,
+                                                         chunk_size, provider):
+        results.update(batch_results)
+        errors.update(batch_errors)
+
+    errors = error_table(errors)
+    if not results:
+        return pd.DataFrame(), errors
+    indicators = pd.concat([results[code] for code in codes if code in results],
+                           ignore_index=True)
+    return compute_score(indicators), errors
+
+
+def read_manifest(folder: str):
+    path = os.path.join(folder, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_manifest(folder: str, manifest: dict):
+    # written aside and renamed, so that a crash never leaves half a manifest
+    path = os.path.join(folder, MANIFEST)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(path + '.tmp', path)
+
+
+def screen_to_parquet(symbols, folder: str, quot_date=None, max_workers=8, use_processes=False,
+                      chunk_size=100, provider=None, resume=True):
+    """
+    screen_universe streaming its results to disk: the indicators of every
+    finished batch are written to a new Parquet part in folder and a manifest
+    records the parts and the tickers done, so memory stays flat and a run
+    restarted after a crash resumes from the manifest, screening only the
+    missing tickers (failed ones are tried again).
+    The scored table is computed at the end over all the parts and also
+    written to folder/scored.parquet.
+    Needs pyarrow (pip install invest[parquet]), checked before any ticker
+    is screened.
+    Parameters as in screen_universe, plus:
+    - folder: output folder
+    - resume: continue the run recorded in folder (False starts from scratch)
+    Returns the scored table and the errors, as screen_universe.
+    """
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise ImportError('screen_to_parquet needs pyarrow: pip install invest[parquet]') from e
+    os.makedirs(folder, exist_ok=True)
+    run_date = None if quot_date is None else str(pd.Timestamp(quot_date))
+    manifest = read_manifest(folder) if resume else None
+    if (manifest is not None) and (manifest['quot_date'] != run_date):
+        raise ValueError(f"{folder} holds a screen as of {manifest['quot_date']}, not {run_date}")
+    manifest = manifest or {'quot_date': run_date, 'parts': [], 'done': [], 'errors': {}}
+
+    done = set(manifest['done'])
+    pending = [code for code in symbol_list(symbols) if code not in done]
+    for results, errors in indicator_batches(pending, quot_date, max_workers, use_processes, chunk_size, provider):
+        if results:
+            part = f"part-{len(manifest['parts']):05d}.parquet"
+            indicators = pd.concat(list(results.values()), ignore_index=True)
+            indicators.to_parquet(os.path.join(folder, part), index=False)
+            manifest['parts'].append(part)
+            manifest['done'].extend(results)
+        for code in results:
+            manifest['errors'].pop(code, None)
+        manifest['errors'].update(errors)
+        write_manifest(folder, manifest)
+
+    errors = error_table(manifest['errors'])
+    if not manifest['parts']:
+        return pd.DataFrame(), errors
+    indicators = pd.concat([pd.read_parquet(os.path.join(folder, part)) for part in manifest['parts']],
+                           ignore_index=True)
+    scored = compute_score(indicators)
+    scored.to_parquet(os.path.join(folder, 'scored.parquet'), index=False)
+    return scored, errors
@@ -0,0 +1,205 @@
+import logging
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory, util
+
+import numpy as np
+import pandas as pd
+
+from invest.stock import Stock
+from invest.panel import PANEL_COLUMNS
+
+logger = logging.getLogger()
+
+# shared memory blocks already mapped by this process, by name
+_ATTACHED = {}
+_finalizer = None
+_lock = threading.Lock()
+
+
+def attach(name: str):
+    """
+    Map an existing shared memory block, once per process. The block is
+    left to the process that created it: it is not registered with the
+    resource tracker of this process (which would unlink it, or warn about
+    a leak, when this process exits), and it is unmapped at exit.
+    """
+    global _finalizer
+    if name not in _ATTACHED:
+        if sys.version_info >= (3, 13):
+            memory = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            # SharedMemory registers every block it maps: skip it, since
+            # unregistering afterwards would also drop the registration of
+            # the creator when both share a tracker (the default for pool workers)
+            with _lock:
+                register = resource_tracker.register
+                resource_tracker.register = lambda name, rtype: None
+                try:
+                    memory = shared_memory.SharedMemory(name=name)
+                finally:
+                    resource_tracker.register = register
+        if _finalizer is None:
+            # run at the exit of the workers of a process pool too, unlike atexit
+            _finalizer = util.Finalize(None, detach_all, exitpriority=10)
+        _ATTACHED[name] = memory
+    return _ATTACHED[name]
+
+
+def detach_all():
+    """
+    Unmap the blocks mapped by attach.
+    """
+    for name in list(_ATTACHED):
+        try:
+            _ATTACHED.pop(name).close()
+        except BufferError:
+            # views of the block still alive: the mapping goes with the process
+            pass
+
+
+class SharedHistories:
+    """
+    Price histories of many tickers in one block of shared memory, to hand
+    them to the workers of a process pool without pickling any DataFrame:
+    the block holds the dates (int64 nanoseconds) of all the histories one
+    after the other, then their columns as one float64 array.
+    Pickling a SharedHistories only sends the name of the block and the rows
+    of every ticker; a worker maps the block once and rebuilds the histories
+    as read-only views of it.
+    Create it with SharedHistories.create in the parent, as a context
+    manager, which frees the block at the end.
+    """
+
+    def __init__(self, name: str, rows: int, columns, offsets: dict, timezones: dict):
+        self.name = name
+        self.rows = rows
+        self.columns = columns
+        self.offsets = offsets
+        self.timezones = timezones
+        self.owner = False
+
+    @classmethod
+    def create(cls, histories: dict):
+        """
+        Copy the histories (dict code -> DataFrame as Stock.full_hist) to a
+        new shared memory block.
+        """
+        frames = {code: hist.reindex(columns=PANEL_COLUMNS) for code, hist in histories.items()}
+        rows = sum(len(hist) for hist in frames.values())
+        with _lock:
+            memory = shared_memory.SharedMemory(create=True, size=max(8*rows*(1 + len(PANEL_COLUMNS)), 1))
+        _ATTACHED[memory.name] = memory
+        shared = cls(memory.name, rows, list(PANEL_COLUMNS), {}, {})
+        shared.owner = True
+        dates, values = shared.arrays(writeable=True)
+        start = 0
+        for code, hist in frames.items():
+            end = start + len(hist)
+            dates[start:end] = hist.index.asi8
+            values[start:end] = hist.to_numpy(dtype=np.float64)
+            shared.offsets[code] = (start, end)
+            shared.timezones[code] = None if hist.index.tz is None else str(hist.index.tz)
+            start = end
+        return shared
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['owner'] = False
+        return state
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def arrays(self, writeable=False):
+        """
+        The dates and the values of the block, as numpy arrays on it.
+        """
+        buffer = attach(self.name).buf
+        dates = np.ndarray((self.rows,), dtype=np.int64, buffer=buffer)
+        values = np.ndarray((self.rows, len(self.columns)), dtype=np.float64, buffer=buffer, offset=8*self.rows)
+        dates.flags.writeable = values.flags.writeable = writeable
+        return dates, values
+
+    def history(self, code: str):
+        """
+        Price history of a ticker, a read-only view of the block.
+        """
+        start, end = self.offsets[code]
+        dates, values = self.arrays()
+        index = pd.DatetimeIndex(dates[start:end].view('datetime64[ns]'), name='Date')
+        if self.timezones[code] is not None:
+            index = index.tz_localize('UTC').tz_convert(self.timezones[code])
+        return pd.DataFrame(values[start:end], index=index, columns=self.columns, copy=False)
+
+    def stocks(self, codes, quot_date=None):
+        """
+        Stock objects of some tickers, not cached, with their history seeded from the block.
+        """
+        stocks = []
+        for code in codes:
+            stock = Stock(code, quot_date=quot_date, cache=False)
+            stock.seed('history', self.history(code), prepared=True)
+            stocks.append(stock)
+        return stocks
+
+    def close(self):
+        """
+        Unmap the block, and free it if this process created it.
+        """
+        memory = _ATTACHED.pop(self.name, None)
+        if memory is not None:
+            memory.close()
+            if self.owner:
+                memory.unlink()
+
+
+def trend_scores(shared: SharedHistories, codes, quot_date=None, train_length=120):
+    """
+    detect_trends and dividend_trend_scores of some tickers of a
+    SharedHistories, run in a worker.
+    Returns a list of (code, trend_magnitude, trendline, score_DIVTREND).
+    """
+    from invest.technical_analysis import detect_trends
+    from invest.scoring import dividend_trend_scores
+
+    stocks = shared.stocks(codes, quot_date)
+    trends = detect_trends(stocks, train_length).set_index('code')
+    divtrend = dividend_trend_scores(stocks)
+    return [(code, trends.at[code, 'trend_magnitude'], trends.at[code, 'trendline'], divtrend[code])
+            for code in codes]
+
+
+def parallel_trend_scores(stocks, max_workers=None, tasks_per_worker=4, train_length=120):
+    """
+    Trend and dividend trend scores of many stocks on a process pool. The
+    price histories reach the workers through a SharedHistories, and only
+    the small result tuples travel back.
+    Parameters:
+    - stocks: Stock objects (their histories are downloaded first if needed)
+    - max_workers: size of the process pool (the number of CPUs if None)
+    - tasks_per_worker: chunks of tickers per worker, to balance the load
+    - train_length: bars of the trend fit, as in detect_trend
+    Returns a DataFrame with code, trend_magnitude, trendline and score_DIVTREND.
+    """
+    by_date = {}
+    for stock in stocks:
+        by_date.setdefault(None if stock.is_last else stock.quot_date, []).append(stock)
+    n_tasks = (max_workers or os.cpu_count() or 1)*tasks_per_worker
+    results = []
+    with SharedHistories.create({stock.code: stock.full_hist for stock in stocks}) as shared:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = []
+            for quot_date, group in by_date.items():
+                codes = [stock.code for stock in group]
+                size = max(1, -(-len(codes)//n_tasks))
+                futures += [pool.submit(trend_scores, shared, codes[i:i + size], quot_date, train_length)
+                            for i in range(0, len(codes), size)]
+            for future in futures:
+                results += future.result()
+    return pd.DataFrame(results, columns=['code', 'trend_magnitude', 'trendline', 'score_DIVTREND'])
@@ -1,8 +1,12 @@
 import numpy as np
 import pandas as pd
-import yfinance as yf
 from datetime import datetime
 import logging
+from invest.cache import default_cache
+from invest.asof import AsOfIndex
+from invest.governor import FetchError
+from invest.providers import DATASETS, STATEMENTS, default_provider
+from invest import instrument
 
 logger = logging.getLogger()
 
@@ -17,109 +21,332 @@ CASH = 'Cash'
 CASH_AND_EQ = 'Cash And Cash Equivalents'
 
 
+def extend_history(provider, code, cached):
+    """
+    Append to a cached price history only the bars published after it.
+    The refresh starts from the second to last stored bar, since the last one
+    may have been an incomplete session: if the refresh cannot be merged (see
+    merge_history) the full history is downloaded again.
+    """
+    if not len(cached):
+        return provider.fetch(code, 'history')
+    recent = provider.fetch(code, 'history', start=history_anchor(cached))
+    merged = merge_history(code, cached, recent)
+    return provider.fetch(code, 'history') if merged is None else merged
+
+
+def history_anchor(cached):
+    """
+    First bar of a cached price history that a refresh downloads again.
+    """
+    return cached.index[max(len(cached) - 2, 0)]
+
+
+def merge_history(code, cached, recent):
+    """
+    The cached price history followed by the bars of recent after its anchor,
+    with recent taken in the timezone of cached. Returns None when the full
+    history has to be downloaded again: one of the two is tz-aware and the
+    other is not (an entry stored in another layout), recent misses the anchor
+    bar, or the anchor close changed (a split or a dividend re-adjusted the series).
+    """
+    anchor = history_anchor(cached)
+    tz = getattr(cached.index, 'tz', None)
+    if (tz is None) != (getattr(recent.index, 'tz', None) is None):
+        logger.info(f'{code} : cached history in another timezone layout, downloading the full history')
+        return None
+    if tz is not None:
+        recent = recent.tz_convert(tz)
+    if anchor not in recent.index:
+        return None
+    if not np.isclose(recent.at[anchor, 'Close'], cached.at[anchor, 'Close'], rtol=1e-6, equal_nan=True):
+        logger.info(f'{code} : price adjustment detected, downloading the full history')
+        return None
+    return pd.concat([cached.loc[cached.index <= anchor], recent.loc[recent.index > anchor]])
+
+
+def clean_history(hist, quot_date=None):
+    """
+    Strip the timezone from a raw price history and drop the bars after quot_date.
+    """
+    hist = hist.copy()
+    hist.index = hist.index.map(lambda x : x.replace(tzinfo=None))
+    if quot_date is None:
+        return hist
+    return AsOfIndex(hist).until(quot_date)
+
+
+def transposed_statement(statement):
+    return statement.T.sort_index()
+
+
+# How every raw dataset is kept on the Stock once fetched
+PREPARE_DATASET = {
+    'history': clean_history,
+    'financials': transposed_statement,
+    'quarterly_financials': transposed_statement,
+    'balance_sheet': transposed_statement,
+    'quarterly_balance_sheet': transposed_statement,
+    'cashflow': transposed_statement,
+    'quarterly_cashflow': transposed_statement,
+}
+
+
+class cached_metric:
+    """
+    Property of Stock computed once per instance and quot_date.
+    The raw datasets and the other metrics read while computing it are
+    recorded as its dependencies, so that changing one of them invalidates
+    only the values built on it.
+    """
+
+    def __init__(self, method):
+        self.method = method
+        self.name = method.__name__
+        self.__doc__ = method.__doc__
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, stock, owner=None):
+        if stock is None:
+            return self
+        return stock._metric(self.name, self.method)
+
+
 class Stock:
-    def __init__(self, code: str, name: str = None, quot_date=None):
+    def __init__(self, code: str, name: str = None, quot_date=None, cache=None, provider=None,
+                 reporting_lag=None):
         self.code = code
         self.name = name or code
-        self.ticker = yf.Ticker(code)
-        self._reference_price = None
-        self._hist = None
-        self._info = None
-        self._financials = None
-        self._quarterly_financials = None
-        self._balance_sheet = None
-        self._cashflow = None
-        self._revenue_and_earning = None
-        self._quarterly_balance_sheet = None
-        self._n_shares = None
-        self._quarterly_cashflow = None
-        self.is_last = (quot_date is None)
-        self.quot_date = quot_date or datetime.now()
+        self.provider = provider or default_provider()
+        # delay between the end of a fiscal period and the publication of its
+        # statements: their dates are shifted by it, so that a past quot_date
+        # only sees the statements already published
+        self.reporting_lag = reporting_lag
+        self._ticker = None
+        # None uses the shared default cache, False disables caching
+        self.cache = default_cache() if cache is None else (cache or None)
+        self._datasets = {}
+        self._metrics = {}
+        self._dependents = {}
+        self._computing = []
+        # date up to which the history was read, when a provider with
+        # as_of_reads read it only up to quot_date
+        self._history_until = None
+        self.quot_date = quot_date
+
+    @property
+    def ticker(self):
+        # the raw yfinance Ticker, built on first use: the datasets come from the provider
+        if self._ticker is None:
+            import yfinance as yf
+            self._ticker = yf.Ticker(self.code)
+        return self._ticker
+
+    @property
+    def cache_key(self):
+        # the datasets of different providers are cached apart
+        return self.provider.cache_key(self.code)
+
+    @property
+    def quot_date(self):
+        self._depends_on('quot_date')
+        return self._quot_date
+
+    @quot_date.setter
+    def quot_date(self, quot_date):
+        self._is_last = (quot_date is None)
+        self._quot_date = quot_date or datetime.now()
+        self.invalidate('quot_date')
+        until = self._history_until
+        if (until is not None) and (self._is_last or (pd.Timestamp(self._quot_date) > pd.Timestamp(until))):
+            # the history read so far stops before the new quot_date
+            self._history_until = None
+            self._datasets.pop('history', None)
+            self.invalidate('history')
+
+    @property
+    def is_last(self):
+        self._depends_on('quot_date')
+        return self._is_last
+
+    def _depends_on(self, name: str):
+        if self._computing:
+            self._dependents.setdefault(name, set()).add(self._computing[-1])
+
+    def _metric(self, name: str, method):
+        self._depends_on(name)
+        if name not in self._metrics:
+            self._computing.append(name)
+            try:
+                with instrument.span('property', name, self.code, hit=False):
+                    self._metrics[name] = method(self)
+            finally:
+                self._computing.pop()
+        elif instrument.ACTIVE is not None:
+            instrument.ACTIVE.record(self.code, 'property', name, hit=True)
+        return self._metrics[name]
+
+    def invalidate(self, name: str):
+        """
+        Drop the cached metrics that depend, directly or not, on a raw dataset,
+        on quot_date or on another metric.
+        """
+        pending = [name]
+        while pending:
+            for dependent in self._dependents.pop(pending.pop(), ()):
+                self._metrics.pop(dependent, None)
+                pending.append(dependent)
+
+    def read_until(self, dataset: str):
+        """
+        Date up to which a dataset is read from the provider: quot_date for
+        the history of a past quot_date when the provider has as_of_reads,
+        None (all of it) otherwise.
+        """
+        if (dataset == 'history') and self.provider.as_of_reads and not self._is_last:
+            return self._quot_date
+        return None
+
+    def _fetch(self, dataset: str):
+        """
+        Return the raw yfinance dataset, reading the cache before the network.
+        An expired price history is refreshed incrementally. The data comes
+        from the provider of the Stock (yfinance by default, whose requests go
+        through the default RequestGovernor and raise FetchError when the
+        dataset cannot be downloaded). A history read only up to quot_date
+        (see read_until) is not cached.
+        """
+        end = self.read_until(dataset)
+        if dataset == 'history':
+            self._history_until = end
+        with instrument.span('fetch', dataset, self.code, hit=False) as event:
+            entry = None
+            if self.cache is not None:
+                entry = self.cache.load(self.cache_key, dataset)
+                if (entry is not None) and self.cache.is_fresh(dataset, entry[0]):
+                    event['hit'] = True
+                    return entry[1]
+            if end is not None:
+                return self.provider.fetch(self.code, dataset, end=end)
+            if (dataset == 'history') and (entry is not None):
+                data = extend_history(self.provider, self.code, entry[1])
+            else:
+                data = self.provider.fetch(self.code, dataset)
+            if (self.cache is not None) and (data is not None):
+                self.cache.put(self.cache_key, dataset, data)
+            return data
+
+    def _dataset(self, dataset: str):
+        self._depends_on(dataset)
+        if dataset not in self._datasets:
+            with instrument.span('property', dataset, self.code, hit=False):
+                self._datasets[dataset] = self._prepare(dataset, self._fetch(dataset))
+        elif instrument.ACTIVE is not None:
+            instrument.ACTIVE.record(self.code, 'property', dataset, hit=True)
+        return self._datasets[dataset]
+
+    def seed(self, dataset: str, data, prepared: bool = False):
+        """
+        Provide a raw dataset fetched elsewhere (e.g. by a bulk download).
+        With prepared=True the data is already in the layout kept on the
+        Stock (e.g. a view of a PricePanel) and is stored as it is.
+        """
+        self._datasets[dataset] = data if prepared else self._prepare(dataset, data)
+        self.invalidate(dataset)
+
+    def _prepare(self, dataset: str, data):
+        data = PREPARE_DATASET.get(dataset, lambda x: x)(data)
+        lagged = (self.reporting_lag is not None) and (dataset in STATEMENTS)
+        if lagged and isinstance(getattr(data, 'index', None), pd.DatetimeIndex):
+            data = data.set_axis(data.index + pd.Timedelta(self.reporting_lag), axis=0)
+        return data
+
+    def refresh(self, *datasets):
+        """
+        Download again the given raw datasets (all of them if none is given),
+        dropping their cached copies and the metrics depending on them.
+        """
+        for dataset in (datasets or list(DATASETS)):
+            self._datasets.pop(dataset, None)
+            if self.cache is not None:
+                self.cache.clear(self.cache_key, dataset)
+            self.invalidate(dataset)
 
     @property
     def info(self):
-        if self._info is None:
-            self._info = self.ticker.info
-        return self._info
+        return self._dataset("info")
 
     @property
     def financials(self):
-        if self._financials is None:
-            self._financials = self.ticker.financials.T.sort_index()
-        return self._financials
+        return self._dataset("financials")
 
     @property
     def quarterly_financials(self):
-        if self._quarterly_financials is None:
-            self._quarterly_financials = self.ticker.quarterly_financials.T.sort_index()
-        return self._quarterly_financials
+        return self._dataset("quarterly_financials")
 
     @property
     def balance_sheet(self):
-        if self._balance_sheet is None:
-            self._balance_sheet = self.ticker.balance_sheet.T.sort_index()
-        return self._balance_sheet
+        return self._dataset("balance_sheet")
 
     @property
     def quarterly_balance_sheet(self):
-        if self._quarterly_balance_sheet is None:
-            self._quarterly_balance_sheet = (
-                self.ticker.quarterly_balance_sheet.T.sort_index()
-            )
-        return self._quarterly_balance_sheet
+        return self._dataset("quarterly_balance_sheet")
 
     @property
     def cashflow(self):
-        if self._cashflow is None:
-            self._cashflow = self.ticker.cashflow.T.sort_index()
-        return self._cashflow
+        return self._dataset("cashflow")
 
     @property
     def quarterly_cashflow(self):
-        if self._quarterly_cashflow is None:
-            self._quarterly_cashflow = self.ticker.quarterly_cashflow.T.sort_index()
-        return self._quarterly_cashflow
+        return self._dataset("quarterly_cashflow")
 
     @property
     def revenue_and_earning(self):
-        if self._revenue_and_earning is None:
-            self._revenue_and_earning = self.ticker.earnings
-        return self._revenue_and_earning
+        return self._dataset("earnings")
 
     @property
-    def n_shares(self):
-        if self._n_shares is None:
-            try:
-                if self.is_last:
-                    try:
-                        self._n_shares = float(self.get_info("sharesOutstanding"))
-                    except:
-                        shares = self.ticker.shares
-                        self._n_shares = shares.loc[shares.index == (self.quot_date.year - 1)]['BasicShares'].item()
-                else:
-                    try:
-                        shares = self.ticker.shares
-                        self._n_shares = shares.loc[shares.index == (self.quot_date.year - 1)]['BasicShares'].item()
-                        
-                    except:
-                        self._n_shares = float(self.get_info("sharesOutstanding"))
-            except:
-                self._n_shares = np.nan
-        return self._n_shares
+    def shares(self):
+        return self._dataset("shares")
 
     @property
+    def full_hist(self):
+        return self._dataset("history")
+
+    @cached_metric
+    def n_shares(self):
+        try:
+            if self.is_last:
+                try:
+                    return float(self.get_info("sharesOutstanding"))
+                except FetchError:
+                    raise
+                except:
+                    shares = self.shares
+                    return shares.loc[shares.index == (self.quot_date.year - 1)]['BasicShares'].item()
+            else:
+                try:
+                    shares = self.shares
+                    return shares.loc[shares.index == (self.quot_date.year - 1)]['BasicShares'].item()
+                except FetchError:
+                    raise
+                except:
+                    return float(self.get_info("sharesOutstanding"))
+        except FetchError:
+            raise
+        except:
+            return np.nan
+
+    @cached_metric
     def hist(self):
-        if self._hist is None:
-            self._hist = self.ticker.history(period="max")
-            self._hist.index = self._hist.index.map(lambda x : x.replace(tzinfo=None))
-            self._hist = self._hist.loc[self._hist.index <= pd.to_datetime(self.quot_date)]
-        return self._hist
+        return AsOfIndex(self.full_hist).until(self.quot_date)
 
-    @property
+    @cached_metric
     def dividends(self):
         return self.hist["Dividends"].replace({0: None}).dropna()
 
-    @property
+    @cached_metric
     def annual_dividends(self):
         dividends = self.dividends.reset_index()
         dividends["Year"] = dividends["Date"].dt.year
@@ -130,74 +357,78 @@ class Stock:
     def get_info(self, label):
         try:
             return  self.info[label]
+        except FetchError:
+            raise
         except:
             return None
     
-    @property
+    @cached_metric
     def reference_price(self):
-        if self._reference_price is None:
-            if self.is_last and (self.get_info("previousClose") is not None):
-                self._reference_price = self.get_info("previousClose")
-            else:
-                self._reference_price = self.last_before_quot_date(self.hist)['Close']
-        return self._reference_price
+        if self.is_last and (self.get_info("previousClose") is not None):
+            return self.get_info("previousClose")
+        else:
+            return self.last_before_quot_date(self.hist)['Close']
 
-    @property
+    @cached_metric
     def PB(self):
         return self.reference_price/ self.book_value
     
-    @property
+    @cached_metric
     def market_cap(self):
         if self.is_last and (self.get_info("marketCap") is not None):
             return float(self.get_info("marketCap"))
         else:
             return self.reference_price * self.n_shares
 
-    @property
+    @cached_metric
     def price_to_tangible_book(self):
         return (self.total_assets - self.total_liabilities - self.intangible_assets)/self.market_cap
     
-    @property
+    @cached_metric
     def PTBV(self):
         return self.price_to_tangible_book
     
     
-    @property
+    @cached_metric
     def intangible_assets(self):
         try:
             return self.last_before_quot_date(self.balance_sheet.index)["Intangible Assets"]
+        except FetchError:
+            raise
         except:
             return 0
     
-    @property
+    @cached_metric
     def stockholder_equity(self):
         try:
             if self.is_last:
                 return self.last_before_quot_date(self.quarterly_balance_sheet)["Total Stockholder Equity"]
             else:
                 return self.last_before_quot_date(self.balance_sheet)["Total Stockholder Equity"]
+        except FetchError:
+            raise
         except:
             return self.total_assets - self.total_liabilities
             
-    @property
+    @cached_metric
     def total_assets(self):
         if self.is_last:
             return self.quarterly_balance_sheet[ASSETS].values[-1]
         else:
             return self.last_before_quot_date(self.balance_sheet)[ASSETS]
     
-    @property
+    @cached_metric
     def total_liabilities(self):
         if self.is_last:
             return self.quarterly_balance_sheet[TOTAL_LIAB].values[-1]
         else:
             return self.last_before_quot_date(self.balance_sheet)[TOTAL_LIAB]
  
-    @property
+    @cached_metric
     def earning_per_share(self):
         return self.net_income/self.market_cap
 
-    @property
+    @cached_metric
     def PE(self):
         if self.is_last and (self.get_info("trailingPE") is not None):
             pe_yahoo = float(self.get_info("trailingPE"))
@@ -209,14 +440,14 @@ class Stock:
         else:
             return self.market_cap/self.net_income
 
-    @property
+    @cached_metric
     def net_income(self):
         if self.is_last and (self.get_info("netIncomeToCommon") is not None):
             return self.get_info("netIncomeToCommon")
         else:
             return self.last_before_quot_date(self.financials)['Net Income']
 
-    @property
+    @cached_metric
     def graham_price(self):
         squared_graham = 22.5 * self.book_value * self.earning_per_share
         if squared_graham > 0:
@@ -224,14 +455,14 @@ class Stock:
         else:
             return np.nan
 
-    @property
+    @cached_metric
     def ROA(self):
         if self.is_last and (self.get_info("returnOnAssets") is not None):
             return float(self.get_info("returnOnAssets"))
         else:
             return self.net_income/self.total_assets
     
-    @property
+    @cached_metric
     def quick_ratio(self):
         if self.is_last and (self.get_info("quickRatio") is not None):
             return float(self.get_info("quickRatio"))
@@ -239,109 +470,125 @@ class Stock:
             return (self.total_current_assets - self.inventory)/self.total_current_liabilities
 
 
-    @property
+    @cached_metric
     def book_value(self):
         if self.is_last:
             try:
                 return float(self.get_info("bookValue"))
+            except FetchError:
+                raise
             except:
                 return self.stockholder_equity/self.n_shares
         else:
             return self.stockholder_equity/self.n_shares
 
-    @property
+    @cached_metric
     def ROE(self):
         return self.return_on_equity
 
-    @property
+    @cached_metric
     def price_to_book(self):
         return self.PB
 
-    @property
+    @cached_metric
     def full_time_employees(self):
         if self.get_info('fullTimeEmployees') is not None:
             return float(self.get_info('fullTimeEmployees'))
         else:
             return np.nan
 
-    @property
+    @cached_metric
     def return_on_equity(self):
         if self.is_last:
             try:
                 return float(self.get_info("returnOnEquity"))
+            except FetchError:
+                raise
             except Exception as e:
                 logger.warn(f'{e} : {e.__doc__}')
                 return self.net_income/self.stockholder_equity
         else:
             return self.net_income/self.stockholder_equity
     
-    @property
+    @cached_metric
     def total_current_assets(self):
         try:
             return self.last_before_quot_date(self.balance_sheet)[CURRENT_ASSETS]
+        except FetchError:
+            raise
         except:
             return self.total_assets
  
-    @property
+    @cached_metric
     def inventory(self):
         try:
             return self.last_before_quot_date(self.balance_sheet)["Inventory"]
+        except FetchError:
+            raise
         except:
             return 0 #Insurance and banks do not have inventory
 
-    @property
+    @cached_metric
     def working_capital_per_share(self):
         return (self.total_current_assets - self.total_current_liabilities) / self.n_shares
 
-    @property
+    @cached_metric
     def total_current_liabilities(self):
         try:
             if self.is_last:
                 return self.last_before_quot_date(self.balance_sheet[CURRENT_LIAB])
             else:
                 return self.last_before_quot_date(self.quarterly_balance_sheet)[CURRENT_LIAB]
+        except FetchError:
+            raise
         except:
             return self.total_liabilities
 
-    @property
+    @cached_metric
     def net_current_assets_per_share(self):
         return (self.total_current_assets - self.total_liabilities) / self.n_shares
 
-    @property
+    @cached_metric
     def total_debt(self):
         if self.is_last and (self.get_info("totalDebt") is not None):
             return self.get_info("totalDebt")
         else:
             return self.last_before_quot_date(self.balance_sheet)[['Long Term Debt', CURRENT_LIAB]].sum()
 
-    @property
+    @cached_metric
     def net_cash_per_share(self):
         return (self.cash - self.total_debt) / self.n_shares
 
-    @property
+    @cached_metric
     def cash(self):
         if self.is_last and (self.get_info("totalCash") is not None):
             return self.get_info("totalCash")
         elif self.is_last and len(self.quarterly_balance_sheet):
             try:
                 return self.last_before_quot_date(self.quarterly_balance_sheet)[CASH]
+            except FetchError:
+                raise
             except:
                 return self.last_before_quot_date(self.quarterly_balance_sheet)[CASH_AND_EQ]
         else:
             try:
                 return self.last_before_quot_date(self.balance_sheet)[CASH]
+            except FetchError:
+                raise
             except:
                 return self.last_before_quot_date(self.balance_sheet)[CASH_AND_EQ]
 
 
-    @property
+    @cached_metric
     def payout_ratio(self):
         try:
             return  self.last_dividend / self.EPS
+        except FetchError:
+            raise
         except:
             return np.nan
 
-    @property
+    @cached_metric
     def last_dividend(self):
         if self.is_last and (self.get_info("dividendRate") is not None):
             return  self.get_info("dividendRate")
@@ -351,71 +598,75 @@ class Stock:
             return 0
 
 
-    @property
+    @cached_metric
     def dividend_yeld(self):
         return  self.last_dividend/self.reference_price
 
-    @property
+    @cached_metric
     def operating_cash_flow(self):
         if self.is_last and (self.get_info("operatingCashflow") is not None) :
             return np.float(self.get_info("operatingCashflow"))
         else:
             return np.float( self.last_before_quot_date(self.cashflow)[OPERATING_CASHFLOW])
 
-    @property
+    @cached_metric
     def price_to_cash_flow(self):
         try:
             return self.market_cap/ self.operating_cash_flow
+        except FetchError:
+            raise
         except:
             return np.nan
  
-    @property
+    @cached_metric
     def price_to_free_cash_flow(self):
         return self.market_cap / self.free_cash_flow
 
-    @property
+    @cached_metric
     def free_cash_flow(self):
         if self.is_last and (self.get_info("freeCashflow") is not None):
             return np.float(self.get_info("freeCashflow"))
         elif self.is_last and len(self.quarterly_cashflow):
-            return self.quarterly_cashflow[FREE_CASHFLOW]
+            return self.last_before_quot_date(self.quarterly_cashflow)[FREE_CASHFLOW]
         else:
             try:
                 return self.last_before_quot_date(self.cashflow)[FREE_CASHFLOW]
+            except FetchError:
+                raise
             except:
                 return self.operating_cash_flow - self.capital_expenditures
 
-    @property
+    @cached_metric
     def capital_expenditures(self):
         return self.last_before_quot_date(self.cashflow)["Capital Expenditures"]
  
-    @property
+    @cached_metric
     def revenue(self):
         if self.is_last and (self.get_info("totalRevenue") is not None):
             return self.get_info("totalRevenue")
         else:
             return self.last_before_quot_date(self.financials)["Total Revenue"]
  
-    @property
+    @cached_metric
     def net_income_per_employee(self):
         return self.net_income/self.full_time_employees
 
-    @property
+    @cached_metric
     def revenue_per_employee(self):
         return  self.revenue/self.full_time_employees
-    @property
+    @cached_metric
     def earning_per_share(self):
         return  self.net_income/self.n_shares     
 
-    @property
+    @cached_metric
     def EPS(self):
         return self.earning_per_share
 
-    @property
+    @cached_metric
     def ROCE(self):
         return self.EBIT/(self.total_assets - self.total_current_liabilities)
 
-    @property
+    @cached_metric
     def EBIT(self):
         if 0:#self.is_last and len(self.quarterly_financials) and (EBIT in self.quarterly_financials.columns):
             return self.last_before_quot_date(self.quarterly_financials)[EBIT]
@@ -424,14 +675,14 @@ class Stock:
         else:
             return self.pretax_income + self.interest_expense
 
-    @property
+    @cached_metric
     def pretax_income(self):
         if 0:#self.is_last and len(self.quarterly_financials):
             return self.last_before_quot_date(self.quarterly_financials)['Pretax Income']
         else:
             return self.last_before_quot_date(self.financials)['Pretax Income']
     
-    @property
+    @cached_metric
     def interest_expense(self):
         if 0:#self.is_last and len(self.quarterly_financials):
             return self.last_before_quot_date(self.quarterly_financials)['Interest Expense']
@@ -440,7 +691,7 @@ class Stock:
 
     @staticmethod
     def last_before(df, date):
-        return df.loc[df.index < date].iloc[-1]
+        return AsOfIndex(df).last_before(date)
 
     def last_before_quot_date(self, df):
         return self.last_before(df, self.quot_date)
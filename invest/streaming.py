@@ -0,0 +1,352 @@
+import numpy as np
+
+from invest.technical_analysis import fast_trend
+
+
+def bar_value(bar, field: str):
+    """
+    A field (Close, High, ...) of a bar: a row of Stock.hist, a dict, or a
+    bare number taken as the close.
+    """
+    if np.isscalar(bar):
+        return float(bar)
+    return float(bar[field])
+
+
+class StreamingIndicator:
+    """
+    Indicator updated one bar at a time, in O(1), with the same values as
+    the function of invest.indicators of the same name on the whole history.
+    Initialise it once from a price history, then feed it the new bars:
+        rsi = RSI(14).initialise(stock.hist)
+        rsi.update(bar)
+    A bar with a missing value leaves the state as it is and returns NaN.
+    """
+    # columns of the history the indicator is computed on
+    fields = ('Close',)
+
+    def initialise(self, hist):
+        for row in hist[list(self.fields)].to_numpy(dtype=np.float64):
+            self.push(*row)
+        return self
+
+    def update(self, bar):
+        return self.push(*(bar_value(bar, field) for field in self.fields))
+
+    def push(self, *values):
+        raise NotImplementedError
+
+
+class RingBuffer:
+    """
+    The last `size` values pushed, in a fixed array.
+    """
+
+    def __init__(self, size: int):
+        self.values = np.full(size, np.nan)
+        self.position = 0
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, len(self.values))
+
+    def push(self, value):
+        """
+        Store a value, returning the one it replaces (NaN while not full).
+        """
+        evicted = self.values[self.position]
+        self.values[self.position] = value
+        self.position = (self.position + 1) % len(self.values)
+        self.count += 1
+        return evicted
+
+    def ordered(self):
+        """
+        The values from the oldest to the newest.
+        """
+        if self.count < len(self.values):
+            return self.values[:self.count].copy()
+        return np.roll(self.values, -self.position)
+
+
+class EMA(StreamingIndicator):
+    """
+    Exponential moving average, see indicators.ema. alpha overrides span,
+    min_periods is the number of values before the first result.
+    """
+
+    def __init__(self, span=20, alpha=None, min_periods=0):
+        self.alpha = alpha or 2./(span + 1)
+        self.min_periods = min_periods
+        self.count = 0
+        self.average = np.nan
+
+    @property
+    def value(self):
+        return self.average if self.count >= self.min_periods else np.nan
+
+    def push(self, value):
+        if np.isnan(value):
+            return np.nan
+        self.count += 1
+        if self.count == 1:
+            self.average = value
+        else:
+            self.average = self.alpha*value + (1. - self.alpha)*self.average
+        return self.value
+
+
+class RollingWindow(StreamingIndicator):
+    """
+    Mean and population standard deviation of the last `window` values, from
+    running sums kept over a RingBuffer. The sums are taken again from the
+    buffer once every `window` values, so that rounding errors cannot build
+    up. A missing value empties the window, as in indicators.rolling_mean.
+    """
+
+    def __init__(self, window=20):
+        self.buffer = RingBuffer(window)
+        self.window = window
+        self.valid = 0
+        self.reference = None
+        self.sum = 0.
+        self.squares = 0.
+
+    def push(self, value):
+        if np.isnan(value):
+            self.valid = 0
+            return np.nan
+        if self.reference is None:
+            self.reference = value
+        x = value - self.reference
+        evicted = self.buffer.push(x)
+        self.valid += 1
+        if self.buffer.count % self.window == 0:
+            self.sum = np.nansum(self.buffer.values)
+            self.squares = np.nansum(self.buffer.values**2)
+        else:
+            self.sum += x - (0. if np.isnan(evicted) else evicted)
+            self.squares += x*x - (0. if np.isnan(evicted) else evicted*evicted)
+        return self.mean
+
+    @property
+    def full(self):
+        return self.valid >= self.window
+
+    @property
+    def mean(self):
+        return self.sum/self.window + self.reference if self.full else np.nan
+
+    @property
+    def std(self):
+        if not self.full:
+            return np.nan
+        mean = self.sum/self.window
+        return np.sqrt(max(self.squares/self.window - mean*mean, 0.))
+
+
+class SMA(RollingWindow):
+    """
+    Simple moving average, see indicators.sma.
+    """
+
+    @property
+    def value(self):
+        return self.mean
+
+
+class Bollinger(RollingWindow):
+    """
+    Bollinger bands (middle, upper, lower), see indicators.bollinger.
+    """
+
+    def __init__(self, window=20, k=2.):
+        super().__init__(window)
+        self.k = k
+
+    def push(self, value):
+        super().push(value)
+        return self.value
+
+    @property
+    def value(self):
+        return self.mean, self.mean + self.k*self.std, self.mean - self.k*self.std
+
+
+class RSI(StreamingIndicator):
+    """
+    Relative strength index, see indicators.rsi.
+    """
+
+    def __init__(self, window=14):
+        self.gains = EMA(alpha=1./window, min_periods=window)
+        self.losses = EMA(alpha=1./window, min_periods=window)
+        self.previous = np.nan
+
+    def push(self, close):
+        if np.isnan(close):
+            return np.nan
+        if not np.isnan(self.previous):
+            change = close - self.previous
+            self.gains.push(max(change, 0.))
+            self.losses.push(max(-change, 0.))
+        self.previous = close
+        return self.value
+
+    @property
+    def value(self):
+        gains, losses = self.gains.value, self.losses.value
+        return 100*gains/(gains + losses) if gains + losses > 0 else np.nan
+
+
+class MACD(StreamingIndicator):
+    """
+    MACD line, signal line and their difference, see indicators.macd.
+    """
+
+    def __init__(self, fast=12, slow=26, signal=9):
+        self.fast = EMA(fast)
+        self.slow = EMA(slow)
+        self.signal = EMA(signal)
+
+    def push(self, close):
+        if np.isnan(close):
+            return (np.nan,)*3
+        line = self.fast.push(close) - self.slow.push(close)
+        signal = self.signal.push(line)
+        return line, signal, line - signal
+
+    @property
+    def value(self):
+        line = self.fast.value - self.slow.value
+        return line, self.signal.value, line - self.signal.value
+
+
+class ATR(StreamingIndicator):
+    """
+    Average true range, see indicators.atr.
+    """
+    fields = ('High', 'Low', 'Close')
+
+    def __init__(self, window=14):
+        self.average = EMA(alpha=1./window, min_periods=window)
+        self.previous = np.nan
+
+    def push(self, high, low, close):
+        if np.isnan(close):
+            return np.nan
+        true_range = np.nanmax([high - low, abs(high - self.previous), abs(low - self.previous)])
+        self.previous = close
+        return self.average.push(true_range)
+
+    @property
+    def value(self):
+        return self.average.value
+
+
+class Trend(StreamingIndicator):
+    """
+    Trend of detect_trend kept up to date bar by bar. The breakpoint is
+    found by fast_trend on the last train_length closes when the indicator
+    is initialised, then the trendline of the log closes after it is a least
+    squares line, whose sums are updated in O(1) by every new bar (and by the
+    bars leaving the window). Searching the breakpoint again is an
+    O(train_length^2) step, made only by refit() or, with refit_every, once
+    every refit_every bars (never by default).
+    Note that the line is fitted by least squares and not by the Theil-Sen
+    estimator of detect_trend, so the values are close but not equal.
+    The value is (trend_magnitude, trendline), as returned by detect_trend.
+    """
+
+    def __init__(self, train_length=120, min_segment=10, refit_every=None):
+        self.train_length = train_length
+        self.min_segment = min_segment
+        self.refit_every = refit_every
+        self.closes = RingBuffer(train_length)
+        # sums of the least squares fit of log close on t, t counted from origin
+        self.origin = 0
+        self.segment_start = 0
+        self.since_refit = 0
+        self.sums = np.zeros(5)
+
+    def initialise(self, hist):
+        for close in hist['Close'].dropna().to_numpy(dtype=np.float64)[-self.train_length:]:
+            self.closes.push(close)
+        self.refit()
+        return self
+
+    @property
+    def bars(self):
+        return self.closes.count
+
+    def refit(self, search=True):
+        """
+        Search the breakpoint again (unless search is False) and recompute
+        the sums from the window.
+        """
+        window = self.closes.ordered()
+        first = self.bars - len(window)
+        if search:
+            breakpoint = -1
+            if len(window) > 2*self.min_segment:
+                breakpoint = fast_trend(window[None, :], self.min_segment)[2][0]
+            self.segment_start = first + max(breakpoint, -1) + 1
+        self.origin = self.segment_start
+        self.since_refit = 0
+        self.sums[:] = 0.
+        for position in range(self.segment_start - first, len(window)):
+            self.add(first + position, window[position], 1.)
+
+    def add(self, bar, close, sign):
+        t = bar - self.origin
+        y = np.log(close)
+        self.sums += sign*np.array([1., t, t*t, y, t*y])
+
+    def push(self, close):
+        if np.isnan(close):
+            return (np.nan,)*2
+        bar = self.bars
+        evicted = self.closes.push(close)
+        self.add(bar, close, 1.)
+        first = self.bars - len(self.closes)
+        if self.segment_start < first:
+            # the oldest bar of the segment left the window
+            self.add(first - 1, evicted, -1.)
+            self.segment_start = first
+        self.since_refit += 1
+        if self.refit_every and self.since_refit >= self.refit_every:
+            self.refit()
+        elif bar - self.origin > 4*self.train_length:
+            # count t from the segment start again, to keep the sums small
+            self.refit(search=False)
+        return self.value
+
+    @property
+    def value(self):
+        n, st, stt, sy, sty = self.sums
+        denominator = n*stt - st*st
+        if n < 2 or denominator <= 0:
+            return np.nan, np.nan
+        slope = (n*sty - st*sy)/denominator
+        intercept = (sy - slope*st)/n
+        last = self.bars - 1 - self.origin
+        return np.exp(slope*365) - 1, np.exp(intercept + slope*last)
+
+
+class Watch:
+    """
+    Streaming indicators of one ticker, initialised from its history:
+        watch = Watch(stock.hist, rsi=RSI(14), trend=Trend())
+        watch.update(bar)
+    Returns a dict name -> value at every update.
+    """
+
+    def __init__(self, hist, **indicators):
+        self.indicators = {name: indicator.initialise(hist) for name, indicator in indicators.items()}
+
+    def update(self, bar):
+        return {name: indicator.update(bar) for name, indicator in self.indicators.items()}
+
+    @property
+    def values(self):
+        return {name: getattr(indicator, 'value', None) for name, indicator in self.indicators.items()}
@@ -1,10 +1,38 @@
-import piecewise_regression
-from sklearn.linear_model import TheilSenRegressor
-from invest.plot import plot_candle, trendline, piecewise_regression_results
 import numpy as np
+import pandas as pd
 
 
-def detect_trend(stock, train_length = 120, verbose=True):
+def detect_trend(stock, train_length = 120, verbose=True, exact=False):
+    """
+    Estimate the current trend of the stock price: the breakpoint of a one
+    breakpoint piecewise linear fit of the log prices over the last
+    train_length bars, then a robust line on the bars after it.
+    Returns the relative change of the trendline over 365 bars and the last
+    value of the trendline.
+    With exact=True the breakpoint is fitted by piecewise_regression and the
+    line by scikit-learn TheilSenRegressor, otherwise the fast estimator of
+    fast_trend is used.
+    """
+    if exact:
+        return detect_trend_exact(stock, train_length, verbose)
+
+    closes = stock.hist['Close'].dropna()
+    window = closes.values[-train_length:]
+    trend_magnitude, last_value_trendline, breakpoint, slope, intercept = fast_trend(window[None, :])
+    if verbose:
+        from invest.plot import plot_candle, trendline
+        current_trend = stock.hist.dropna(subset=['Close']).tail(len(window) - 1 - breakpoint[0]).reset_index()
+        x = np.arange(len(window) - len(current_trend), len(window))
+        current_trend['predicted_trend'] = np.exp(intercept[0] + slope[0]*x)*window[-1]
+        plot_candle(current_trend, trendline).show()
+    return trend_magnitude[0], last_value_trendline[0]
+
+
+def detect_trend_exact(stock, train_length = 120, verbose=True):
+    import piecewise_regression
+    from sklearn.linear_model import TheilSenRegressor
+    from invest.plot import plot_candle, trendline, piecewise_regression_results
+
     full_hist = stock.hist.reset_index()
     data_norm = max(full_hist.reset_index()['index'])
     full_hist = full_hist.reset_index()
@@ -42,4 +70,101 @@ def detect_trend(stock, train_length = 120, verbose=True):
         pw_fit.summary()
         piecewise_regression_results(pw_fit)
         plot_candle(current_trend, trendline).show()
-    return trend_magnitude.item(), current_trend.tail(1)['predicted_trend'].item()
\ No newline at end of file
+    return trend_magnitude.item(), current_trend.tail(1)['predicted_trend'].item()
+
+
+def breakpoint_search(y, min_segment=10):
+    """
+    Best breakpoint of a continuous one breakpoint piecewise linear fit of
+    every row of y, searched exhaustively over the bars: for every candidate
+    the least squares fit on the basis (1, t, max(0, t - k)) is solved in
+    closed form, all candidates and rows at once.
+    Returns the breakpoint position of every row (-1 when the window is too
+    short to split).
+    """
+    n_rows, length = y.shape
+    candidates = np.arange(min_segment, length - min_segment)
+    if not len(candidates):
+        return np.full(n_rows, -1)
+    t = np.arange(length, dtype=np.float64)
+    hinge = np.maximum(0., t[None, :] - candidates[:, None])
+    basis = np.stack([np.ones_like(hinge), np.broadcast_to(t, hinge.shape), hinge], axis=1)
+    gram_inv = np.linalg.inv(np.einsum('kit,kjt->kij', basis, basis))
+    moments = np.einsum('kit,rt->rki', basis, y)
+    coefficients = np.einsum('kij,rkj->rki', gram_inv, moments)
+    sse = (y**2).sum(axis=1)[:, None] - np.einsum('rki,rki->rk', coefficients, moments)
+    return candidates[np.argmin(sse, axis=1)]
+
+
+def median_slopes(y, start):
+    """
+    Theil-Sen line of every row of y over the bars after start: the median of
+    the pairwise slopes and the median intercept. Pairs outside the segment
+    are masked, so rows with different breakpoints are handled together.
+    """
+    n_rows, length = y.shape
+    t = np.arange(length, dtype=np.float64)
+    valid = t[None, :] > start[:, None]
+    i, j = np.triu_indices(length, k=1)
+    slopes = (y[:, j] - y[:, i]) / (j - i)
+    slopes[~(valid[:, i] & valid[:, j])] = np.nan
+    slope = np.nanmedian(slopes, axis=1)
+    residuals = np.where(valid, y - slope[:, None]*t[None, :], np.nan)
+    intercept = np.nanmedian(residuals, axis=1)
+    return slope, intercept
+
+
+def fast_trend(closes, min_segment=10, chunk_size=256):
+    """
+    Vectorised trend estimator over many tickers at once.
+    Parameters:
+    - closes: 2-D array, one row per ticker with its last closes (same length)
+    - min_segment: minimum number of bars on each side of the breakpoint
+    - chunk_size: rows processed together, to bound the memory of the
+      pairwise slopes
+    Returns, per row, the relative change of the trendline over 365 bars,
+    the last value of the trendline, the breakpoint position and the slope
+    and intercept of the log trendline normalised by the last close.
+    """
+    closes = np.atleast_2d(np.asarray(closes, dtype=np.float64))
+    y = np.log(closes / closes[:, -1:])
+    breakpoint = np.empty(len(y), dtype=int)
+    slope = np.empty(len(y))
+    intercept = np.empty(len(y))
+    for start in range(0, len(y), chunk_size):
+        rows = slice(start, start + chunk_size)
+        breakpoint[rows] = breakpoint_search(y[rows], min_segment)
+        slope[rows], intercept[rows] = median_slopes(y[rows], breakpoint[rows])
+    last = closes.shape[1] - 1
+    trend_magnitude = np.exp(slope*365) - 1
+    last_value_trendline = np.exp(intercept + slope*last)*closes[:, -1]
+    return trend_magnitude, last_value_trendline, breakpoint, slope, intercept
+
+
+def detect_trends(stocks, train_length = 120, min_segment=10):
+    """
+    Fast detect_trend of many stocks, fitted together in batches of windows
+    with the same length.
+    Returns a DataFrame with code, trend_magnitude and trendline.
+    """
+    windows = {}
+    for stock in stocks:
+        windows[stock.code] = stock.hist['Close'].dropna().values[-train_length:]
+    return window_trends(windows, min_segment)
+
+
+def window_trends(windows, min_segment=10):
+    """
+    fast_trend of a dict code -> last closes, the windows with the same
+    length fitted together.
+    """
+    result = pd.DataFrame(index=list(windows), columns=['trend_magnitude', 'trendline'], dtype=float)
+    lengths = pd.Series({code: len(window) for code, window in windows.items()})
+    for length, codes in lengths.groupby(lengths).groups.items():
+        if length < 2:
+            continue
+        closes = np.stack([windows[code] for code in codes])
+        trend_magnitude, last_value_trendline, *_ = fast_trend(closes, min_segment)
+        result.loc[codes, 'trend_magnitude'] = trend_magnitude
+        result.loc[codes, 'trendline'] = last_value_trendline
+    return result.rename_axis('code').reset_index()
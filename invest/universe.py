@@ -0,0 +1,231 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from invest.asof import AsOfIndex
+from invest.stock import Stock
+from invest.loader import preload_history
+from invest.fundamental_analysis import INDICATOR_COLUMNS
+from invest.scoring import compute_score, dividend_trend_classes
+from invest import indicators
+
+logger = logging.getLogger()
+
+# info field -> column of the static attribute table
+INFO_FIELDS = {
+    'sector': 'sector',
+    'shortName': 'name',
+    'currency': 'currency',
+    'longBusinessSummary': 'description',
+}
+
+
+class Universe:
+    """
+    Aligned price data of a universe of tickers, for cross-sectional work:
+    close, volume and dividends as dates x tickers DataFrames on the union
+    of the dates (missing where a ticker has no bar), and a table of static
+    attributes from info, indexed by code.
+    Parameters:
+    - close, volume, dividends: dates x tickers DataFrames with the same index and columns
+    - info: static attributes, indexed by code (columns of INFO_FIELDS)
+    - fundamentals: fundamental indicators, as fundamental_indicators_table,
+      used by indicators() and score()
+    - quot_date: reference date (None means today, as for Stock)
+    """
+
+    def __init__(self, close, volume, dividends, info=None, fundamentals=None, quot_date=None):
+        self.close = close
+        self.volume = volume
+        self.dividends = dividends
+        self.info = info if info is not None else pd.DataFrame(index=close.columns, columns=list(INFO_FIELDS.values()))
+        self.fundamentals = fundamentals
+        self.quot_date = quot_date
+
+    @classmethod
+    def from_histories(cls, histories: dict, info=None, fundamentals=None, quot_date=None):
+        """
+        Universe of dict code -> price history, in the layout of Stock.full_hist.
+        """
+        fields = {}
+        for column in ('Close', 'Volume', 'Dividends'):
+            fields[column] = pd.concat({code: hist[column] for code, hist in histories.items()}, axis=1).sort_index()
+        return cls(fields['Close'], fields['Volume'], fields['Dividends'], info, fundamentals, quot_date)
+
+    @classmethod
+    def from_symbols(cls, symbols, quot_date=None, provider=None, chunk_size=100, max_workers=8, with_info=True):
+        """
+        Universe of a symbol list of invest.loader (or a list of codes): the
+        histories are downloaded in bulk as in preload_history and the info
+        of the tickers on a pool of max_workers threads (with_info=False skips it).
+        Tickers without a price history are left out.
+        """
+        from invest.screener import symbol_list
+
+        stocks = [Stock(code, quot_date=quot_date, provider=provider) for code in symbol_list(symbols)]
+        preload_history(stocks, chunk_size)
+        stocks = [stock for stock in stocks if 'history' in stock._datasets and len(stock.full_hist)]
+        info = info_table(stocks, max_workers) if with_info else None
+        return cls.from_histories({stock.code: stock.full_hist for stock in stocks}, info, quot_date=quot_date)
+
+    @classmethod
+    def from_panel(cls, panel, info=None, fundamentals=None, quot_date=None):
+        """
+        Universe on the mapped columns of a PricePanel, without copies.
+        """
+        return cls(panel.field('Close', quot_date), panel.field('Volume', quot_date),
+                   panel.field('Dividends', quot_date), info, fundamentals, quot_date)
+
+    @property
+    def codes(self):
+        return list(self.close.columns)
+
+    @property
+    def dates(self):
+        return self.close.index
+
+    @property
+    def reference_date(self):
+        return pd.Timestamp(self.quot_date or datetime.now())
+
+    def as_of(self, quot_date):
+        """
+        The universe up to quot_date included, as slices of the matrices.
+        """
+        end = AsOfIndex(self.close).until(quot_date).shape[0]
+        return Universe(self.close.iloc[:end], self.volume.iloc[:end], self.dividends.iloc[:end],
+                        self.info, self.fundamentals, quot_date)
+
+    def last(self, field='close'):
+        """
+        Last value of every ticker before the reference date, as
+        Stock.reference_price reads the close of a past quot_date.
+        """
+        frame = getattr(self, field)
+        position = AsOfIndex(frame).position(self.reference_date)
+        if position < 0:
+            return pd.Series(np.nan, index=frame.columns)
+        return frame.iloc[:position + 1].ffill().iloc[-1]
+
+    def returns(self, periods=1, log=False):
+        """
+        Returns over `periods` dates, missing where either close is.
+        """
+        ratio = self.close/self.close.shift(periods)
+        return np.log(ratio) if log else ratio - 1
+
+    def rolling(self, window=20, field='close', statistic='mean'):
+        """
+        Rolling mean or std of a field (close, volume, dividends or returns)
+        of all the tickers, see indicators.rolling_moments.
+        """
+        frame = self.returns() if field == 'returns' else getattr(self, field)
+        mean, std = indicators.rolling_moments(frame.to_numpy(dtype=np.float64), window)
+        return pd.DataFrame({'mean': mean, 'std': std}[statistic], index=frame.index, columns=frame.columns)
+
+    def correlation(self, window=250):
+        """
+        Correlation matrix of the daily returns over the last `window` dates.
+        """
+        return self.returns().iloc[-window:].corr()
+
+    def rank(self, values, by=None):
+        """
+        Percentile rank of a value per ticker across the universe, or within
+        the groups of an info column (e.g. by='sector').
+        """
+        if by is None:
+            return values.rank(pct=True)
+        return values.groupby(self.info[by].reindex(values.index)).rank(pct=True)
+
+    def aggregate(self, values, by='sector', func='median'):
+        """
+        A value per ticker aggregated over the groups of an info column.
+        """
+        return values.groupby(self.info[by].reindex(values.index)).agg(func)
+
+    def trends(self, train_length=120, min_segment=10):
+        """
+        detect_trends of every ticker, indexed by code.
+        """
+        from invest.technical_analysis import window_trends
+
+        close = AsOfIndex(self.close).until(self.reference_date)
+        windows = {code: close[code].dropna().values[-train_length:] for code in self.codes}
+        return window_trends(windows, min_segment).set_index('code')
+
+    def annual_dividends(self):
+        """
+        Dividends paid every year, years x tickers, missing in the years
+        without any (Stock.annual_dividends of every ticker).
+        """
+        dividends = AsOfIndex(self.dividends).until(self.reference_date)
+        dividends = dividends.where(dividends != 0)
+        return dividends.groupby(dividends.index.year).sum(min_count=1)
+
+    def dividend_scores(self):
+        """
+        #div_past20y and score_DIVTREND of every ticker, indexed by code.
+        """
+        annual = self.annual_dividends()
+        year = self.reference_date.year
+        past = annual.loc[(annual.index >= year - 20) & (annual.index < year)]
+        recent = annual.loc[annual.index >= 2002]
+        series = [(recent.index.values[recent[code].notna().values], recent[code].dropna().values)
+                  for code in self.codes]
+        return pd.DataFrame({'#div_past20y': past.notna().sum().reindex(self.codes).values,
+                             'score_DIVTREND': dividend_trend_classes(series)}, index=self.codes)
+
+    def indicators(self, fundamentals=None):
+        """
+        Indicator table of the universe, with the columns of get_indicators,
+        ready for compute_score: the fundamental columns come from the
+        fundamentals table (the one of the universe if None); without one,
+        only the Reference Price and the Dividend yeld are filled, from the
+        prices as Stock does for a past quot_date.
+        """
+        fundamentals = self.fundamentals if fundamentals is None else fundamentals
+        codes = self.codes
+        price = self.last('close')
+        dividends = self.dividend_scores()
+        if fundamentals is not None:
+            table = fundamentals.set_index('code').reindex(codes).rename_axis('code').reset_index()
+        else:
+            table = pd.DataFrame(np.nan, index=range(len(codes)), columns=INDICATOR_COLUMNS)
+            table['Reference Price'] = price.values
+            annual = self.annual_dividends().ffill().iloc[-1] if len(self.dates) else pd.Series(dtype=float)
+            table['Dividend yeld'] = annual.reindex(codes).fillna(0).values/price.values
+            table.insert(0, 'Date', self.reference_date)
+            table.insert(0, 'name', self.info['name'].reindex(codes).values)
+            table.insert(0, 'code', codes)
+        trends = self.trends().reindex(codes)
+        table['trendline'] = trends['trendline'].values
+        table['trend_magnitude'] = trends['trend_magnitude'].values
+        table['price_over_trend'] = table['Reference Price'].values/trends['trendline'].values
+        table['sector'] = self.info['sector'].reindex(codes).values
+        table['description'] = self.info['description'].reindex(codes).values
+        table['#div_past20y'] = dividends['#div_past20y'].values
+        table['score_DIVTREND'] = dividends['score_DIVTREND'].values
+        return table
+
+    def score(self, fundamentals=None):
+        """
+        compute_score of the indicator table of the universe.
+        """
+        return compute_score(self.indicators(fundamentals))
+
+
+def info_table(stocks, max_workers=8):
+    """
+    Static attributes (INFO_FIELDS) of many stocks, indexed by code.
+    """
+    def attributes(stock):
+        return [stock.get_info(field) for field in INFO_FIELDS]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        rows = list(pool.map(attributes, stocks))
+    return pd.DataFrame(rows, index=pd.Index([stock.code for stock in stocks], name='code'),
+                        columns=list(INFO_FIELDS.values()))
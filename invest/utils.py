@@ -1,6 +1,5 @@
 import os
 from functools import reduce
-from sklearn.metrics import mean_squared_error
 import numpy as np
 
 import pandas as pd
@@ -35,6 +34,7 @@ def merge_dataframe(data_frames):
     return reduce(lambda left, right: pd.merge(left, right, how="outer"), data_frames)
 
 def rmse(y_true, y_pred):
+    from sklearn.metrics import mean_squared_error
     return np.sqrt(mean_squared_error(y_true, y_pred))
 
 
@@ -14,4 +14,5 @@ setup(name='invest',
                         'yfinance',
                         'plotly',
                         'datetime'],
+      extras_require={'lake': ['pyarrow'], 'parquet': ['pyarrow']},
       zip_safe=False)
\ No newline at end of file
@@ -0,0 +1,10 @@
+import pytest
+
+from invest import cache
+
+
+@pytest.fixture(autouse=True)
+def memory_default_cache(monkeypatch):
+    # the tests never read or write the cache of the user
+    monkeypatch.setattr(cache, '_default_cache', cache.MemoryCache())
+    monkeypatch.setattr(cache, '_default_cache_enabled', True)
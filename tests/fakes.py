@@ -0,0 +1,102 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from invest.providers import DataProvider, as_timezone
+
+
+def price_history(n=300, start='2020-01-01', tz='America/New_York', seed=0):
+    """
+    Daily raw history in the layout of Ticker.history, a random walk of the close.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(start, periods=n, tz=tz)
+    close = 100*np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    return pd.DataFrame({
+        'Open': close*(1 + rng.normal(0, 0.002, n)),
+        'High': close*1.01,
+        'Low': close*0.99,
+        'Close': close,
+        'Volume': rng.integers(1e5, 1e8, n).astype(float),
+        'Dividends': 0.,
+        'Stock Splits': 0.,
+    }, index=pd.DatetimeIndex(dates, name='Date'))
+
+
+class FakeProvider(DataProvider):
+    """
+    Provider serving the payloads given to it and recording every request.
+    Parameters:
+    - payloads: dict code -> dict dataset -> raw dataset
+    - name: tells apart the cache keys of different fakes
+    - gate: threading.Event every fetch waits for, to keep requests in flight
+    """
+
+    def __init__(self, payloads, name='fake', gate=None):
+        self.payloads = payloads
+        self.name = name
+        self.gate = gate
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def cache_key(self, code):
+        return f'{self.name}:{code}'
+
+    def fetch(self, code, dataset, start=None, end=None):
+        with self._lock:
+            self.calls.append((code, dataset, start, end))
+        if self.gate is not None:
+            self.gate.wait(5)
+        data = self.payloads[code][dataset]
+        if dataset == 'history':
+            tz = data.index.tz
+            if start is not None:
+                data = data.loc[data.index >= as_timezone(start, tz)]
+            if end is not None:
+                data = data.loc[data.index <= as_timezone(end, tz)]
+        return data
+
+
+FINANCIALS = ['Net Income', 'Total Revenue', 'EBIT', 'Pretax Income', 'Interest Expense']
+BALANCE_SHEET = ['Total Stockholder Equity', 'Intangible Assets', 'Total Assets',
+                 'Total Liabilities Net Minority Interest', 'Current Assets', 'Inventory',
+                 'Current Liabilities', 'Long Term Debt', 'Cash']
+CASHFLOW = ['Operating Cash Flow', 'Free Cash Flow', 'Capital Expenditures']
+
+
+def statement(items, periods, rng, scale):
+    """
+    Statement in the layout of yfinance: one row per item, one column per period end.
+    """
+    values = rng.uniform(0.2, 1, (len(items), len(periods)))*scale
+    return pd.DataFrame(values, index=items, columns=periods)
+
+
+def stock_payloads(seed=0, start='2001-01-01', end='2022-12-30'):
+    """
+    Every raw dataset of a fake ticker, daily prices with a yearly dividend
+    and four years of statements.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(start, end)
+    history = price_history(len(dates), start, seed=seed)
+    paid = history.index[(history.index.month == 6) & (history.index.day <= 7)]
+    paid = paid[np.unique(paid.year, return_index=True)[1]]
+    history.loc[paid, 'Dividends'] = rng.uniform(1, 3)*(1 + rng.uniform(-0.1, 0.3)*np.arange(len(paid))/len(paid))
+    years = pd.to_datetime([f'{year}-12-31' for year in range(2018, 2022)])
+    quarters = pd.date_range('2021-03-31', '2022-09-30', freq='Q')
+    scale = rng.uniform(1e8, 1e10)
+    shares = rng.uniform(1e7, 1e9)
+    return {
+        'history': history,
+        'info': {'shortName': f'Fake {seed}', 'sector': 'Utilities', 'longBusinessSummary': '',
+                 'fullTimeEmployees': int(rng.integers(100, 100000)), 'sharesOutstanding': shares},
+        'shares': pd.DataFrame({'BasicShares': shares}, index=pd.Index(range(2015, 2023), name='Year')),
+        'financials': statement(FINANCIALS, years, rng, scale),
+        'quarterly_financials': statement(FINANCIALS, quarters, rng, scale/4),
+        'balance_sheet': statement(BALANCE_SHEET, years, rng, 10*scale),
+        'quarterly_balance_sheet': statement(BALANCE_SHEET, quarters, rng, 10*scale),
+        'cashflow': statement(CASHFLOW, years, rng, scale),
+        'quarterly_cashflow': statement(CASHFLOW, quarters, rng, scale/4),
+    }
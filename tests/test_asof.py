@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from invest.asof import AsOfIndex, last_before, last_before_many
+
+
+def frame(n=200, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.to_datetime('2015-01-01') + pd.to_timedelta(np.sort(rng.choice(3000, n, replace=False)), unit='D')
+    # statements come with their periods in any order
+    order = rng.permutation(n)
+    return pd.DataFrame({'value': rng.normal(size=n)}, index=dates[order])
+
+
+def test_last_before_matches_a_linear_scan():
+    df = frame()
+    queries = list(pd.date_range('2015-01-02', '2023-12-31', freq='11D')) + list(df.index[:20])
+    for date in queries:
+        expected = df.loc[df.index < date].sort_index()
+        if not len(expected):
+            with pytest.raises(IndexError):
+                last_before(df, date)
+            continue
+        assert last_before(df, date).equals(expected.iloc[-1])
+
+
+def test_last_before_many_and_until():
+    df = frame()
+    dates = pd.date_range('2014-12-01', '2024-01-01', freq='17D')
+    result = last_before_many(df, dates)
+    for date, (_, row) in zip(dates, result.iterrows()):
+        before = df.loc[df.index < date].sort_index()
+        if len(before):
+            assert row['value'] == before['value'].iloc[-1]
+        else:
+            assert np.isnan(row['value'])
+    index = AsOfIndex(df)
+    for date in df.index[:20]:
+        assert index.until(date).equals(df.loc[df.index <= date].sort_index())
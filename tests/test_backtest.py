@@ -0,0 +1,45 @@
+import pandas as pd
+
+from invest.backtest import Backtest
+from invest.scoring import get_indicators
+
+from fakes import FakeProvider, stock_payloads
+
+
+def run(reporting_lag):
+    """
+    Backtest of two fake tickers, with the period end of the last yearly
+    financials each rebalance saw.
+    """
+    seen = {}
+
+    def indicators(stock):
+        seen[stock.quot_date] = stock.last_before_quot_date(stock.financials).name
+        return get_indicators(stock)
+
+    provider = FakeProvider({code: stock_payloads(seed) for seed, code in enumerate(['AAA', 'BBB'])})
+    report = Backtest(['AAA', 'BBB'], '2021-12-31', '2022-05-31', top_n=1, indicators=indicators,
+                      provider=provider, reporting_lag=reporting_lag).run()
+    return report, seen
+
+
+def test_rebalances_only_see_the_published_statements():
+    report, seen = run('90D')
+    assert len(report) == 5
+    assert all(len(holdings) == 1 for holdings in report['holdings'])
+    lag = pd.Timedelta('90D')
+    for date, period in seen.items():
+        # the latest statement published before the rebalance date
+        published = [end + lag for end in pd.to_datetime(['2019-12-31', '2020-12-31', '2021-12-31'])
+                     if end + lag < date]
+        assert period == published[-1]
+    # the 2021 statements are published on 2022-03-31
+    assert seen[pd.Timestamp('2022-03-31')] == pd.Timestamp('2020-12-31') + lag
+    assert seen[pd.Timestamp('2022-04-29')] == pd.Timestamp('2021-12-31') + lag
+
+
+def test_without_lag_statements_are_seen_at_their_period_end():
+    _, seen = run(None)
+    # strictly before the date: the first rebalance is the end of the 2021 period
+    assert seen.pop(pd.Timestamp('2021-12-31')) == pd.Timestamp('2020-12-31')
+    assert all(period == pd.Timestamp('2021-12-31') for period in seen.values())
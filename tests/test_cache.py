@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from invest.cache import MemoryCache, SQLiteCache
+from invest.stock import Stock
+
+from fakes import FakeProvider, stock_payloads
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def cache(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryCache()
+    return SQLiteCache(str(tmp_path / 'cache.sqlite'), keep=2)
+
+
+def test_entries_expire_after_the_ttl_of_their_dataset(cache):
+    now = datetime.now()
+    cache.put('AAA', 'history', 'prices', now - timedelta(hours=23))
+    cache.put('AAA', 'financials', 'statements', now - timedelta(days=30))
+    assert cache.get('AAA', 'history') == 'prices'
+    assert cache.get('AAA', 'financials') == 'statements'
+    assert cache.get('AAA', 'history', now=now + timedelta(hours=2)) is None
+    assert cache.get('AAA', 'financials', now=now + timedelta(days=90)) is None
+    # an expired entry is still loaded, for the incremental refresh of the history
+    assert cache.load('AAA', 'history')[1] == 'prices'
+
+
+def test_latest_entry_wins_and_clear(cache):
+    cache.put('AAA', 'info', {'v': 1}, datetime(2020, 1, 1))
+    cache.put('AAA', 'info', {'v': 2}, datetime(2020, 1, 2))
+    cache.put('BBB', 'info', {'v': 3}, datetime(2020, 1, 2))
+    assert cache.load('AAA', 'info')[1] == {'v': 2}
+    cache.clear('AAA')
+    assert cache.load('AAA', 'info') is None
+    assert cache.load('BBB', 'info')[1] == {'v': 3}
+
+
+def test_sqlite_cache_keeps_the_last_snapshots(tmp_path):
+    cache = SQLiteCache(str(tmp_path / 'cache.sqlite'), keep=2)
+    for day in range(1, 5):
+        cache.put('AAA', 'info', day, datetime(2020, 1, day))
+    rows = cache._connect().execute("SELECT fetch_date FROM cache WHERE code = 'AAA'").fetchall()
+    assert sorted(row[0][:10] for row in rows) == ['2020-01-03', '2020-01-04']
+
+
+def test_stocks_read_through_the_cache(cache):
+    provider = FakeProvider({'AAA': stock_payloads(1)})
+    first = Stock('AAA', cache=cache, provider=provider)
+    first.info, first.financials
+    second = Stock('AAA', cache=cache, provider=provider)
+    assert second.info == first.info
+    assert second.financials.equals(first.financials)
+    assert [dataset for _, dataset, *_ in provider.calls] == ['info', 'financials']
+    second.refresh('info')
+    second.info
+    assert [dataset for _, dataset, *_ in provider.calls] == ['info', 'financials', 'info']
+
+
+def test_disabled_cache_fetches_every_time():
+    provider = FakeProvider({'AAA': stock_payloads(1)})
+    for _ in range(2):
+        Stock('AAA', cache=False, provider=provider).info
+    assert len(provider.calls) == 2
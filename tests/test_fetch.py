@@ -0,0 +1,60 @@
+import asyncio
+import threading
+
+from invest.fetch import fetch_dataset, prefetch
+from invest.stock import Stock
+
+from fakes import FakeProvider, price_history
+
+
+async def fetch_together(stocks, dataset, gate):
+    tasks = [asyncio.ensure_future(fetch_dataset(stock, dataset)) for stock in stocks]
+    # every request is in flight before the first one returns
+    await asyncio.sleep(0.1)
+    gate.set()
+    return await asyncio.gather(*tasks)
+
+
+def test_same_ticker_and_provider_share_one_request():
+    gate = threading.Event()
+    provider = FakeProvider({'AAA': {'history': price_history()}}, gate=gate)
+    stocks = [Stock('AAA', cache=False, provider=provider) for _ in range(3)]
+    results = asyncio.run(fetch_together(stocks, 'history', gate))
+    assert len(provider.calls) == 1
+    assert all(result is results[0] for result in results)
+
+
+def test_same_ticker_of_different_providers_is_not_merged():
+    gate = threading.Event()
+    first = FakeProvider({'AAA': {'history': price_history(seed=1)}}, name='first', gate=gate)
+    second = FakeProvider({'AAA': {'history': price_history(seed=2)}}, name='second', gate=gate)
+    stocks = [Stock('AAA', cache=False, provider=first), Stock('AAA', cache=False, provider=second)]
+    results = asyncio.run(fetch_together(stocks, 'history', gate))
+    assert len(first.calls) == len(second.calls) == 1
+    assert results[0].equals(first.payloads['AAA']['history'])
+    assert results[1].equals(second.payloads['AAA']['history'])
+
+
+def test_prefetch_seeds_the_lazy_properties():
+    history = price_history()
+    provider = FakeProvider({'AAA': {'history': history, 'info': {'sector': 'Utilities'}}})
+    stock = Stock('AAA', cache=False, provider=provider)
+    asyncio.run(prefetch(stock, ['history', 'info', 'financials']))
+    calls = len(provider.calls)
+    assert stock.info == {'sector': 'Utilities'}
+    assert len(stock.full_hist) == len(history)
+    # financials is missing: the lazy property tries it again
+    assert 'financials' not in stock._datasets
+    assert len(provider.calls) == calls
+
+
+def test_reads_up_to_different_dates_are_not_merged():
+    gate = threading.Event()
+    history = price_history(start='2020-01-01')
+    provider = FakeProvider({'AAA': {'history': history}}, gate=gate)
+    # a provider reading the history up to quot_date
+    provider.as_of_reads = True
+    dates = [history.index[99].tz_localize(None), history.index[199].tz_localize(None)]
+    stocks = [Stock('AAA', quot_date=date, cache=False, provider=provider) for date in dates]
+    results = asyncio.run(fetch_together(stocks, 'history', gate))
+    assert [len(result) for result in results] == [100, 200]
@@ -0,0 +1,85 @@
+import json
+import pickle
+
+import pytest
+
+from invest.governor import FetchError, RequestGovernor
+
+
+def governor(**kwargs):
+    # no waiting between the retries
+    settings = dict(rate=None, backoff=0., max_retries=2, breaker_cooldown=0.)
+    settings.update(kwargs)
+    return RequestGovernor(**settings)
+
+
+def failing(errors):
+    """
+    Function raising the given errors, one per call, then returning 'ok'.
+    """
+    errors = list(errors)
+
+    def function():
+        if errors:
+            raise errors.pop(0)
+        return 'ok'
+    return function
+
+
+def test_rate_climbs_after_successes_up_to_max_rate():
+    g = governor(rate=2., increase=0.5)
+    assert g.max_rate == 8.
+    for _ in range(4):
+        g._adapt(throttled=False)
+    assert g.rate == 4.
+    for _ in range(100):
+        g._adapt(throttled=False)
+    assert g.rate == 8.
+
+
+def test_throttled_request_halves_the_rate_down_to_min_rate():
+    g = governor(rate=4., min_rate=1.)
+    g._adapt(throttled=True)
+    assert g.rate == 2.
+    for _ in range(5):
+        g._adapt(throttled=True)
+    assert g.rate == 1.
+
+
+def test_retries_then_succeeds():
+    g = governor()
+    assert g.call('info', failing([ConnectionError('reset')])) == 'ok'
+    assert g.stats().loc['info'].tolist() == [1, 1, 0]
+
+
+def test_raises_fetch_error_after_the_retries():
+    g = governor()
+    with pytest.raises(FetchError):
+        g.call('info', failing([ConnectionError('reset')]*3))
+    assert g.stats().loc['info'].tolist() == [0, 2, 1]
+
+
+def test_missing_data_is_not_retried():
+    g = governor()
+    with pytest.raises(KeyError):
+        g.call('info', failing([KeyError('Close')]))
+    with pytest.raises(ValueError):
+        g.call('info', failing([ValueError('no data')]))
+    assert g.stats().loc['info'].tolist() == [0, 0, 2]
+
+
+def test_invalid_json_reply_is_retried_as_throttled():
+    g = governor(rate=4., breaker_threshold=2, breaker_cooldown=0.01)
+    error = json.JSONDecodeError('Expecting value', '<html>', 0)
+    assert g.call('info', failing([error])) == 'ok'
+    assert g.rate < 4.
+    g.call('info', failing([error, error]))
+    # the second throttled request in a row opened the breaker
+    assert g.breaker._open_until > 0
+
+
+def test_shared_governor_splits_the_rate():
+    g = governor(rate=8., burst=10)
+    part = g.share(4)
+    assert (part.rate, part.max_rate, part.bucket.capacity) == (2., 8., 2)
+    assert pickle.loads(pickle.dumps(part)).settings == part.settings
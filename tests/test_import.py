@@ -0,0 +1,32 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# seconds allowed to `import invest`, as IMPORT_BUDGET of benchmarks/bench.py
+IMPORT_BUDGET = 1.0
+# dependencies that must only be imported when a function needs them
+HEAVY_MODULES = ['plotly', 'sklearn', 'piecewise_regression', 'yfinance']
+
+SCRIPT = f"""
+import json, sys, time
+start = time.perf_counter()
+import invest
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'loaded': [name for name in {HEAVY_MODULES!r} if name in sys.modules]}}))
+"""
+
+
+def import_invest():
+    output = subprocess.run([sys.executable, '-c', SCRIPT], cwd=ROOT, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def test_import_is_lazy():
+    assert import_invest()['loaded'] == []
+
+
+def test_import_time_within_budget():
+    assert import_invest()['seconds'] <= IMPORT_BUDGET
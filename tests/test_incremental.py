@@ -0,0 +1,67 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from invest.incremental import IncrementalScorer, SortedValues
+from invest.scoring import SCORING_RULES, compute_score
+
+from test_scoring import random_indicators
+
+
+def indicators(rng, codes):
+    table = random_indicators(rng, len(codes))
+    table.insert(0, 'code', codes)
+    return table
+
+
+def assert_same_scores(scorer, table):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        expected = compute_score(table.copy()).set_index('code')
+    result = scorer.scores().set_index('code')
+    assert sorted(result.index) == sorted(expected.index)
+    result = result.loc[expected.index]
+    for column in list(SCORING_RULES) + ['OVERALL_SCORE']:
+        assert np.allclose(result[column].astype(float), expected[column].astype(float), equal_nan=True), column
+    assert np.allclose(scorer.scores()['OVERALL_SCORE'].values, expected['OVERALL_SCORE'].values)
+
+
+def test_sorted_values_quantiles():
+    rng = np.random.default_rng(0)
+    values = rng.choice([0., 1., 2., np.inf, -np.inf], 50).tolist() + rng.normal(size=50).tolist()
+    summary = SortedValues(values[:60])
+    summary.add(values[60:])
+    summary.remove(values[:20])
+    assert np.isclose(summary.quantile(0.9), np.quantile(values[20:], 0.9))
+    assert np.isclose(summary.merge(SortedValues(values[:20])).quantile(0.85), np.quantile(values, 0.85))
+    with pytest.raises(KeyError):
+        summary.remove([1234.5])
+
+
+def test_updates_give_the_scores_of_the_whole_table():
+    rng = np.random.default_rng(1)
+    codes = [f'T{i}' for i in range(200)]
+    table = indicators(rng, codes[:150])
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        scorer = IncrementalScorer(table)
+        assert_same_scores(scorer, table)
+        for trial in range(10):
+            # changed rows of known codes and a few new codes
+            updated = list(rng.choice(table['code'], 10, replace=False)) + list(rng.choice(codes, 3))
+            update = indicators(rng, updated)
+            before = scorer.scores().set_index('code')['OVERALL_SCORE']
+            rescored = scorer.upsert(update)
+            table = pd.concat([table.loc[~table['code'].isin(updated)], update.drop_duplicates('code', keep='last')],
+                              ignore_index=True)
+            assert_same_scores(scorer, table)
+            after = scorer.scores().set_index('code')['OVERALL_SCORE']
+            changed = after.index[~np.isclose(after, before.reindex(after.index), equal_nan=True)]
+            assert set(changed) <= set(rescored)
+
+            removed = list(rng.choice(table['code'], 5, replace=False))
+            scorer.remove(removed)
+            table = table.loc[~table['code'].isin(removed)]
+            assert_same_scores(scorer, table)
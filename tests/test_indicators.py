@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+
+from invest import indicators
+
+from fakes import price_history
+
+
+def panel(field='Close'):
+    """
+    Dates x tickers frame of three fake tickers: one listed later and one
+    with missing bars.
+    """
+    frame = pd.DataFrame({f'T{seed}': price_history(300, seed=seed)[field] for seed in range(3)})
+    frame.iloc[:40, 1] = np.nan
+    frame.iloc[[100, 150, 151], 2] = np.nan
+    return frame
+
+
+def assert_frames_close(result, expected):
+    assert result.index.equals(expected.index) and result.columns.equals(expected.columns)
+    assert np.allclose(result.values, expected.values, equal_nan=True)
+
+
+def wilder(values, window):
+    return values.ewm(alpha=1./window, adjust=False, ignore_na=True, min_periods=window).mean()
+
+
+def test_moving_averages_match_pandas():
+    close = panel()
+    assert_frames_close(indicators.sma(close, 20), close.rolling(20).mean())
+    # pandas carries the average over a missing value, the indicator leaves it missing
+    expected = close.ewm(span=20, adjust=False, ignore_na=True).mean().where(close.notna())
+    assert_frames_close(indicators.ema(close, 20), expected)
+    middle, upper, lower = indicators.bollinger(close, 20, k=2.)
+    std = close.rolling(20).std(ddof=0)
+    assert_frames_close(middle, close.rolling(20).mean())
+    assert_frames_close(upper, close.rolling(20).mean() + 2*std)
+    assert_frames_close(lower, close.rolling(20).mean() - 2*std)
+
+
+def test_oscillators_match_pandas():
+    close = panel()
+    changes = close - close.ffill().shift(1)
+    gains, losses = wilder(changes.clip(lower=0), 14), wilder((-changes).clip(lower=0), 14)
+    assert_frames_close(indicators.rsi(close, 14), (100*gains/(gains + losses)).where(close.notna()))
+
+    fast = close.ewm(span=12, adjust=False, ignore_na=True).mean()
+    slow = close.ewm(span=26, adjust=False, ignore_na=True).mean()
+    line = (fast - slow).where(close.notna())
+    signal = line.ewm(span=9, adjust=False, ignore_na=True).mean().where(close.notna())
+    result = indicators.macd(close)
+    assert_frames_close(result[0], line)
+    assert_frames_close(result[1], signal)
+    assert_frames_close(result[2], line - signal)
+
+    high, low = panel('High'), panel('Low')
+    previous = close.ffill().shift(1)
+    true_range = pd.concat([high - low, (high - previous).abs(), (low - previous).abs()]).groupby(level=0).max()
+    true_range = true_range.reindex(close.index).where(close.notna())
+    assert_frames_close(indicators.atr(high, low, close, 14), wilder(true_range, 14).where(close.notna()))
+
+
+def test_returns_match_pandas():
+    close = panel()
+    assert_frames_close(indicators.roc(close, 10), close/close.shift(10) - 1)
+    returns = close/close.ffill().shift(1) - 1
+    assert_frames_close(indicators.volatility(close, 20), returns.rolling(20).std(ddof=0))
+
+
+def test_single_ticker_inputs_keep_their_type():
+    close = panel()['T2']
+    result = indicators.sma(close, 20)
+    assert isinstance(result, pd.Series) and result.name == 'T2'
+    assert np.allclose(result.values, close.rolling(20).mean().values, equal_nan=True)
+    assert np.allclose(indicators.sma(close.values, 20), result.values, equal_nan=True)
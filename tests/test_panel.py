@@ -0,0 +1,45 @@
+import pickle
+
+import numpy as np
+
+from invest.panel import build_panel
+from invest.stock import Stock, clean_history
+
+from fakes import FakeProvider, price_history
+
+
+def histories():
+    hist = {code: price_history(seed=seed) for seed, code in enumerate(['AAA', 'BBB'])}
+    # volumes of a large cap, not exact in float32
+    hist['AAA']['Volume'] = 123456789.
+    # a ticker listed later, with a hole in its dates
+    listed_later = price_history(200, start='2020-03-02', seed=3)
+    hist['CCC'] = listed_later.drop(index=listed_later.index[50:55])
+    return hist
+
+
+def test_panel_round_trip(tmp_path):
+    raw = histories()
+    panel = build_panel(str(tmp_path), list(raw), FakeProvider({code: {'history': h} for code, h in raw.items()}))
+    for code, hist in raw.items():
+        expected = clean_history(hist)
+        stored = panel.history(code)
+        assert stored.index.equals(expected.index)
+        assert np.array_equal(stored[expected.columns].values, expected.values)
+    assert (panel.history('AAA')['Volume'] == 123456789.).all()
+    # the history of a ticker without holes is a view on the mapping
+    assert np.shares_memory(panel.history('AAA').values, panel.prices)
+    assert len(panel.closes('CCC')) == len(raw['CCC'])
+    assert pickle.loads(pickle.dumps(panel)).codes == panel.codes
+
+
+def test_attached_stock_reads_the_panel(tmp_path):
+    raw = histories()
+    provider = FakeProvider({code: {'history': h} for code, h in raw.items()})
+    panel = build_panel(str(tmp_path), list(raw), provider)
+    calls = len(provider.calls)
+    stock = Stock('BBB', quot_date=raw['BBB'].index[99].tz_localize(None), cache=False, provider=provider)
+    panel.attach([stock])
+    assert len(stock.hist) == 100
+    assert stock.hist['Close'].iloc[-1] == raw['BBB']['Close'].iloc[99]
+    assert len(provider.calls) == calls
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+from invest.pipeline import staged_screen
+from invest.screener import screen_universe
+
+from fakes import FakeProvider, stock_payloads
+
+QUOT_DATE = pd.Timestamp('2022-06-30')
+CODES = [f'T{i}' for i in range(12)]
+
+
+def provider():
+    return FakeProvider({code: stock_payloads(seed) for seed, code in enumerate(CODES)})
+
+
+def test_top_n_is_the_one_of_the_full_screen():
+    full, errors = screen_universe(CODES, QUOT_DATE, max_workers=4, chunk_size=4, provider=provider())
+    assert not len(errors)
+    fake = provider()
+    scored, report = staged_screen(CODES, top_n=3, quot_date=QUOT_DATE, max_workers=2, chunk_size=4, provider=fake)
+    columns = ['code', 'OVERALL_SCORE']
+    assert scored[columns].head(3).reset_index(drop=True).equals(full[columns].head(3).reset_index(drop=True))
+    # the tickers that could not reach the top 3 were not fitted
+    skipped = report.loc[report['status'] == 'skipped', 'code']
+    assert len(skipped) and not set(skipped) & set(full['code'].head(3))
+    assert scored.set_index('code').loc[skipped, 'trend_magnitude'].isna().all()
+    # the bound of a skipped ticker is a lower bound of its full score
+    assert (scored.set_index('code').loc[skipped, 'OVERALL_SCORE']
+            <= full.set_index('code').loc[skipped, 'OVERALL_SCORE'] + 1e-12).all()
+
+
+def test_filtered_tickers_are_reported_by_stage():
+    prices = {code: stock_payloads(seed)['history']['Close'].loc[:'2022-06-29'].iloc[-1]
+              for seed, code in enumerate(CODES)}
+    limit = np.median(list(prices.values()))
+    scored, report = staged_screen(CODES, info_filters={'sector': ['Utilities']}, price_filters={'price': (None, limit)},
+                                   fundamental_filters={'PE': (0, None)}, quot_date=QUOT_DATE, max_workers=2,
+                                   provider=provider())
+    report = report.set_index('code')
+    expensive = [code for code, price in prices.items() if price > limit]
+    assert sorted(report.index[report['stage'] == 'prefilter']) == sorted(expensive)
+    assert (report.loc[expensive, 'status'] == 'filtered').all()
+    assert set(scored['code']) == set(report.index[report['status'] == 'scored'])
+    assert (scored['PE'].dropna() >= 0).all()
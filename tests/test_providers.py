@@ -0,0 +1,65 @@
+import pickle
+
+import pandas as pd
+
+from invest.cache import MemoryCache
+from invest.providers import LakeProvider, ReplayProvider, fixture_path, write_lake
+from invest.stock import Stock, clean_history
+
+from fakes import FakeProvider, price_history, stock_payloads
+
+
+def lake(tmp_path, payloads):
+    for dataset in ['history', 'info', 'financials']:
+        write_lake(str(tmp_path), dataset, {code: data[dataset] for code, data in payloads.items()})
+    return LakeProvider(str(tmp_path))
+
+
+def test_lake_round_trip(tmp_path):
+    payloads = {'AAA': stock_payloads(1), 'BBB.MI': stock_payloads(2)}
+    provider = lake(tmp_path, payloads)
+    for code, data in payloads.items():
+        history = provider.fetch(code, 'history')
+        assert history.index.equals(data['history'].index.tz_localize(None))
+        assert provider.fetch(code, 'info') == data['info']
+        assert provider.fetch(code, 'financials').equals(data['financials'])
+    histories = provider.fetch_many(list(payloads), 'history', start='2010-01-01', end='2010-12-31')
+    assert sorted(histories) == sorted(payloads)
+    assert histories['AAA'].index.min().year == histories['AAA'].index.max().year == 2010
+
+
+def test_past_stock_reads_the_lake_up_to_quot_date(tmp_path):
+    payloads = {'AAA': stock_payloads(1)}
+    cache = MemoryCache()
+    stock = Stock('AAA', quot_date=pd.Timestamp('2010-06-30'), cache=cache, provider=lake(tmp_path, payloads))
+    assert stock.full_hist.index.max() <= pd.Timestamp('2010-06-30')
+    # a partial history is never cached
+    assert cache.load(stock.cache_key, 'history') is None
+    stock.quot_date = pd.Timestamp('2015-06-30')
+    assert stock.full_hist.index.max() == pd.Timestamp('2015-06-30')
+    assert stock.hist['Close'].iloc[-1] == payloads['AAA']['history']['Close'].loc['2015-06-30'].item()
+    stock.quot_date = None
+    assert len(stock.full_hist) == len(payloads['AAA']['history'])
+    assert cache.load(stock.cache_key, 'history') is not None
+
+
+def test_cache_tells_providers_apart():
+    cache = MemoryCache()
+    first = FakeProvider({'AAA': {'history': price_history(seed=1)}}, name='first')
+    second = FakeProvider({'AAA': {'history': price_history(seed=2)}}, name='second')
+    for provider in [first, second]:
+        Stock('AAA', cache=cache, provider=provider).full_hist
+    for provider in [first, second]:
+        hist = Stock('AAA', cache=cache, provider=provider).full_hist
+        assert hist.equals(clean_history(provider.payloads['AAA']['history']))
+        assert len(provider.calls) == 1
+
+
+def test_replay_provider_serves_the_recording(tmp_path):
+    payloads = stock_payloads(3)
+    # in the layout written by invest.replay.record
+    with open(fixture_path(str(tmp_path), 'AAA'), 'wb') as f:
+        pickle.dump(payloads, f)
+    provider = ReplayProvider(str(tmp_path))
+    assert provider.fetch('AAA', 'history').equals(payloads['history'])
+    assert provider.fetch('AAA', 'history', end='2001-12-31').index.max().year == 2001
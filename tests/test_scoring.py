@@ -0,0 +1,235 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from invest import scoring
+from invest.scoring import SCORING_RULES, compute_score
+
+# Scorers of the indicator table before SCORING_RULES, kept as the reference
+# of the parity check (same pandas code, without the ones computed on a Stock).
+
+
+def _score_ROCE(roce):
+    tmp = pd.DataFrame()
+    tmp['ROCE'] = roce
+    soglia_5 = tmp['ROCE'].quantile(0.9)
+    tmp['score_ROCE'] = None
+    tmp.loc[(tmp['ROCE'].isna() | (tmp['ROCE'] < 0)), 'score_ROCE'] = 0
+    tmp.loc[(tmp['ROCE'] > soglia_5), 'score_ROCE'] = 5
+    tmp.loc[((tmp['ROCE'] >= 0) & (tmp['ROCE'] <= soglia_5)), 'score_ROCE'] = 5*tmp['ROCE']/soglia_5
+    return tmp['score_ROCE']
+
+
+def _score_YELD(div_yeld):
+    tmp_df = pd.DataFrame()
+    tmp_df['Dividend yeld'] = div_yeld
+    tmp_df['score_YELD'] = (5*tmp_df['Dividend yeld']/tmp_df['Dividend yeld'].quantile(0.9)).map(lambda x: min(5, x))
+    return tmp_df['score_YELD']
+
+
+def _score_PAYOUT(payout):
+    tmp_df = pd.DataFrame()
+    tmp_df['payout'] = 1 - payout
+    tmp_df['score_PAYOUT'] = None
+    tmp_df.loc[(tmp_df['payout'] <= 0) | (tmp_df['payout'] >= 1) | tmp_df['payout'].isna(), 'score_PAYOUT'] = 0
+    tmp_df.loc[(tmp_df['payout'] > 0) & (tmp_df['payout'] < 1), 'score_PAYOUT'] = 5*tmp_df['payout']
+    return tmp_df['score_PAYOUT']
+
+
+def _score_PE(PE):
+    tmp_df = pd.DataFrame()
+    tmp_df['PE'] = PE
+    tmp_df['score_PE'] = 1
+    tmp_df.loc[tmp_df['PE'].isna(), 'score_PE'] = 0
+    tmp_df.loc[tmp_df['PE'] < 17.5, 'score_PE'] = 2
+    tmp_df.loc[tmp_df['PE'] < 15, 'score_PE'] = 3
+    tmp_df.loc[tmp_df['PE'] < 12, 'score_PE'] = 4
+    tmp_df.loc[tmp_df['PE'] < 10, 'score_PE'] = 5
+    return tmp_df['score_PE']
+
+
+def _score_QR(qr):
+    tmp_df = pd.DataFrame()
+    tmp_df['QR'] = qr
+    tmp_df['score_QR'] = 0
+    tmp_df.loc[tmp_df['QR'].isna(), 'score_QR'] = 0
+    tmp_df.loc[(tmp_df['QR'] < 2) & (tmp_df['QR'] > 0), 'score_QR'] = 2.5*(tmp_df['QR'])
+    tmp_df.loc[tmp_df['QR'] > 2, 'score_QR'] = 5
+    return tmp_df['score_QR']
+
+
+def _score_PB(PB):
+    tmp_df = pd.DataFrame()
+    tmp_df['PB'] = PB
+    tmp_df['score_PB'] = 0
+    tmp_df.loc[tmp_df['PB'].isna() | (tmp_df['PB'] < 0), 'score_PB'] = 0
+    tmp_df.loc[(tmp_df['PB'] > 3), 'score_PB'] = 1
+    tmp_df.loc[((tmp_df['PB'] < 3) & (tmp_df['PB'] > 2)), 'score_PB'] = 2
+    tmp_df.loc[(tmp_df['PB'] < 2) & (tmp_df['PB'] > 1), 'score_PB'] = 4
+    tmp_df.loc[(tmp_df['PB'] < 1) & (tmp_df['PB'] > 0), 'score_PB'] = 5
+    return tmp_df['score_PB']
+
+
+def _score_TREND(trend):
+    tmp_df = pd.DataFrame()
+    tmp_df['TREND'] = trend
+    tmp_df['score_TREND'] = 0
+    tmp_df.loc[(tmp_df['TREND'] > 0), 'score_TREND'] = 5
+    return tmp_df['score_TREND']
+
+
+def _score_NIPE(IPE):
+    tmp_df = pd.DataFrame()
+    tmp_df['IPE'] = IPE
+    best_decile = tmp_df['IPE'].quantile(0.90)
+    tmp_df['score_NIPE'] = None
+    tmp_df.loc[tmp_df['IPE'].isna() | (tmp_df['IPE'] < 0), 'score_NIPE'] = 0
+    tmp_df.loc[(tmp_df['IPE'] > 0) & (tmp_df['IPE'] < best_decile), 'score_NIPE'] = 5*tmp_df['IPE']/best_decile
+    tmp_df.loc[(tmp_df['IPE'] >= best_decile), 'score_NIPE'] = 5
+    return tmp_df['score_NIPE']
+
+
+def _score_EPS(ROE):
+    tmp_df = pd.DataFrame()
+    tmp_df['EPS'] = ROE
+    tmp_df['score_EPS'] = None
+    best_decile = tmp_df.loc[tmp_df['EPS'] > 0]['EPS'].quantile(0.85)
+    tmp_df.loc[tmp_df['EPS'].isna() | (tmp_df['EPS'] < 0), 'score_EPS'] = 0
+    tmp_df.loc[tmp_df['EPS'] > 0 & (tmp_df['EPS'] < best_decile), 'score_EPS'] = 5*tmp_df['EPS']/best_decile
+    tmp_df.loc[((tmp_df['EPS'] >= best_decile)), 'score_EPS'] = 5
+    return tmp_df['score_EPS']
+
+
+def _score_graham(price_over_graham):
+    tmp_df = pd.DataFrame()
+    tmp_df['graham'] = price_over_graham
+    tmp_df['score_GRAHAM'] = None
+    tmp_df.loc[tmp_df['graham'].isna(), 'score_GRAHAM'] = 0
+    tmp_df.loc[(tmp_df['graham'] > 2), 'score_GRAHAM'] = 1
+    tmp_df.loc[((tmp_df['graham'] > 1.5) & (tmp_df['graham'] < 2)), 'score_GRAHAM'] = 2
+    tmp_df.loc[((tmp_df['graham'] > 1.1) & (tmp_df['graham'] < 1.5)), 'score_GRAHAM'] = 3
+    tmp_df.loc[((tmp_df['graham'] > 1) & (tmp_df['graham'] < 1.1)), 'score_GRAHAM'] = 4
+    tmp_df.loc[tmp_df['graham'] < 1, 'score_GRAHAM'] = 5
+    return tmp_df['score_GRAHAM']
+
+
+def _score_ratio(values, name, threshold):
+    # score_ROA and score_ROE
+    tmp_df = pd.DataFrame()
+    tmp_df[name] = values
+    tmp_df['score'] = None
+    tmp_df.loc[tmp_df[name].isna() | (tmp_df[name] < 0), 'score'] = 0
+    tmp_df.loc[tmp_df[name] > 0 & (tmp_df[name] < threshold), 'score'] = 5*tmp_df[name]/threshold
+    tmp_df.loc[((tmp_df[name] >= threshold)), 'score'] = 5
+    return tmp_df['score']
+
+
+def _score_NCAPSOP(NCAPSOP):
+    tmp_df = pd.DataFrame()
+    tmp_df['NCAPSOP'] = NCAPSOP
+    tmp_df['score_NCAPSOP'] = None
+    tmp_df.loc[tmp_df['NCAPSOP'].isna(), 'score_NCAPSOP'] = 0
+    tmp_df.loc[tmp_df['NCAPSOP'] < -10, 'score_NCAPSOP'] = 1
+    tmp_df.loc[((tmp_df['NCAPSOP'] > -10) & (tmp_df['NCAPSOP'] < -5)), 'score_NCAPSOP'] = 2
+    tmp_df.loc[((tmp_df['NCAPSOP'] > -5) & (tmp_df['NCAPSOP'] < -1)), 'score_NCAPSOP'] = 3
+    tmp_df.loc[((tmp_df['NCAPSOP'] > -1) & (tmp_df['NCAPSOP'] < 0)), 'score_NCAPSOP'] = 4
+    tmp_df.loc[((tmp_df['NCAPSOP'] > 0)), 'score_NCAPSOP'] = 5
+    return tmp_df['score_NCAPSOP']
+
+
+REFERENCE = {
+    'score_NIPE': lambda df: _score_NIPE(df['Net income per employee']),
+    'score_PE': lambda df: _score_PE(df['PE']),
+    'score_QR': lambda df: _score_QR(df['Quick Ratio']),
+    'score_TREND': lambda df: _score_TREND(df['trend_magnitude']),
+    'score_PB': lambda df: _score_PB(df['PB']),
+    'score_YELD': lambda df: _score_YELD(df['Dividend yeld']),
+    'score_DIVHIST': lambda df: df['#div_past20y']/4,
+    'score_PAYOUT': lambda df: _score_PAYOUT(df['Payout Ratio']),
+    'score_GRAHAM': lambda df: _score_graham(df['price_over_graham']),
+    'score_ROA': lambda df: _score_ratio(df['Return on Assets'], 'ROA', 0.1),
+    'score_ROE': lambda df: _score_ratio(df['ROE'], 'ROE', 0.2),
+    'score_NCAPSOP': lambda df: _score_NCAPSOP(df['Net current asset per share over price']),
+    'score_ROCE': lambda df: _score_ROCE(df['ROCE']),
+    'score_EPS': lambda df: _score_EPS(df['EPS over price']),
+}
+
+# column -> (range of the random values, band edges)
+COLUMNS = {
+    'Net income per employee': ((-1e5, 1e6), [0.]),
+    'PE': ((-10, 40), [0., 10., 12., 15., 17.5]),
+    'Quick Ratio': ((-1, 4), [0., 2.]),
+    'trend_magnitude': ((-1, 1), [0.]),
+    'PB': ((-1, 5), [0., 1., 2., 3.]),
+    'Dividend yeld': ((-0.01, 0.1), [0.]),
+    'Payout Ratio': ((-1, 2), [0., 1.]),
+    'price_over_graham': ((0, 3), [1., 1.1, 1.5, 2.]),
+    'Return on Assets': ((-0.2, 0.3), [0., 0.1]),
+    'ROE': ((-0.2, 0.5), [0., 0.2]),
+    'Net current asset per share over price': ((-15, 5), [-10., -5., -1., 0.]),
+    'ROCE': ((-0.2, 0.5), [0.]),
+    'EPS over price': ((-0.2, 0.5), [0.]),
+}
+
+
+def random_indicators(rng, n):
+    """
+    Indicator table with uniform values, band edges, -inf, inf and missing values.
+    """
+    table = {}
+    for column, ((low, high), edges) in COLUMNS.items():
+        values = rng.uniform(low, high, n)
+        special = rng.random(n) < 0.3
+        values[special] = rng.choice(edges + [-np.inf, np.inf, np.nan], special.sum())
+        table[column] = values
+    table['#div_past20y'] = rng.integers(0, 21, n).astype(float)
+    table['score_DIVTREND'] = rng.choice([0., 3., 5.], n)
+    return pd.DataFrame(table)
+
+
+def test_rules_match_reference_scorers():
+    rng = np.random.default_rng(0)
+    for trial in range(100):
+        # small tables too, where the quantile scales can be infinite or missing
+        indicators = random_indicators(rng, int(rng.choice([1, 2, 3, 5, 10, 50, 500])))
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            scored = compute_score(indicators.copy()).sort_index()
+            for name, reference in REFERENCE.items():
+                expected = reference(indicators).astype(np.float64).values
+                assert np.allclose(scored[name].values, expected, equal_nan=True, rtol=1e-12), (trial, name)
+
+
+def test_infinite_values_fall_in_the_outer_bands():
+    indicators = pd.DataFrame({rule.column: [-np.inf, np.inf] for rule in SCORING_RULES.values()})
+    indicators['#div_past20y'] = 0.
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        scored = compute_score(indicators).sort_index()
+    assert scored['score_QR'].tolist() == [0., 5.]
+    assert scored['score_PB'].tolist() == [0., 1.]
+    assert scored['score_TREND'].tolist() == [0., 5.]
+    assert scored['score_GRAHAM'].tolist() == [5., 1.]
+    assert scored['score_NCAPSOP'].tolist() == [1., 5.]
+    assert scored['score_ROA'].tolist() == [0., 5.]
+
+
+def test_dividend_trend_memo_is_bounded(monkeypatch):
+    monkeypatch.setattr(scoring, 'DIVTREND_MEMO_SIZE', 5)
+    monkeypatch.setattr(scoring, 'DIVTREND_MEMO', scoring.OrderedDict())
+    rng = np.random.default_rng(0)
+    years = np.arange(2002, 2022, dtype=float)
+    series = [(years, np.cumsum(rng.uniform(0, 1, len(years)))) for _ in range(12)]
+    first = scoring.dividend_trend_classes(series)
+    assert len(scoring.DIVTREND_MEMO) == 5
+    # the series dropped from the memo are fitted again, with the same classes
+    scoring.DIVTREND_MEMO.clear()
+    assert scoring.dividend_trend_classes(series) == first
+
+
+def test_straight_dividend_line_scores_3():
+    # as score_DIVTREND_exact, where piecewise_regression cannot fit a model without breakpoints
+    years = np.arange(2002, 2022, dtype=float)
+    dividends = 0.1*(years - 2000) + np.random.default_rng(1).normal(0, 0.01, len(years))
+    assert scoring.dividend_trend_classes([(years, dividends)]) == [3]
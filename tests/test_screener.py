@@ -0,0 +1,65 @@
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+import pandas as pd
+import pytest
+
+from invest.cache import MemoryCache, SQLiteCache, default_cache
+from invest.governor import RequestGovernor, default_governor
+from invest.screener import init_worker, read_manifest, screen_to_parquet, screen_universe
+
+from fakes import FakeProvider, stock_payloads
+
+QUOT_DATE = pd.Timestamp('2022-06-30')
+
+
+def worker_defaults(governor, cache):
+    with ProcessPoolExecutor(1, initializer=init_worker, initargs=(governor, cache)) as pool:
+        return pool.submit(default_cache).result(), pool.submit(default_governor).result()
+
+
+def test_workers_keep_the_memory_cache_of_the_parent():
+    cache = MemoryCache(ttl={'history': timedelta(hours=1)})
+    cache.put('AAA', 'info', {'sector': 'Utilities'})
+    worker_cache, _ = worker_defaults(RequestGovernor(), cache)
+    assert isinstance(worker_cache, MemoryCache)
+    assert worker_cache.ttl == cache.ttl
+    # sent empty, not as a copy of the entries of the parent
+    assert worker_cache.load('AAA', 'info') is None
+
+
+def test_workers_share_the_sqlite_cache_and_split_the_rate(tmp_path):
+    cache = SQLiteCache(str(tmp_path / 'cache.sqlite'))
+    worker_cache, worker_governor = worker_defaults(RequestGovernor(rate=8.).share(4), cache)
+    assert isinstance(worker_cache, SQLiteCache) and (worker_cache.path == cache.path)
+    assert worker_governor.rate == 2.
+
+
+def test_screen_to_parquet_resumes_from_the_manifest(tmp_path):
+    payloads = {f'T{i}': stock_payloads(i) for i in range(5)}
+    # T3 is not available in the first run
+    first = FakeProvider({code: data for code, data in payloads.items() if code != 'T3'})
+    scored, errors = screen_to_parquet(list(payloads), str(tmp_path), QUOT_DATE, max_workers=2,
+                                       chunk_size=2, provider=first)
+    manifest = read_manifest(str(tmp_path))
+    assert sorted(manifest['done']) == ['T0', 'T1', 'T2', 'T4']
+    assert len(manifest['parts']) == 3
+    assert errors['code'].tolist() == ['T3']
+
+    second = FakeProvider(payloads)
+    scored, errors = screen_to_parquet(list(payloads), str(tmp_path), QUOT_DATE, max_workers=2,
+                                       chunk_size=2, provider=second)
+    assert {code for code, *_ in second.calls} == {'T3'}
+    assert not len(errors)
+    full, _ = screen_universe(list(payloads), QUOT_DATE, max_workers=2, chunk_size=2, provider=second)
+    columns = ['code', 'OVERALL_SCORE']
+    assert scored[columns].reset_index(drop=True).equals(full[columns].reset_index(drop=True))
+    assert pd.read_parquet(tmp_path / 'scored.parquet')['code'].tolist() == scored['code'].tolist()
+
+
+def test_screen_to_parquet_needs_pyarrow(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, 'pyarrow', None)
+    with pytest.raises(ImportError, match='invest\\[parquet\\]'):
+        screen_to_parquet(['T0'], str(tmp_path / 'screen'), QUOT_DATE, provider=FakeProvider({}))
+    assert not (tmp_path / 'screen').exists()
@@ -0,0 +1,42 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import pytest
+
+from invest.shared import SharedHistories, _ATTACHED
+from invest.stock import clean_history
+
+from fakes import price_history
+
+
+def worker_history(shared, code):
+    hist = shared.history(code)
+    return hist, hist.values.flags.writeable
+
+
+def test_histories_round_trip_through_a_worker():
+    histories = {'AAA': price_history(seed=1), 'BBB': clean_history(price_history(150, seed=2))}
+    with SharedHistories.create(histories) as shared:
+        with ProcessPoolExecutor(2) as pool:
+            results = {code: pool.submit(worker_history, shared, code).result() for code in histories}
+        for code, (hist, writeable) in results.items():
+            expected = histories[code].reindex(columns=shared.columns)
+            assert hist.index.equals(expected.index)
+            assert hist.equals(expected)
+            assert not writeable
+        # the workers exited without unlinking the block of the parent
+        assert shared.history('AAA').equals(results['AAA'][0])
+        name = shared.name
+    assert name not in _ATTACHED
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
+
+
+def test_seeded_stocks_read_the_block():
+    # in the layout of Stock.full_hist
+    hist = clean_history(price_history(seed=3))
+    with SharedHistories.create({'AAA': hist}) as shared:
+        stock, = shared.stocks(['AAA'], quot_date=hist.index[49])
+        assert len(stock.hist) == 50
+        assert stock.hist['Close'].iloc[-1] == hist['Close'].iloc[49]
+        del stock
@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+from invest.cache import MemoryCache
+from invest.loader import preload_history
+from invest.stock import Stock, merge_history
+
+from fakes import FakeProvider, price_history
+
+EXPIRED = datetime.now() - timedelta(days=3)
+
+
+def cached_stock(history, cached, code='AAA'):
+    """
+    A Stock whose cache holds an expired copy of `cached`, and its provider serving `history`.
+    """
+    provider = FakeProvider({code: {'history': history}})
+    cache = MemoryCache()
+    cache.put(provider.cache_key(code), 'history', cached, EXPIRED)
+    return Stock(code, cache=cache, provider=provider), provider
+
+
+def test_expired_history_is_extended_from_its_anchor():
+    history = price_history(300)
+    stock, provider = cached_stock(history, history.iloc[:200])
+    assert stock.full_hist['Close'].equals(history['Close'].tz_localize(None))
+    assert provider.calls == [('AAA', 'history', history.index[198], None)]
+    # the merged history is stored back as a fresh entry
+    assert len(stock.cache.get(stock.cache_key, 'history')) == 300
+
+
+def test_adjusted_anchor_close_downloads_the_full_history():
+    history = price_history(300)
+    cached = history.iloc[:200].copy()
+    # a split re-adjusted the closes since the entry was stored
+    cached['Close'] *= 2
+    stock, provider = cached_stock(history, cached)
+    assert stock.full_hist['Close'].equals(history['Close'].tz_localize(None))
+    assert [call[2] for call in provider.calls] == [history.index[198], None]
+
+
+def test_refresh_in_another_timezone_is_converted():
+    history = price_history(300)
+    merged = merge_history('AAA', history.iloc[:200], history.iloc[198:].tz_convert('UTC'))
+    assert merged.index.tz == history.index.tz
+    assert merged.equals(history)
+
+
+def test_refresh_that_cannot_be_merged():
+    history = price_history(300)
+    cached = history.iloc[:200]
+    # naive against aware timestamps
+    assert merge_history('AAA', cached, history.iloc[198:].tz_localize(None)) is None
+    # the anchor bar is missing from the refresh
+    assert merge_history('AAA', cached, history.iloc[199:]) is None
+
+
+def test_preload_extends_the_expired_entries_in_one_request():
+    histories = {code: price_history(300, seed=seed) for seed, code in enumerate(['AAA', 'BBB'])}
+    provider = FakeProvider({code: {'history': history} for code, history in histories.items()})
+    cache = MemoryCache()
+    for code, history in histories.items():
+        cache.put(provider.cache_key(code), 'history', history.iloc[:250], EXPIRED)
+    stocks = preload_history([Stock(code, cache=cache, provider=provider) for code in histories])
+    for stock in stocks:
+        assert stock.full_hist['Close'].equals(histories[stock.code]['Close'].tz_localize(None))
+    assert {call[2] for call in provider.calls} == {histories['AAA'].index[248].tz_localize(None)}
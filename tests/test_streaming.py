@@ -0,0 +1,65 @@
+import numpy as np
+
+from invest import indicators, streaming
+from invest.stock import clean_history
+
+from fakes import price_history
+
+
+def history():
+    hist = clean_history(price_history(400, seed=5))
+    # a missing bar in the middle
+    hist.iloc[200] = np.nan
+    return hist
+
+
+def streamed(indicator, hist, start=100):
+    """
+    Values of a streaming indicator initialised on the first `start` bars
+    and fed the others one by one.
+    """
+    indicator.initialise(hist.iloc[:start])
+    return [indicator.update(bar) for _, bar in hist.iloc[start:].iterrows()]
+
+
+def test_streaming_indicators_match_the_batch_ones():
+    hist = history()
+    cases = [
+        (streaming.EMA(20), indicators.ema(hist['Close'], 20)),
+        (streaming.SMA(20), indicators.sma(hist['Close'], 20)),
+        (streaming.RSI(14), indicators.rsi(hist['Close'], 14)),
+        (streaming.ATR(14), indicators.atr(hist['High'], hist['Low'], hist['Close'], 14)),
+    ]
+    for indicator, expected in cases:
+        values = np.array(streamed(indicator, hist), dtype=np.float64)
+        expected = expected.values[100:]
+        valid = ~np.isnan(hist['Close'].values[100:])
+        assert np.allclose(values[valid], expected[valid], equal_nan=True), type(indicator).__name__
+
+    line, signal, histogram = indicators.macd(hist['Close'])
+    values = np.array(streamed(streaming.MACD(), hist))
+    valid = ~np.isnan(hist['Close'].values[100:])
+    assert np.allclose(values[valid, 0], line.values[100:][valid], equal_nan=True)
+    assert np.allclose(values[valid, 1], signal.values[100:][valid], equal_nan=True)
+
+    middle, upper, lower = indicators.bollinger(hist['Close'])
+    values = np.array(streamed(streaming.Bollinger(), hist))
+    assert np.allclose(values[valid, 1], upper.values[100:][valid], equal_nan=True)
+    assert np.allclose(values[valid, 2], lower.values[100:][valid], equal_nan=True)
+
+
+def test_trend_updates_without_searching_the_breakpoint(monkeypatch):
+    hist = clean_history(price_history(400, seed=6))
+    trend = streaming.Trend(train_length=120).initialise(hist.iloc[:200])
+    searches = []
+    monkeypatch.setattr(streaming, 'fast_trend', lambda *args: searches.append(args))
+    for _, bar in hist.iloc[200:].iterrows():
+        value = trend.update(bar)
+    assert not searches
+    # the running sums give the same line as the sums taken again from the window
+    trend.refit(search=False)
+    assert np.allclose(value, trend.value)
+    # and the least squares line of the log closes of the segment
+    closes = trend.closes.ordered()[trend.segment_start - (trend.bars - len(trend.closes)):]
+    slope, intercept = np.polyfit(np.arange(len(closes)), np.log(closes), 1)
+    assert np.allclose(value, (np.exp(slope*365) - 1, np.exp(intercept + slope*(len(closes) - 1))))
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+
+from invest.stock import Stock
+from invest.technical_analysis import (breakpoint_search, detect_trend, fast_trend, median_slopes,
+                                       window_trends)
+
+from fakes import FakeProvider, price_history
+
+
+def kinked(n=120, breakpoint=70, slopes=(-0.004, 0.003), noise=0., seed=0):
+    """
+    Log prices falling until breakpoint and rising after it.
+    """
+    t = np.arange(n)
+    y = slopes[0]*np.minimum(t, breakpoint) + slopes[1]*np.maximum(t - breakpoint, 0)
+    return np.exp(y + np.random.default_rng(seed).normal(0, noise, n))
+
+
+def test_breakpoint_search_finds_the_kink():
+    rows = np.log(np.stack([kinked(breakpoint=b) for b in (30, 70, 95)]))
+    assert list(breakpoint_search(rows)) == [30, 70, 95]
+    # too short to be split
+    assert list(breakpoint_search(rows[:, :15])) == [-1]*3
+
+
+def test_median_slopes_match_a_pairwise_computation():
+    y = np.log(np.stack([kinked(noise=0.01, seed=seed) for seed in range(3)]))
+    start = np.array([-1, 40, 80])
+    slope, intercept = median_slopes(y, start)
+    for row in range(len(y)):
+        t = np.arange(start[row] + 1, y.shape[1])
+        values = y[row, t]
+        pairs = [(values[j] - values[i])/(t[j] - t[i]) for i in range(len(t)) for j in range(i + 1, len(t))]
+        assert np.isclose(slope[row], np.median(pairs))
+        assert np.isclose(intercept[row], np.median(values - slope[row]*t))
+
+
+def test_fast_trend_of_a_kinked_series():
+    closes = 50*kinked()
+    trend_magnitude, last_value_trendline, breakpoint, slope, _ = fast_trend(closes)
+    assert breakpoint[0] == 70
+    assert np.isclose(slope[0], 0.003)
+    assert np.isclose(trend_magnitude[0], np.exp(0.003*365) - 1)
+    assert np.isclose(last_value_trendline[0], closes[-1])
+
+
+def test_batches_give_the_trends_of_single_windows():
+    windows = {f'T{seed}': 50*kinked(n=n, breakpoint=n//2, noise=0.01, seed=seed)
+               for seed, n in enumerate([120, 120, 90, 1])}
+    table = window_trends(windows).set_index('code')
+    for code, window in windows.items():
+        if len(window) < 2:
+            assert table.loc[code].isna().all()
+            continue
+        trend_magnitude, last_value_trendline, *_ = fast_trend(window)
+        assert np.isclose(table.at[code, 'trend_magnitude'], trend_magnitude[0])
+        assert np.isclose(table.at[code, 'trendline'], last_value_trendline[0])
+
+
+def test_fast_and_exact_estimators_agree_on_the_sign():
+    history = price_history(200)
+    for seed, sign in [(1, 1), (2, -1)]:
+        history['Close'] = 50*kinked(200, 120, (-sign*0.004, sign*0.004), noise=0.005, seed=seed)
+        stock = Stock('AAA', cache=False, provider=FakeProvider({'AAA': {'history': history.copy()}}))
+        fast = detect_trend(stock, verbose=False)
+        exact = detect_trend(stock, verbose=False, exact=True)
+        assert np.sign(fast[0]) == np.sign(exact[0]) == sign
+        assert np.isclose(fast[1], exact[1], rtol=0.02)
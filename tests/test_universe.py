@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+
+from invest.fundamental_analysis import fundamental_indicators_table
+from invest.scoring import compute_score, get_indicators
+from invest.stock import Stock
+from invest.universe import Universe
+
+from fakes import FakeProvider, stock_payloads
+
+QUOT_DATE = pd.Timestamp('2022-06-30')
+COLUMNS = ['Reference Price', 'PE', 'trendline', 'trend_magnitude', '#div_past20y', 'score_DIVTREND']
+
+
+def test_universe_scores_as_the_stocks():
+    provider = FakeProvider({f'T{i}': stock_payloads(i) for i in range(4)})
+    stocks = [Stock(code, quot_date=QUOT_DATE, cache=False, provider=provider) for code in provider.payloads]
+    expected = compute_score(pd.concat([get_indicators(stock) for stock in stocks], ignore_index=True))
+    universe = Universe.from_histories({stock.code: stock.full_hist for stock in stocks},
+                                       fundamentals=fundamental_indicators_table(stocks), quot_date=QUOT_DATE)
+    scored = universe.score()
+    assert scored['code'].tolist() == expected['code'].tolist()
+    for column in COLUMNS + ['OVERALL_SCORE']:
+        assert np.allclose(scored[column].astype(float), expected[column].astype(float), equal_nan=True), column